@@ -0,0 +1,283 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tempfile
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+# JHU's time series start on this day
+first_day = date(2020, 1, 22)
+
+# Every state level report includes these two cruise ships, which the tracker filters out
+cruise_ships = ['Diamond Princess', 'Grand Princess']
+
+
+def make_dates(days: int) -> [date]:
+    """Lists the days covered by a synthetic time series"""
+
+    return [first_day + timedelta(days=day) for day in range(days)]
+
+
+def get_date_column(day: date) -> str:
+    """Names a time series column the way JHU does. Ex. 1/22/20"""
+
+    return f'{day.month}/{day.day}/{day.strftime("%y")}'
+
+
+def make_counts(rng: np.random.Generator, rows: int, days: int, scale: float) -> np.ndarray:
+    """
+    Makes cumulative counts that grow at a different random rate in each row
+    :return: A rows by days integer matrix
+    """
+
+    rates = rng.gamma(1.0, scale, size=(rows, 1))
+
+    return rng.poisson(rates, size=(rows, days)).cumsum(axis=1)
+
+
+def make_global_frame(rng: np.random.Generator, days: int, rows: int, scale: float) -> pd.DataFrame:
+    """
+    Makes a global time series laid out like time_series_covid19_confirmed_global.csv. The U.S is a single row that
+    leads every other, like in JHU's file, and about a third of the other rows are provinces of a country that has
+    several
+    """
+
+    countries = ['US'] + [f'Country {index:03d}' for index in range(1, rows)]
+    provinces = [''] * rows
+
+    for index in range(2, rows, 3):
+        countries[index] = countries[index - 1]
+        provinces[index] = f'Province {index:03d}'
+
+    regions = pd.DataFrame({'Province/State': provinces, 'Country/Region': countries, 'Lat': 0.0, 'Long': 0.0})
+    counts = make_counts(rng, rows, days, scale)
+    counts[0] = counts.max(axis=0) * 2
+    counts = pd.DataFrame(counts, columns=[get_date_column(day) for day in make_dates(days)])
+
+    return pd.concat([regions, counts], axis=1)
+
+
+def make_county_frame(rng: np.random.Generator, days: int, counties: int, states: [str], scale: float,
+                      population=False) -> pd.DataFrame:
+    """
+    Makes a U.S county level time series laid out like time_series_covid19_confirmed_US.csv, or like
+    time_series_covid19_deaths_US.csv if population is True
+    """
+
+    state_names = [states[index % len(states)] for index in range(counties)]
+    regions = pd.DataFrame({'UID': np.arange(84000000, 84000000 + counties), 'iso2': 'US', 'iso3': 'USA', 'code3': 840,
+                            'FIPS': np.arange(1000, 1000 + counties, dtype=float),
+                            'Admin2': [f'County {index:04d}' for index in range(counties)],
+                            'Province_State': state_names, 'Country_Region': 'US', 'Lat': 0.0, 'Long_': 0.0})
+    regions['Combined_Key'] = regions['Admin2'] + ', ' + regions['Province_State'] + ', US'
+
+    if population:
+        regions['Population'] = rng.integers(1000, 2000000, size=counties)
+
+    counts = pd.DataFrame(make_counts(rng, counties, days, scale), columns=[get_date_column(day)
+                                                                             for day in make_dates(days)])
+
+    return pd.concat([regions, counts], axis=1)
+
+
+def make_daily_report(rng: np.random.Generator, states: [str]) -> pd.DataFrame:
+    """Makes a U.S daily report laid out like csse_covid_19_daily_reports_us/MM-DD-YYYY.csv"""
+
+    size = len(states)
+    confirmed = rng.integers(1000, 500000, size=size)
+    deaths = (confirmed * rng.uniform(0.01, 0.05, size=size)).astype(np.int64)
+
+    return pd.DataFrame({'Province_State': states, 'Country_Region': 'US', 'Last_Update': '2020-05-01 02:32:28',
+                         'Lat': 0.0, 'Long_': 0.0, 'Confirmed': confirmed, 'Deaths': deaths,
+                         'Recovered': (confirmed * 0.3).astype(np.int64), 'Active': confirmed - deaths,
+                         'FIPS': np.arange(1, size + 1, dtype=float), 'Incident_Rate': rng.uniform(10, 2000, size=size),
+                         'People_Tested': confirmed * 8, 'People_Hospitalized': confirmed // 10,
+                         'Mortality_Rate': deaths / confirmed * 100, 'UID': np.arange(84000001, 84000001 + size),
+                         'ISO3': 'USA', 'Testing_Rate': rng.uniform(500, 5000, size=size),
+                         'Hospitalization_Rate': rng.uniform(5, 20, size=size)})
+
+
+def make_tracking_frame(rng: np.random.Generator, days: int) -> pd.DataFrame:
+    """Makes U.S daily data laid out like the COVID Tracking Project's us/daily.csv, newest day first"""
+
+    dates = make_dates(days)[::-1]
+
+    return pd.DataFrame({'date': [int(day.strftime('%Y%m%d')) for day in dates], 'states': 56,
+                         'positive': np.sort(rng.integers(0, 10 ** 7, size=days))[::-1],
+                         'inIcuCurrently': rng.integers(0, 20000, size=days),
+                         'onVentilatorCurrently': rng.integers(0, 10000, size=days)})
+
+
+def write_fixtures(directory: str, days=400, counties=3300, global_rows=280, states=58, seed=0) -> str:
+    """
+    Writes a synthetic copy of every data source the tracker reads, in the layout coronatracker.use_fixtures expects
+    :param directory: The directory to write to
+    :param days: How many days the time series cover. Default is 400
+    :param counties: How many county rows the U.S time series have. Default is 3300, about as many as JHU's
+    :param global_rows: How many rows the global time series have. Default is 280, about as many as JHU's
+    :param states: How many states and territories the U.S data covers, including two cruise ships. Default is 58
+    :param seed: Seeds the random numbers, so the same arguments always make the same files. Default is 0
+    :return: The fixture directory
+    """
+
+    rng = np.random.default_rng(seed)
+    state_names = cruise_ships + [f'State {index:02d}' for index in range(states - len(cruise_ships))]
+    report_path = os.path.join(directory, 'csse_covid_19_daily_reports_us')
+    series_path = os.path.join(directory, 'csse_covid_19_time_series')
+    tracking_path = os.path.join(directory, 'covidtracking')
+
+    for path in (report_path, series_path, tracking_path):
+        os.makedirs(path, exist_ok=True)
+
+    report_name = make_dates(days)[-1].strftime('%m-%d-%Y.csv')
+    make_daily_report(rng, state_names).to_csv(os.path.join(report_path, report_name), index=False)
+
+    make_global_frame(rng, days, global_rows, 50.0).to_csv(
+        os.path.join(series_path, 'time_series_covid19_confirmed_global.csv'), index=False)
+    make_global_frame(rng, days, global_rows, 2.0).to_csv(
+        os.path.join(series_path, 'time_series_covid19_deaths_global.csv'), index=False)
+    make_county_frame(rng, days, counties, state_names, 5.0).to_csv(
+        os.path.join(series_path, 'time_series_covid19_confirmed_US.csv'), index=False)
+    make_county_frame(rng, days, counties, state_names, 0.2, population=True).to_csv(
+        os.path.join(series_path, 'time_series_covid19_deaths_US.csv'), index=False)
+
+    make_tracking_frame(rng, days).to_csv(os.path.join(tracking_path, 'daily.csv'), index=False)
+
+    return directory
+
+
+def time_function(function, repeat: int) -> [float]:
+    """
+    Calls a function several times
+    :param function: A function taking no arguments
+    :param repeat: How many times to call it
+    :return: How many seconds each call took
+    """
+
+    timings = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+
+    return timings
+
+
+def get_commit() -> str:
+    """Gets the git commit being benchmarked, or None outside of a git checkout"""
+
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(fixture_path: str, repeat=5, plots=True) -> dict:
+    """
+    Times the tracker's data processing and plotting against a fixture directory. Must be run from an empty working
+    directory, since the tracker saves its data relative to it
+    :param fixture_path: A directory written by write_fixtures
+    :param repeat: How many times to run each benchmark. Default is 5
+    :param plots: Whether to time rendering each plot. Default is True
+    :return: A dictionary mapping each benchmark to the seconds each of its runs took
+    """
+
+    # The tracker works out its data paths when it is imported, so it is only imported once in the working directory
+    import coronatracker as ct
+    import dataproccessor as dp
+    import plotrender
+
+    ct.use_fixtures(fixture_path)
+    ct.make_directories()
+
+    def fetch_all():
+        ct.data_cache.invalidate()
+        ct.fetch_all_data()
+
+    results = {'fetch_all_data': time_function(fetch_all, repeat)}
+
+    global_data = dp.get_global_time_series()
+    us_confirmed = ct.get_time_series()
+    report = ct.get_jhu_data()
+    changed_report = report.assign(cases=report['cases'] + 1)
+    comp_countries = dp.find_metric_leader(global_data, inc_US=True, size=8)
+
+    def deaths_per_capita():
+        ct.data_cache.invalidate('jhu', 'state_series')
+        dp.get_deaths_per_capita()
+
+    benchmarks = {'get_total_daily_change': lambda: dp.get_total_daily_change(us_confirmed),
+                  'get_total_daily_change_country': lambda: dp.get_total_daily_change(global_data, 'Country 001'),
+                  'get_country_cumulative': lambda: dp.get_country_cumulative(global_data, comp_countries),
+                  'make_state_frame': lambda: ct.make_state_frame(report),
+                  'make_state_objects_from_data': lambda: ct.make_state_objects_from_data(report),
+                  'is_new_data': lambda: ct.is_new_data(changed_report, report, 'jhu'),
+                  'get_deaths_per_capita': deaths_per_capita,
+                  'get_plot_inputs': dp.get_plot_inputs}
+
+    for name, function in benchmarks.items():
+        results[name] = time_function(function, repeat)
+
+    if plots:
+        inputs = dp.get_plot_inputs()
+
+        for name in plotrender.renderers.keys():
+            results['plot_' + name] = time_function(
+                lambda: plotrender.render_plot(name, inputs[name], ct.plot_path + name + '.png'), repeat)
+
+    return results
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Times the tracker against synthetic data shaped like JHU\'s')
+    parser.add_argument('--days', type=int, default=400, help='Days covered by the time series. Default is 400')
+    parser.add_argument('--counties', type=int, default=3300, help='County rows in the U.S time series. Default is 3300')
+    parser.add_argument('--global-rows', type=int, default=280, help='Rows in the global time series. Default is 280')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs of each benchmark. Default is 5')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the synthetic data. Default is 0')
+    parser.add_argument('--no-plots', action='store_true', help='Skip timing the plots')
+    parser.add_argument('--output', default=os.path.join(os.getcwd(), 'benchmarks.jsonl'),
+                        help='JSON lines file each run\'s results are appended to. Default is benchmarks.jsonl')
+    options = parser.parse_args(args)
+
+    with tempfile.TemporaryDirectory(prefix='coronatracker-benchmark-') as work_path:
+        fixture_path = write_fixtures(os.path.join(work_path, 'fixtures'), days=options.days,
+                                      counties=options.counties, global_rows=options.global_rows, seed=options.seed)
+        run_path = os.path.join(work_path, 'run')
+        os.mkdir(run_path)
+        previous_path = os.getcwd()
+        os.chdir(run_path)
+
+        try:
+            results = run_benchmarks(fixture_path, repeat=options.repeat, plots=options.no_plots is not True)
+        finally:
+            os.chdir(previous_path)
+
+    summary = {name: {'best': min(timings), 'median': float(np.median(timings)), 'runs': len(timings)}
+               for name, timings in results.items()}
+    record = {'run_at': datetime.now().isoformat(), 'commit': get_commit(), 'python': platform.python_version(),
+              'numpy': np.__version__, 'pandas': pd.__version__, 'days': options.days, 'counties': options.counties,
+              'global_rows': options.global_rows, 'repeat': options.repeat, 'results': summary}
+
+    with open(options.output, 'a') as file:
+        file.write(json.dumps(record) + '\n')
+
+    width = max(len(name) for name in summary)
+    print(f'{"benchmark":<{width}}  {"best (ms)":>10}  {"median (ms)":>11}')
+
+    for name, timing in summary.items():
+        print(f'{name:<{width}}  {timing["best"] * 1000:>10.2f}  {timing["median"] * 1000:>11.2f}')
+
+    print(f'Appended results to {options.output}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
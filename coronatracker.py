@@ -1,120 +1,246 @@
 import os
 import time
+import argparse
 import logging
 import json
+import hashlib
 import random
-import urllib
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from datetime import datetime, timedelta
+from pathlib import Path
 
 import numpy as np
 import pandas as pd
-import requests
-from bs4 import BeautifulSoup
-import tweepy as tw
 import dataproccessor as dp
+import fetcher
+import mediauploader
+import metrics
+import seriesstore
+import snapshots
+from datacache import DataCache
+from scheduler import Scheduler
 from geohelper import *
 
 jhu_path = os.getcwd() + '/jhu_data/'
 cdc_path = os.getcwd() + '/cdc_data/'
 tracking_proj_path = os.getcwd() + '/ctp_data/'
 plot_path = os.getcwd() + '/plots/'
+plot_manifest_path = os.getcwd() + '/plot_manifest.json'
+media_cache_path = os.getcwd() + '/media_cache.json'
+tweet_summary_path = os.getcwd() + '/tweet_summary.json'
 twitter_file = os.getcwd() + '/twitter_creds.json'
+snapshot_index_path = os.getcwd() + '/snapshot_index.sqlite'
+
+# Where the snapshots of each source are saved, how many go in one history chunk and how many days of them to keep
+snapshot_paths = {'jhu': jhu_path, 'cdc': cdc_path}
+snapshot_chunk_size = 48
+snapshot_retention_days = 180
+
+# Where the data sources are downloaded from. The CORONATRACKER_JHU_URL and CORONATRACKER_CTP_URL environment variables
+# override them, and set_source_urls and use_fixtures change them while running
+jhu_data_url = os.environ.get('CORONATRACKER_JHU_URL',
+                              'https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/')
+jhu_data_url = jhu_data_url.rstrip('/') + '/'
+jhu_report_url = jhu_data_url + 'csse_covid_19_daily_reports_us/'
+jhu_time_series_url = jhu_data_url + 'csse_covid_19_time_series/'
+tracking_project_url = os.environ.get('CORONATRACKER_CTP_URL', 'https://covidtracking.com/api/v1/us/daily.csv')
+
+# JHU publishes one U.S. daily report per day, named after its date. Reports are looked for this many days back
+jhu_report_name_format = '%m-%d-%Y.csv'
+jhu_report_days_back = 7
+
+# The name of the newest daily report found so far, so later cycles only have to look for reports published after it
+jhu_report_name = None
+
+# Where each JHU time series is stored inside jhu_path, by the name it is cached under
+series_files = {'us_confirmed': 'jhu_time.json', 'global_confirmed': 'jhu_global_time.json',
+                'us_deaths': 'jhu_death_time_us.json', 'global_deaths': 'jhu_death_time_global.json',
+                'us_county_confirmed': 'jhu_confirmed_time_us.json'}
 
 now = datetime.now()
-now_file_ext = now.strftime('%m_%d_%H_%M_%S.csv')
+now_file_ext = now.strftime(snapshots.snapshot_time_format + '.csv')
 
 log_path = os.getcwd() + '/logs/coronatracker_log.log'
 log_format = '%(levelname)s | %(asctime)s | %(message)s'
+metrics_path = os.getcwd() + '/logs/metrics.jsonl'
+prometheus_path = os.getcwd() + '/logs/coronatracker.prom'
 
 should_tweet = False
 should_save_jhu = False
 
+# When True, no Twitter client is built and the tweets that would have been posted are written to tweet_summary_path
+dry_run = False
 
-if os.path.exists(twitter_file):
-    with open(twitter_file, 'r') as file:
-        twitter_creds = json.load(file)
+# Seconds between the start of each cycle, the most seconds of random delay to add, and the first and longest wait
+# after a failed cycle
+cycle_interval = 60 * 30
+cycle_jitter = 60
+cycle_failure_delay = 60
+cycle_max_failure_delay = 60 * 60 * 2
 
-    consumer_key = twitter_creds['consumer_key']
-    consumer_secret = twitter_creds['consumer_secret']
-    access_token = twitter_creds['access_token']
-    access_secret = twitter_creds['access_secret']
-    auth = tw.OAuthHandler(consumer_key, consumer_secret)
+# Fingerprint of everything fetched during the last cycle that made plots, so an unchanged cycle can be skipped
+last_upstream_fingerprint = None
 
-    auth.set_access_token(access_token, access_secret)
-else:
-    consumer_key = input('Input your Twitter consumer key: ')
-    consumer_secret = input('Input your Twitter consumer secret: ')
-    auth = tw.OAuthHandler(consumer_key, consumer_secret)
-    redirect_url = auth.get_authorization_url()
+# Shared by every consumer during a cycle and cleared at the start of the next one
+data_cache = DataCache()
 
-    print('Please click this link to authorize CoronaTracker: {}'.format(redirect_url))
-    verifier = input('Enter the verification code you received from Twitter: ')
-    auth.get_access_token(verifier)
+# Seconds to wait on each source during the fetch stage, by the name it is cached under, and how often to try each one
+fetch_timeouts = {'daily_report': 60, 'us_confirmed': 120, 'global_confirmed': 120, 'us_deaths': 120,
+                  'global_deaths': 120, 'us_county_confirmed': 120, 'us_daily': 60}
+fetch_attempts = 3
 
-    data = {'consumer_key': consumer_key, 'consumer_secret': consumer_secret, 'access_token': auth.access_token,
-            'access_secret': auth.access_token_secret}
+# How many plots to upload to Twitter at once, and how often to try each one
+upload_workers = 4
+upload_attempts = 3
 
-    with open(twitter_file, 'w') as file:
-        json.dump(data, file)
+state_count_columns = ['cases', 'deaths', 'recoveries']
+state_rate_columns = ['test_rate', 'hosp_rate', 'incidence', 'mort_rate']
 
-api = tw.API(auth, wait_on_rate_limit=True)
 
-if os.path.exists(os.getcwd() + '/logs/') is not True:
-    try:
-        os.mkdir(os.getcwd() + '/logs/')
-    except OSError as error:
-        print(f'Could not create log directory because {error.strerror}!')
-
-logging.basicConfig(filename=log_path, format=log_format, filemode='w', level=logging.INFO)
+# The Twitter client. Built by get_api the first time it is needed
+api = None
 
 logger = logging.getLogger()
 
 
+def setup_logging():
+    """Creates the log directory if needed and sends the tracker's logs to log_path"""
+
+    if os.path.exists(os.path.dirname(log_path)) is not True:
+        try:
+            os.makedirs(os.path.dirname(log_path))
+        except OSError as error:
+            print(f'Could not create log directory because {error.strerror}!')
+
+    logging.basicConfig(filename=log_path, format=log_format, filemode='a', level=logging.INFO)
+
+
+def get_api():
+    """
+    Gets the Twitter client, building it the first time. Credentials are read from twitter_file, or asked for in the
+    terminal and then saved there if the file does not exist
+    :return: An authenticated tweepy API object
+    """
+
+    global api
+
+    if api is not None:
+        return api
+
+    # tweepy is only needed to post, so it is not imported until then
+    import tweepy as tw
+
+    if os.path.exists(twitter_file):
+        with open(twitter_file, 'r') as file:
+            twitter_creds = json.load(file)
+
+        auth = tw.OAuthHandler(twitter_creds['consumer_key'], twitter_creds['consumer_secret'])
+
+        auth.set_access_token(twitter_creds['access_token'], twitter_creds['access_secret'])
+    else:
+        consumer_key = input('Input your Twitter consumer key: ')
+        consumer_secret = input('Input your Twitter consumer secret: ')
+        auth = tw.OAuthHandler(consumer_key, consumer_secret)
+        redirect_url = auth.get_authorization_url()
+
+        print('Please click this link to authorize CoronaTracker: {}'.format(redirect_url))
+        verifier = input('Enter the verification code you received from Twitter: ')
+        auth.get_access_token(verifier)
+
+        data = {'consumer_key': consumer_key, 'consumer_secret': consumer_secret, 'access_token': auth.access_token,
+                'access_secret': auth.access_token_secret}
+
+        with open(twitter_file, 'w') as file:
+            json.dump(data, file)
+
+    api = tw.API(auth, wait_on_rate_limit=True)
+
+    return api
+
+
+@metrics.timed
+def fetch_all_data(workers=7) -> dict:
+    """
+    Fetches every data source used in a cycle at the same time, so the cycle only waits as long as the slowest one.
+    Each source gets its own timeout and is retried on network errors. The parsed frames are placed in the data cache,
+    where make_plots and make_tweet pick them up
+    :param workers: How many sources to fetch at once. Default is 7, which is all of them
+    :return: A dictionary mapping (source, series) to its DataFrame. Sources that could not be fetched are left out and
+    will be fetched again when first needed
+    """
+
+    sources = {('jhu', 'daily_report'): get_fetch_loader(download_jhu_data, 'daily_report'),
+               # Made from the global sheet, whose download build_time_series already retries
+               ('jhu', 'us_confirmed'): partial(build_time_series, timeout=fetch_timeouts['us_confirmed']),
+               ('jhu', 'global_confirmed'): get_fetch_loader(dp.download_global_time_series, 'global_confirmed'),
+               ('jhu', 'us_deaths'): get_fetch_loader(partial(dp.download_death_time_series, 'US'), 'us_deaths'),
+               ('jhu', 'global_deaths'): get_fetch_loader(dp.download_death_time_series, 'global_deaths'),
+               ('jhu', 'us_county_confirmed'): get_fetch_loader(dp.download_us_confirmed_time_series,
+                                                                'us_county_confirmed'),
+               ('ctp', 'us_daily'): get_fetch_loader(dp.download_tracking_project_data, 'us_daily')}
+    frames = {}
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+
+        for (source, series), loader in sources.items():
+            futures[executor.submit(data_cache.get, source, series, loader)] = (source, series)
+
+        for future in as_completed(futures):
+            source, series = futures[future]
+
+            try:
+                frames[(source, series)] = future.result()
+            except Exception as error:
+                logger.error(f'Could not fetch {source}/{series} because {error}! Will try again when it is needed')
+
+    logger.info(f'Fetched {len(frames)} of {len(sources)} sources in {time.perf_counter() - start:.2f} seconds')
+
+    return frames
+
+
+def get_fetch_loader(download, series: str, timeout=None):
+    """
+    Wraps a download in the timeout and retry policy of its source. Used by the fetch stage and by every getter, so a
+    source that failed in the fetch stage is retried with the same backoff when it is first needed
+    :param download: The function downloading the source. Must take a timeout keyword argument
+    :param series: The name the source is cached under. Ex. daily_report
+    :param timeout: How long to wait on the server in seconds. Default is None, which uses fetch_timeouts
+    :return: A function taking no arguments that downloads the source
+    """
+
+    timeout = fetch_timeouts[series] if timeout is None else timeout
+
+    return partial(fetcher.retry, partial(download, timeout=timeout), attempts=fetch_attempts)
+
+
 def get_jhu_data() -> pd.DataFrame:
     """
-    Reads the name of update files on JHU's Github, selects the most recent one, and then downloads that file as a
-    temp file to create a DataFrame. This DataFrame undergoes some reorganization to select for U.S data
+    Returns the most recent JHU daily report for the U.S, downloading it only once per tracker cycle
+    :return A pandas dataframe with columns state, city, cases, deaths, recoveries
+    """
+
+    return data_cache.get('jhu', 'daily_report', get_fetch_loader(download_jhu_data, 'daily_report'))
+
+
+@metrics.timed
+def download_jhu_data(timeout=60) -> pd.DataFrame:
+    """
+    Finds JHU's most recent daily report, and then parses that file straight from the download to create a DataFrame.
+    This DataFrame undergoes some reorganization to select for U.S data
+    :param timeout: How long to wait on the server in seconds. Default is 60
     :return A pandas dataframe with columns state, city, cases, deaths, recoveries
     """
     logger.info('Attempting to connect to JHU sheet')
 
-    jhu_github_url = 'https://github.com/CSSEGISandData/COVID-19/tree/master/csse_covid_19_data/csse_covid_19_daily_reports_us'
-    github_req = requests.get(jhu_github_url)
-    git_soup = BeautifulSoup(github_req.content, features='html.parser')
-
-    candidate_link = ''
-    curr_low_diff = None
-
-    for link in git_soup.find_all('a'):
-        if link.get('title') is not None and str(link.get('title')).endswith('.csv') and 'commit' not in \
-                str(link.get('href')):
-            file_name = link.get('title')
-            file_date = file_name.replace('.csv', '').split('-')
-            # file_time = file_date[2].split('_')[1]
-            file_datetime = datetime(2020, int(file_date[0]), int(file_date[1]))
-
-            if curr_low_diff is None:
-                candidate_link = link.get('href')
-                curr_low_diff = now - file_datetime
-            else:
-                diff = now - file_datetime
-
-                if diff < curr_low_diff:
-                    curr_low_diff = diff
-                    candidate_link = link.get('href')
-
-    file_link = str('https://raw.githubusercontent.com' + candidate_link).replace('blob/', '')
-    newest_csv_req = urllib.request.Request(file_link)
-    csv_file = urllib.request.urlopen(newest_csv_req)
-    csv_data = csv_file.read()
-
-    with open(jhu_path + 'jhu_temp.csv', 'wb') as file:
-        file.write(csv_data)
-
-    temp_frame = pd.read_csv(jhu_path + 'jhu_temp.csv')
-    us_frame = temp_frame[['Province_State', 'Country_Region', 'Confirmed', 'Deaths', 'Recovered',
-                           'Testing_Rate', 'Hospitalization_Rate', 'Incident_Rate', 'Mortality_Rate']]
-    us_frame.rename(columns={'Province_State': 'case_loc'}, inplace=True)
+    file_link = resolve_jhu_report(timeout=timeout)
+    report_columns = ['Province_State', 'Country_Region', 'Confirmed', 'Deaths', 'Recovered', 'Testing_Rate',
+                      'Hospitalization_Rate', 'Incident_Rate', 'Mortality_Rate']
+    us_frame = fetcher.fetch_frame(file_link, usecols=report_columns, timeout=timeout,
+                                   dtype={'Province_State': str, 'Country_Region': str})
+    us_frame = us_frame[report_columns].rename(columns={'Province_State': 'case_loc'})
     is_US = us_frame['Country_Region'] == 'US'
     us_frame = us_frame[is_US]
     us_frame = us_frame[~us_frame['case_loc'].str.contains('Princess')]
@@ -125,131 +251,105 @@ def get_jhu_data() -> pd.DataFrame:
                   'Testing_Rate': 'test_rate', 'Hospitalization_Rate': 'hosp_rate', 'Incident_Rate': 'incidence',
                   'Mortality_Rate': 'mort_rate'}
 
-    us_frame.rename(columns=rename_map, inplace=True)
-
-    os.remove(jhu_path + 'jhu_temp.csv')
+    us_frame = us_frame.rename(columns=rename_map)
 
     if us_frame.empty is not True:
-        logger.info('Successfully downloaded JHU data! If new will save as jhu_{}'.format(now_file_ext))
+        logger.info('Successfully downloaded JHU data! If new it is added to the snapshot history once tweeted')
 
-    newest_data = get_most_recent_data('jhu')
-
-    if is_new_data(us_frame, newest_data, 'jhu'):
+    if is_new_snapshot(us_frame, 'jhu'):
         global should_tweet
         global should_save_jhu
+        # Saved by run_cycle once the tweet is out, so the first snapshot is not written twice
         should_tweet = True
         should_save_jhu = True
-
-        if get_most_recent_data('jhu').empty:
-            us_frame.to_csv(jhu_path + 'jhu_' + now_file_ext)
     else:
         logger.warning('Downloaded JHU data is not new! Will not save')
 
     return us_frame
 
 
-def make_state_objects_from_data(data: pd.DataFrame, from_csv=False) -> [State]:
+@metrics.timed
+def resolve_jhu_report(timeout=60) -> str:
     """
-    Creates either a city or state object from a DataFrame
-    :param from_csv: Should be true if the data was read in from a CSV to ensure correct column selection. Default false
-    :param data: The DataFrame to assemble the object from
-    :return: Either a city or state object, depending on what was specified
+    Finds the most recent JHU daily report by predicting its name from the date and checking that it exists, newest
+    first. Dates up to the last report found are not checked again, so once today's report is found no more requests
+    are made for it
+    :param timeout: How long to wait on the server for each check in seconds. Default is 60
+    :return: The URL of the raw CSV of the most recent daily report
     """
 
-    state_objs = []
-    state_names = []
-    state_data = make_state_frame(data)
+    global jhu_report_name
 
-    for name in state_data['state']:
-        if name not in state_names:
-            state_names.append(name)
+    known_date = datetime.strptime(jhu_report_name, jhu_report_name_format).date() if jhu_report_name else None
 
-    for name in state_names:
-        for row_tuple in state_data.iterrows():
-            # Data read in from a CSV has an index column first, so we just have to shift over 1
-            if from_csv:
-                row_data = [entry for entry in row_tuple[1]]
-                if row_data[1] == name:
-                    case_dat = row_data[2:5]
-                    state_ob = State(state_name=name, state_cases=case_dat[0], state_deaths=case_dat[1],
-                                     state_recoveries=case_dat[2])
+    for days_back in range(jhu_report_days_back + 1):
+        report_date = (now - timedelta(days=days_back)).date()
 
-                    state_objs.append(state_ob)
-            else:
-                row_data = [entry for entry in row_tuple[1]]
-                if row_data[0] == name:
-                    case_dat = row_data[1:4]
-                    state_ob = State(state_name=name, state_cases=case_dat[0], state_deaths=case_dat[1],
-                                     state_recoveries=case_dat[2])
-
-                    state_objs.append(state_ob)
+        if known_date is not None and report_date <= known_date:
+            break
 
-    return state_objs
+        report_name = report_date.strftime(jhu_report_name_format)
 
+        if fetcher.probe_url(jhu_report_url + report_name, timeout=timeout):
+            logger.info(f'Found JHU daily report {report_name}')
+            jhu_report_name = report_name
 
-def get_time_series() -> pd.DataFrame:
-    """
-    Reads data from the JHU time series sheet from Github. Presently only gathers info on confirmed cases.
-    :return: A dataframe of the time series data for the U.S with columns for the location at which is was discovered
-    and a column for each day since tracking began.
-    """
-
-    if os.path.exists(jhu_path + 'jhu_time.csv'):
-        data = pd.read_csv(jhu_path + 'jhu_time.csv')
-        newest_date = datetime.strptime(data.columns.to_list()[-1], '%m/%d/%y')
+            break
 
-        if newest_date == datetime.now().date():
-            logger.info('Currently downloaded U.S time series is up to date. Reading file...')
+    if jhu_report_name is None:
+        raise FileNotFoundError(f'Could not find a JHU daily report from the {jhu_report_days_back + 1} days up to '
+                                f'{now.strftime("%m-%d-%Y")}')
 
-            return data
-        else:
-            logger.info('Currently downloaded U.S time series may be out of date! Downloading new one...')
+    return jhu_report_url + jhu_report_name
 
-            file_link = 'https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_confirmed_global.csv'
-            newest_csv_req = urllib.request.Request(file_link)
-            csv_file = urllib.request.urlopen(newest_csv_req)
-            csv_data = csv_file.read()
 
-            with open(jhu_path + 'jhu_time_temp.csv', 'wb') as file:
-                file.write(csv_data)
+@metrics.timed
+def make_state_objects_from_data(data: pd.DataFrame, from_csv=False) -> StateTable:
+    """
+    Creates the state level data for every state in a DataFrame
+    :param from_csv: Kept for compatibility. Columns are selected by name, so the index column of data read in from a
+    CSV no longer needs special handling
+    :param data: The DataFrame to assemble the object from
+    :return: A StateTable, which yields a State object for each state when iterated over
+    """
 
-            ts_conf_frame = pd.read_csv(jhu_path + 'jhu_time_temp.csv')
-            is_US = ts_conf_frame['Country/Region'] == 'US'
-            ts_conf_frame = ts_conf_frame[is_US]
+    return StateTable.from_frame(make_state_frame(data))
 
-            ts_conf_frame.drop(['Country/Region', 'Lat', 'Long'], axis=1, inplace=True)
-            ts_conf_frame.rename(columns={'Province/State': 'state'}, inplace=True)
 
-            logger.info('Removing JHU temp file...')
-            os.remove(jhu_path + 'jhu_time_temp.csv')
-            ts_conf_frame.to_csv(jhu_path + 'jhu_time.csv')
-            logger.info('Saved time series data successfully!')
+def get_time_series() -> pd.DataFrame:
+    """
+    Returns the JHU confirmed cases time series for the U.S, reading it only once per tracker cycle
+    :return: A dataframe of the time series data for the U.S with columns for the location at which is was discovered
+    and a column for each day since tracking began.
+    """
 
-            return ts_conf_frame
-    else:
-        logger.info('Attempting to download JHU time series sheet')
+    return data_cache.get('jhu', 'us_confirmed', partial(build_time_series, timeout=fetch_timeouts['us_confirmed']))
 
-        file_link = 'https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_confirmed_global.csv'
-        newest_csv_req = urllib.request.Request(file_link)
-        csv_file = urllib.request.urlopen(newest_csv_req)
-        csv_data = csv_file.read()
 
-        with open(jhu_path + 'jhu_time_temp.csv', 'wb') as file:
-            file.write(csv_data)
+@metrics.timed
+def build_time_series(timeout=60) -> pd.DataFrame:
+    """
+    Takes the U.S rows out of JHU's global confirmed cases time series. The global sheet is shared through the data
+    cache, so it is only downloaded and parsed once per cycle. The U.S rows are kept in their own store, which keeps
+    the U.S totals up to date as new days arrive
+    :param timeout: How long to wait on the server in seconds if the global sheet has not been fetched yet this cycle.
+    Default is 60
+    :return: A dataframe of the time series data for the U.S with columns for the location at which is was discovered
+    and a column for each day since tracking began.
+    """
 
-        ts_conf_frame = pd.read_csv(jhu_path + 'jhu_time_temp.csv')
-        is_US = ts_conf_frame['Country/Region'] == 'US'
-        ts_conf_frame = ts_conf_frame[is_US]
+    file_path = jhu_path + series_files['us_confirmed']
+    global_frame = data_cache.get('jhu', 'global_confirmed',
+                                  get_fetch_loader(dp.download_global_time_series, 'global_confirmed', timeout))
 
-        ts_conf_frame.drop(['Country/Region', 'Lat', 'Long'], axis=1, inplace=True)
-        ts_conf_frame.rename(columns={'Province/State': 'state'}, inplace=True)
+    ts_conf_frame = global_frame[global_frame['Country_Region'] == 'US'].drop(columns=['Country_Region'])
+    ts_conf_frame = ts_conf_frame.rename(columns={'Province_State': 'state'}).reset_index(drop=True)
 
-        logger.info('Removing JHU temp file...')
-        os.remove(jhu_path + 'jhu_time_temp.csv')
-        ts_conf_frame.to_csv(jhu_path + 'jhu_time.csv')
-        logger.info('Saved time series data successfully!')
+    # Only new or revised days are written, so this is nearly free when the global sheet has not changed
+    seriesstore.save_series(ts_conf_frame, file_path)
+    logger.info('Time series data is ready!')
 
-        return ts_conf_frame
+    return seriesstore.load_series(file_path)
 
 
 def get_daily_change(time_data: pd.DataFrame, country='default', change_type='cases') -> int:
@@ -300,11 +400,11 @@ def get_data_for(name: str, var: str, data: pd.DataFrame, region='state') -> pd.
     """
 
     if region == 'state':
-        target_frame = data[data.state.str.contains(name)]
+        target_frame = data[data.state == name]
 
         return target_frame[var]
     elif region == 'city':
-        target_frame = data[data.city.str.contains(name)]
+        target_frame = data[data.city == name]
 
         return target_frame[var]
     else:
@@ -312,31 +412,20 @@ def get_data_for(name: str, var: str, data: pd.DataFrame, region='state') -> pd.
         raise ValueError('Unknown region {}! Region must be either state or city!'.format(region))
 
 
+@metrics.timed
 def make_state_frame(data: pd.DataFrame) -> pd.DataFrame:
     """
     Creates a dataframe containing data at the state level
     :param data: The dataframe to ready values from
-    :return: A data frame containing the same data from the JHU frame but organized at the state level
+    :return: A data frame containing the same data from the JHU frame but organized at the state level. States keep the
+    order in which they first appear in data. Counts are summed and any rate columns present are averaged
     """
-    state_deaths = []
-    state_cases = []
-    state_recoveries = []
-    states = []
-
-    for state in data['state']:
-        deaths = get_data_for(state, 'deaths', data)
-        cases = get_data_for(state, 'cases', data)
-        recoveries = get_data_for(state, 'recoveries', data)
 
-        if state not in states:
-            states.append(state)
-            state_deaths.append(deaths.sum())
-            state_cases.append(cases.sum())
-            state_recoveries.append(recoveries.sum())
+    aggregations = {column: 'sum' for column in state_count_columns}
+    aggregations.update({column: 'mean' for column in state_rate_columns if column in data.columns})
 
-    ret_data = {'state': states, 'cases': state_cases, 'deaths': state_deaths, 'recoveries': state_recoveries}
-
-    return pd.DataFrame(ret_data)
+    # Grouping on the exact state name keeps states like Virginia and West Virginia apart
+    return data.groupby('state', sort=False).agg(aggregations).reset_index()
 
 
 def is_new_data(recent_data: pd.DataFrame, prev_data: pd.DataFrame, source: str):
@@ -347,70 +436,103 @@ def is_new_data(recent_data: pd.DataFrame, prev_data: pd.DataFrame, source: str)
     :param prev_data: The dataframe to compare to
     :return: True or false depending on whether or not the recent_data dataframe is newer than the previous one
     """
-    columns = []
-    is_new = False
-    if source == 'jhu':
-        columns = ['state', 'cases', 'deaths', 'recoveries']
-    if source == 'cdc':
-        columns = ['measure', 'counts']
 
     if prev_data.empty:
         return True
-    else:
-        # Since the CDC data is formatted consistently, particularly smart data checking is not needed
-        if source == 'cdc':
-            for column in columns:
-                for entry1, entry2 in zip(recent_data[column], prev_data[column]):
-                    if entry1 != entry2:
-                        is_new = True
-                        break
-        # JHU data requires a bit more thinking
-        if source == 'jhu':
-            states_new = []
-            states_old = []
-
-            # iterrows() returns a tuple of (index, data)
-            for tuple_new, tuple_old in zip(recent_data.iterrows(), prev_data.iterrows()):
-                # Iterates through each value in the row
-                row_data_new = [entry for entry in tuple_new[1]]
-                state_new = row_data_new[0]
-                case_data_new = row_data_new[1:4]
-
-                states_new.append(state_new)
-
-                # Data read from a CSV contains an index column, so data values are shifted one to the right
-                row_data_old = [entry for entry in tuple_old[1]]
-                state_old = row_data_old[1]
-                case_data_old = row_data_old[2:5]
-
-                states_old.append(state_old)
-
-            if states_new.sort() != states_old.sort():
-                is_new = True
-            if case_data_old != case_data_new:
-                is_new = True
-
-        return is_new
+
+    # Comparing content hashes covers every row and is not thrown off by row order or the index column of a CSV
+    return snapshots.has_changed(recent_data, prev_data, source)
+
+
+@metrics.timed
+def is_new_snapshot(data: pd.DataFrame, data_source: str) -> bool:
+    """
+    Checks to see if recently fetched data differs from the latest saved snapshot, using the hash kept in the snapshot
+    index instead of reading the snapshot back
+    :param data: The most recently fetched data
+    :param data_source: The source of the data. Valid sources are jhu or cdc
+    :return: True if there is no saved snapshot yet or the data has changed since it was saved
+    """
+
+    latest = get_latest_snapshot(data_source)
+
+    if latest is None:
+        return True
+
+    prev_hash = latest.content_hash
+
+    if prev_hash is None:
+        # Snapshots saved before the index existed are hashed the first time they are compared against
+        prev_hash = snapshots.get_snapshot_hash(snapshots.load_snapshot(latest.path, data_source), data_source)
+        snapshots.record_snapshot(snapshot_index_path, data_source, latest.taken_at, latest.path, prev_hash)
+
+    return snapshots.get_snapshot_hash(data, data_source) != prev_hash
+
+
+@metrics.timed
+def save_snapshot(data: pd.DataFrame, data_source: str) -> str:
+    """
+    Saves a snapshot of the data from a source to its snapshot history and records it in the snapshot index
+    :param data: The data to save
+    :param data_source: The source of the data. Valid sources are jhu or cdc
+    :return: The indexed path of the snapshot
+    """
+
+    return snapshots.save_snapshot(data, data_source, snapshot_paths[data_source], snapshot_index_path, now,
+                                   chunk_size=snapshot_chunk_size)
+
+
+@metrics.timed
+def compact_snapshot_history(data_source: str):
+    """
+    Moves snapshots saved as separate CSVs into the snapshot history, then deletes history older than the retention
+    period
+    :param data_source: The source of the data. Valid sources are jhu or cdc
+    """
+
+    # Makes sure snapshots saved before the index existed are in it
+    get_latest_snapshot(data_source)
+
+    snapshots.compact_snapshots(snapshot_index_path, data_source, snapshot_paths[data_source],
+                                chunk_size=snapshot_chunk_size)
+    snapshots.prune_snapshots(snapshot_index_path, data_source, now - timedelta(days=snapshot_retention_days))
+
+
+def get_latest_snapshot(data_source: str):
+    """
+    Looks up the most recently saved snapshot of a source in the snapshot index. The data directory is only scanned if
+    the index knows of no snapshots for the source, which is the case the first time the index is used
+    :param data_source: The source of the data. Valid sources are jhu or cdc
+    :return: A snapshots.SnapshotEntry, or None if there are no snapshots
+    """
+
+    latest = snapshots.get_latest_snapshot(snapshot_index_path, data_source)
+
+    if latest is None and snapshots.index_directory(snapshot_index_path, data_source,
+                                                    snapshot_paths[data_source]) > 0:
+        latest = snapshots.get_latest_snapshot(snapshot_index_path, data_source)
+
+    while latest is not None and snapshots.snapshot_exists(latest.path) is not True:
+        logger.warning(f'Snapshot {latest.path} is in the snapshot index but no longer exists! Removing it')
+        snapshots.forget_snapshot(snapshot_index_path, latest.path)
+        latest = snapshots.get_latest_snapshot(snapshot_index_path, data_source)
+
+    return latest
 
 
 def load_all_data(data_type: str) -> []:
     """
-    Loads all of the data from a directory of a given type. (Ex. All the data from the CDC directory
-    :param data_type: What type of data to download. Valid types are jhu or cdc
-    :return: A list of all files in the directory
+    Lists all of the snapshots saved for a given type of data. (Ex. All the data from the CDC directory)
+    :param data_type: What type of data to list. Valid types are jhu or cdc
+    :return: The indexed paths of the snapshots, oldest first
     """
-    data = []
 
-    if data_type.lower() == 'cdc':
-        for file in os.listdir(cdc_path):
-            if file != '.DS_Store':
-                data.append(file)
-    if data_type.lower() == 'jhu':
-        for file in os.listdir(jhu_path):
-            if file != '.DS_Store' and 'time' not in file:
-                data.append(file)
+    data_source = data_type.lower()
 
-    return data
+    # Makes sure snapshots saved before the index existed are in it
+    get_latest_snapshot(data_source)
+
+    return [entry.path for entry in snapshots.list_snapshots(snapshot_index_path, data_source)]
 
 
 def get_most_recent_data(data_source: str) -> pd.DataFrame:
@@ -420,71 +542,59 @@ def get_most_recent_data(data_source: str) -> pd.DataFrame:
     :return: A dataframe of the most recently downloaded data of a certain type
     """
 
-    candidate_file = ''
-    # We look at the difference between right now and when the file was created, and select the lowest difference
-    curr_lowest_diff = None
-
-    if load_all_data(data_source) != []:
-        for file in load_all_data(data_source):
-            file_time = file[5:18]
-            time_components = file_time.split('_')
-            file_datetime = datetime(2020, int(time_components[0]), int(time_components[1]),
-                                     hour=int(time_components[2]),
-                                     minute=int(time_components[3]), second=int(time_components[4]))
-            time_diff = now - file_datetime
-
-            if curr_lowest_diff is not None:
-                if time_diff < curr_lowest_diff:
-                    curr_lowest_diff = time_diff
-                    candidate_file = file
-            else:
-                curr_lowest_diff = time_diff
-                candidate_file = file
-
-        if data_source == 'jhu':
-            candidate_file = jhu_path + candidate_file
-        if data_source == 'cdc':
-            candidate_file = cdc_path + candidate_file
-
-        return pd.read_csv(candidate_file)
-    else:
+    latest = get_latest_snapshot(data_source)
+
+    if latest is None:
         return pd.DataFrame()
 
+    return snapshots.load_snapshot(latest.path, data_source)
+
 
 def make_tweet():
     """
-    Creates a tweet to post to Twitter
+    Creates a tweet thread and posts it to Twitter. In a dry run it is written to tweet_summary_path instead
+    """
+
+    thread = compose_tweet()
+
+    for tweet in thread:
+        print(tweet['status'])
+
+    if dry_run:
+        write_tweet_summary(thread)
+    else:
+        post_tweet(thread, get_api())
+
+
+@metrics.timed
+def compose_tweet() -> [dict]:
+    """
+    Writes the text of a tweet thread about the latest data
+    :return: A list of tweets, in the order they are posted. Each is a dictionary with its status text and the paths
+    of the plots attached to it
     """
 
     hashtags = ['#Coronavirus', '#USCoronavirus', '#COVID19', '#USCOVID19', '#CoronaOutbreak', '#CoronaAlert',
                 '#COVID_19', '#CoronaPandemic', '#CoronavirusOutbreak']
     chosen_tags = random.sample(hashtags, k=3)
-    lead_media_ids = []
-    follow_media_ids = []
     lead_files = ['vent_icu_plot.png', 'capita_rate.png', 'death_comp_plot.png', 'change_plot.png']
     follow_files = ['comp_plot.png', 'state_sum.png', 'rate_plot.png', 'capita_plot.png']
 
-    ts_data = get_time_series()
     global_ts = dp.get_global_time_series()
-    change = get_daily_change(ts_data)
-    prev_column = ts_data.columns.to_list()[-2]
-    percent_change = round((change / ts_data[prev_column].sum()) * 100, 2)
+    us_totals, us_changes = dp.get_us_totals('cases')
+    change = int(us_changes[-1])
+    percent_change = round((change / us_totals[-2]) * 100, 2)
 
-    us_death_ts = dp.get_death_time_series('US')
-    death_prev_col = us_death_ts.columns.to_list()[-1]
-    death_change = get_daily_change(us_death_ts)
-    percent_death_change = round((death_change / us_death_ts[death_prev_col].sum()) * 100, 2)
+    us_death_totals, us_death_changes = dp.get_us_totals('deaths')
+    death_change = int(us_death_changes[-1])
+    percent_death_change = round((death_change / us_death_totals[-1]) * 100, 2)
 
     prev_column_comp = global_ts.columns.to_list()[-1]
-    us_global_share = round((dp.get_country_cumulative(ts_data)[-1] / global_ts[prev_column_comp].sum()) * 100, 2)
-    target = 1300000
-
+    us_global_share = round((us_totals[-1] / global_ts[prev_column_comp].sum()) * 100, 2)
+    # The first milestone of 100,000 cases past 1,300,000 that the U.S has not passed yet
+    target = dp.get_next_target(us_totals[-1], 1300000, 100000)
     time_to_target = dp.get_time_to_target(target)
 
-    while time_to_target == 0:
-        target += 100000
-        time_to_target = dp.get_time_to_target(target)
-
     top_3_per_cap_pairs = dp.get_deaths_per_capita(size=3)
     top_3_per_cap = [entry[0] for entry in top_3_per_cap_pairs]
 
@@ -497,116 +607,352 @@ def make_tweet():
                   f"the U.S will have {target:,} cases in {time_to_target} days (Estimate)." \
                   f" {chosen_tags[0]} {chosen_tags[1]} {chosen_tags[2]}"
 
-    multi_tweet = True
+    return [{'status': text, 'media': [plot_path + file for file in lead_files]},
+            {'status': follow_text, 'media': [plot_path + file for file in follow_files]}]
+
 
-    print(text)
-    print(follow_text)
+@metrics.timed
+def post_tweet(thread: [dict], api):
+    """
+    Posts a tweet thread, with every tweet after the first replying to the one before it
+    :param thread: The tweets to post, as returned by compose_tweet
+    :param api: A tweepy API object or a mediauploader.StubAPI
+    """
 
-    for file in lead_files:
-        response = api.media_upload(plot_path + file)
-        lead_media_ids.append(response.media_id)
-    for file in follow_files:
-        response = api.media_upload(plot_path + file)
-        follow_media_ids.append(response.media_id)
+    media = [file for tweet in thread for file in tweet['media']]
+    uploads = iter(mediauploader.upload_media(api, media, workers=upload_workers, attempts=upload_attempts,
+                                              cache_path=media_cache_path))
 
     print('Sending tweet!')
     logger.info('Found new data! Sending tweet!')
 
-    if multi_tweet:
-        lead_tweet = api.update_status(status=text, media_ids=lead_media_ids)
-        api.update_status(status=follow_text, in_reply_to_status_id=lead_tweet.id, media_ids=follow_media_ids)
-    else:
-        api.update_status(status=text, media_ids=lead_media_ids)
+    previous_id = None
+
+    for tweet in thread:
+        # A plot that could not be uploaded is left out rather than holding back the whole tweet
+        media_ids = [upload.media_id for upload in [next(uploads) for _ in tweet['media']]
+                     if upload.media_id is not None]
+
+        with metrics.stage('update_status'):
+            posted = api.update_status(status=tweet['status'], media_ids=media_ids, in_reply_to_status_id=previous_id)
+
+        previous_id = posted.id
+
+
+def write_tweet_summary(thread: [dict]):
+    """
+    Saves the tweet thread a dry run would have posted
+    :param thread: The tweets that would have been posted, as returned by compose_tweet
+    """
+
+    summary = {'composed_at': now.isoformat(), 'tweets': thread}
+
+    with open(tweet_summary_path + '.tmp', 'w') as file:
+        json.dump(summary, file, indent=2)
+
+    os.replace(tweet_summary_path + '.tmp', tweet_summary_path)
+
+    print(f'Dry run! Wrote the tweets that would have been posted to {tweet_summary_path}')
+    logger.info(f'Dry run! Wrote the tweets that would have been posted to {tweet_summary_path}')
 
 
 def get_updated_states(new_data: pd.DataFrame, old_data: pd.DataFrame, old_from_csv=True) -> dict:
     """
     Determines updates to state information
-    :param old_from_csv: Was the old data loaded from a CSV? Default is True
+    :param old_from_csv: Kept for compatibility. Data read in from a CSV is handled the same as any other data
     :param old_data: The DataFrame to which the new data will be compared to
     :param new_data: A DataFrame containing state and city data
     :return: A dictionary containing the list of states with new cases, deaths, and recoveries
     """
 
-    new_state_objs = make_state_objects_from_data(new_data)
-    old_state_objs = make_state_objects_from_data(old_data, from_csv=old_from_csv)
-
-    new_cases = []
-    new_deaths = []
-    new_recoveries = []
-
-    for new_state in new_state_objs:
-        if new_state.get_name() not in [state.get_name() for state in old_state_objs]:
-            if new_state.get_recoveries() > 0:
-                new_recoveries.append(new_state.get_name())
-            if new_state.get_cases() > 0:
-                new_cases.append(new_state.get_name())
-            if new_state.get_deaths() > 0:
-                new_deaths.append(new_state.get_name())
-        else:
-            for old_state in old_state_objs:
-                if new_state.get_name() == old_state.get_name():
-                    if new_state.get_recoveries() > old_state.get_recoveries():
-                        new_recoveries.append(new_state.get_name())
-                    if new_state.get_cases() > old_state.get_cases():
-                        new_cases.append(new_state.get_name())
-                    if new_state.get_deaths() > old_state.get_deaths():
-                        new_deaths.append(new_state.get_name())
-
-    return {'cases': new_cases, 'deaths': new_deaths, 'recoveries': new_recoveries}
-
-
-def main(first_run=True):
-    if first_run:
-        if os.path.exists(cdc_path) is not True:
-            try:
-                os.mkdir(cdc_path)
-            except OSError as error:
-                logger.critical(f'Could not create CDC data directory because {error.strerror}!')
-        if os.path.exists(jhu_path) is not True:
-            try:
-                os.mkdir(jhu_path)
-            except OSError as error:
-                logger.critical(f'Could not create JHU data directory because {error.strerror}!')
-        if os.path.exists(plot_path) is not True:
+    diff = snapshots.diff_snapshots(new_data, old_data, 'jhu')
+    # States only in the old data cannot have updates, and states keep the order they have in the new data
+    deltas = diff.deltas.reindex(pd.unique(new_data['state'].dropna()))
+
+    return {metric: deltas.index[deltas[metric] > 0].to_list() for metric in state_count_columns}
+
+
+def set_source_urls(jhu_url=None, tracking_url=None):
+    """
+    Points the tracker at other copies of its data sources, such as a local stand-in server
+    :param jhu_url: The URL of the directory holding JHU's csse_covid_19_daily_reports_us and csse_covid_19_time_series
+    directories. Default is None, which keeps the current one
+    :param tracking_url: The URL of the COVID Tracking Project's U.S daily CSV. Default is None, which keeps the current
+    one
+    """
+
+    global jhu_data_url
+    global jhu_report_url
+    global jhu_time_series_url
+    global tracking_project_url
+
+    if jhu_url is not None:
+        jhu_data_url = jhu_url.rstrip('/') + '/'
+        jhu_report_url = jhu_data_url + 'csse_covid_19_daily_reports_us/'
+        jhu_time_series_url = jhu_data_url + 'csse_covid_19_time_series/'
+
+    if tracking_url is not None:
+        tracking_project_url = tracking_url
+
+    logger.info(f'Reading JHU data from {jhu_data_url} and tracking project data from {tracking_project_url}')
+
+
+def use_output_directory(directory: str):
+    """
+    Saves the tracker's data, snapshots, plots, logs and metrics inside a directory instead of the working directory.
+    Dry runs and fixture runs use this so they never touch the real bot's state
+    :param directory: The directory to save to. Created along with everything inside it if it does not exist
+    """
+
+    global jhu_path
+    global cdc_path
+    global tracking_proj_path
+    global plot_path
+    global plot_manifest_path
+    global media_cache_path
+    global tweet_summary_path
+    global snapshot_index_path
+    global snapshot_paths
+    global log_path
+    global metrics_path
+    global prometheus_path
+
+    base_path = str(Path(directory).resolve()) + '/'
+
+    jhu_path = base_path + 'jhu_data/'
+    cdc_path = base_path + 'cdc_data/'
+    tracking_proj_path = base_path + 'ctp_data/'
+    plot_path = base_path + 'plots/'
+    plot_manifest_path = base_path + 'plot_manifest.json'
+    media_cache_path = base_path + 'media_cache.json'
+    tweet_summary_path = base_path + 'tweet_summary.json'
+    snapshot_index_path = base_path + 'snapshot_index.sqlite'
+    snapshot_paths = {'jhu': jhu_path, 'cdc': cdc_path}
+    log_path = base_path + 'logs/coronatracker_log.log'
+    metrics_path = base_path + 'logs/metrics.jsonl'
+    prometheus_path = base_path + 'logs/coronatracker.prom'
+
+
+def use_fixtures(directory: str):
+    """
+    Reads every data source from a local directory instead of the internet. The directory mirrors the layout of the
+    sources: csse_covid_19_daily_reports_us/<MM-DD-YYYY>.csv, csse_covid_19_time_series/<time series>.csv and
+    covidtracking/daily.csv. The newest daily report in the directory is used no matter how old it is
+    :param directory: The fixture directory
+    """
+
+    global jhu_report_name
+
+    base_url = Path(directory).resolve().as_uri() + '/'
+    set_source_urls(base_url, base_url + 'covidtracking/daily.csv')
+
+    report_dates = []
+
+    for file in os.listdir(Path(directory) / 'csse_covid_19_daily_reports_us'):
+        try:
+            report_dates.append(datetime.strptime(file, jhu_report_name_format))
+        except ValueError:
+            continue
+
+    # Marking the newest report as already found means the resolver never looks past it
+    jhu_report_name = max(report_dates).strftime(jhu_report_name_format) if len(report_dates) > 0 else None
+
+    logger.info(f'Reading data from fixtures in {directory}')
+
+
+def parse_args(args=None) -> argparse.Namespace:
+    """
+    Reads the tracker's command line options
+    :param args: The options to read. Default is None, which reads them from the command line
+    :return: The parsed options
+    """
+
+    parser = argparse.ArgumentParser(description='Tracks COVID-19 in the U.S and posts updates to Twitter')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Run without connecting to Twitter or saving snapshots, writing the tweets that would '
+                             'have been posted to tweet_summary.json')
+    parser.add_argument('--fixtures', metavar='DIRECTORY',
+                        help='Read every data source from this directory instead of the internet')
+    parser.add_argument('--output', metavar='DIRECTORY',
+                        help='Save data, snapshots, plots, logs and metrics in this directory instead of the working '
+                             'directory. Default for --dry-run and --fixtures is dry_run_output')
+    parser.add_argument('--jhu-url', help='Read JHU data from this URL instead, such as a local stand-in server. Same '
+                                          'as setting CORONATRACKER_JHU_URL')
+    parser.add_argument('--ctp-url', help='Read the COVID Tracking Project\'s U.S daily CSV from this URL instead. Same '
+                                          'as setting CORONATRACKER_CTP_URL')
+    parser.add_argument('--jhu-report', metavar='MM-DD-YYYY.csv',
+                        help='Start from this JHU daily report instead of looking for the newest one')
+    parser.add_argument('--cycles', type=int, default=None,
+                        help='Stop after this many cycles. Default is to run until interrupted')
+    parser.add_argument('--interval', type=float, default=None,
+                        help='Seconds between the start of each cycle, with no random delay added. Default is '
+                             f'{cycle_interval} plus up to {cycle_jitter} seconds at random')
+
+    return parser.parse_args(args)
+
+
+def refresh_clock():
+    """Sets now and now_file_ext to the current time. Called at the start of each cycle"""
+
+    global now
+    global now_file_ext
+
+    now = datetime.now()
+    now_file_ext = now.strftime(snapshots.snapshot_time_format + '.csv')
+
+
+def make_directories():
+    """Creates the directories the tracker saves its data and plots to"""
+
+    for directory, name in ((cdc_path, 'CDC data'), (jhu_path, 'JHU data'), (plot_path, 'plots')):
+        if os.path.exists(directory) is not True:
             try:
-                os.mkdir(plot_path)
+                os.makedirs(directory)
             except OSError as error:
-                logger.critical(f'Could not create plots directory because {error.strerror}!')
+                logger.critical(f'Could not create {name} directory because {error.strerror}!')
 
-    logger.info('Starting tracker loop')
 
-    spacer = ' ' * 10
+@metrics.timed
+def get_upstream_fingerprint() -> str:
+    """
+    Fingerprints the data fetched during this cycle
+    :return: A hex digest that only changes when the daily report, one of the time series or the tracking project
+    data changed
+    """
+
+    digest = hashlib.sha256()
+    digest.update(snapshots.get_snapshot_hash(get_jhu_data(), 'jhu').encode())
+
+    for series, file_name in sorted(series_files.items()):
+        header = seriesstore.load_header(jhu_path + file_name)
+        digest.update(json.dumps([series, header.get('dates'), header.get('regions_checksum'),
+                                  header.get('checksums')]).encode())
 
-    if first_run:
-        print('=' * 50,
-              '\n',
-              spacer + 'COVID-19 Tracker (U.S)\n',
-              '=' * 50)
-        print('To break this program out of its loop, press Ctrl+C')
+    digest.update(pd.util.hash_pandas_object(dp.get_tracking_project_data(), index=False).to_numpy().tobytes())
 
-    us_frame = get_jhu_data()
+    return digest.hexdigest()
 
-    dp.make_plots()
 
-    if should_tweet:
-        # File saving had to be moved down here or else the tweet formatter would not be able to detect new data
-        make_tweet()
+def run_cycle() -> bool:
+    """
+    Runs one cycle of the tracker: fetches every source, then makes plots and tweets if anything changed
+    :return: True if anything changed since the last cycle, False if the cycle was skipped
+    """
+
+    global should_tweet
+    global should_save_jhu
+    global last_upstream_fingerprint
+
+    logger.info('Starting tracker cycle')
 
-        if should_save_jhu:
-            print('Found new JHU data! Saving...')
-            logger.info('Found new JHU data! Now saving...')
-            us_frame.to_csv(jhu_path + 'jhu_' + now_file_ext)
+    refresh_clock()
+    metrics.reset()
+    cycle_start = time.perf_counter()
+
+    should_tweet = False
+    should_save_jhu = False
+
+    # Everything fetched during the previous cycle may be stale now
+    data_cache.invalidate()
+    data_cache.reset_stats()
 
     try:
-        while True:
-            print('Sleeping now for 30 minutes! Will check for new data afterwards...')
-            time.sleep(60 * 30)
-            main(first_run=False)
-            break
+        compact_snapshot_history('jhu')
+        fetch_all_data()
+
+        us_frame = get_jhu_data()
+        fingerprint = get_upstream_fingerprint()
+
+        if fingerprint == last_upstream_fingerprint:
+            logger.info('No source has changed since the last cycle! Skipping plots and tweets')
+
+            return False
+
+        dp.make_plots()
+
+        if should_tweet:
+            # File saving had to be moved down here or else the tweet formatter would not be able to detect new data
+            make_tweet()
+
+            if should_save_jhu and dry_run:
+                # Saving would make the real bot think it had already tweeted this data
+                logger.info('Dry run! Not saving the new JHU data')
+            elif should_save_jhu:
+                print('Found new JHU data! Saving...')
+                logger.info('Found new JHU data! Now saving...')
+                save_snapshot(us_frame, 'jhu')
+
+        last_upstream_fingerprint = fingerprint
+
+        return True
+    finally:
+        logger.info(f'Data cache usage this cycle: {data_cache.get_stats()}')
+
+        try:
+            metrics.export(metrics_path, prometheus_path, now, time.perf_counter() - cycle_start)
+        except OSError as error:
+            logger.warning(f'Could not export cycle metrics because {error}!')
+
+
+def main(cycles=None):
+    """
+    Runs the tracker in a loop
+    :param cycles: How many cycles to run. Default is None, which runs until interrupted with Ctrl+C
+    """
+
+    make_directories()
+
+    spacer = ' ' * 10
+
+    print('=' * 50,
+          '\n',
+          spacer + 'COVID-19 Tracker (U.S)\n',
+          '=' * 50)
+    print('To break this program out of its loop, press Ctrl+C')
+
+    tracker_scheduler = Scheduler(cycle_interval, jitter=cycle_jitter, failure_delay=cycle_failure_delay,
+                                  max_failure_delay=cycle_max_failure_delay)
+
+    try:
+        tracker_scheduler.run(run_cycle, cycles=cycles)
     except KeyboardInterrupt:
         print('Exiting...')
 
+    logger.info(f'Cycle durations: {tracker_scheduler.get_stats()}')
+
 
 if __name__ == '__main__':
-    main()
+    # Running through the imported module means this script and dataproccessor share one copy of the tracker's state
+    import coronatracker
+
+    options = coronatracker.parse_args()
+    coronatracker.dry_run = options.dry_run
+    output_path = options.output
+
+    if output_path is None and (options.dry_run or options.fixtures is not None):
+        # Keeps test runs from mixing their data and snapshots in with the real bot's
+        output_path = os.getcwd() + '/dry_run_output/'
+
+    if output_path is not None:
+        coronatracker.use_output_directory(output_path)
+
+    coronatracker.setup_logging()
+
+    if options.fixtures is not None:
+        coronatracker.use_fixtures(options.fixtures)
+
+    if options.jhu_url is not None or options.ctp_url is not None:
+        coronatracker.set_source_urls(options.jhu_url, options.ctp_url)
+
+    if options.jhu_report is not None:
+        coronatracker.jhu_report_name = options.jhu_report
+
+    if options.interval is not None:
+        coronatracker.cycle_interval = options.interval
+        coronatracker.cycle_jitter = 0
+
+    if coronatracker.dry_run is not True:
+        # Asks for credentials up front, before the first cycle, instead of in the middle of it
+        coronatracker.get_api()
+
+    coronatracker.main(cycles=options.cycles)
@@ -0,0 +1,95 @@
+import logging
+import threading
+
+logger = logging.getLogger()
+
+
+class DataCache:
+    """
+    Holds the data fetched during a single tracker cycle so that every consumer shares one parsed frame. Entries are
+    keyed by the source of the data (Ex. jhu) and the series within that source (Ex. us_confirmed). Safe to share
+    between threads, and a series is only ever loaded by one of them at a time
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.hits = {}
+        self.misses = {}
+        self.lock = threading.Lock()
+        self.key_locks = {}
+
+    def get_key_lock(self, key: tuple) -> threading.Lock:
+        """Gets the lock that guards loading a single series"""
+
+        with self.lock:
+            return self.key_locks.setdefault(key, threading.Lock())
+
+    def get(self, source: str, series: str, loader):
+        """
+        Returns the cached data for a series, calling loader to fetch and parse it on a miss
+        :param source: The source of the data. Ex. jhu or ctp
+        :param series: The name of the series within that source
+        :param loader: A function taking no arguments that returns the data for this series
+        :return: The cached data for the series
+        """
+
+        key = (source, series)
+
+        with self.get_key_lock(key):
+            if key in self.entries:
+                with self.lock:
+                    self.hits[key] = self.hits.get(key, 0) + 1
+
+                return self.entries[key]
+
+            with self.lock:
+                self.misses[key] = self.misses.get(key, 0) + 1
+
+            logger.info(f'Data cache miss for {source}/{series}. Loading...')
+
+            data = loader()
+            self.entries[key] = data
+
+            return data
+
+    def put(self, source: str, series: str, data):
+        """
+        Stores data for a series that was fetched outside of get
+        :param source: The source of the data. Ex. jhu or ctp
+        :param series: The name of the series within that source
+        :param data: The data to store
+        """
+
+        with self.lock:
+            self.entries[(source, series)] = data
+
+    def invalidate(self, source=None, series=None):
+        """
+        Drops cached data so that it is loaded again on next use. With no arguments everything is dropped
+        :param source: Only drop series from this source. Default is all sources
+        :param series: Only drop this series. Default is all series
+        """
+
+        with self.lock:
+            for key in list(self.entries.keys()):
+                if (source is None or key[0] == source) and (series is None or key[1] == series):
+                    del self.entries[key]
+
+    def reset_stats(self):
+        """Clears the hit and miss counters"""
+
+        with self.lock:
+            self.hits.clear()
+            self.misses.clear()
+
+    def get_stats(self) -> dict:
+        """
+        Summarizes how the cache has been used since the counters were last reset
+        :return: A dictionary mapping source/series to its hit and miss counts
+        """
+
+        keys = set(self.hits.keys()) | set(self.misses.keys())
+
+        return {f'{source}/{series}': {'hits': self.hits.get((source, series), 0),
+                                       'misses': self.misses.get((source, series), 0)}
+                for source, series in sorted(keys)}
@@ -1,86 +1,104 @@
-import math
-import urllib
 import os
-from datetime import datetime
+from collections import namedtuple
+from functools import partial
 
-import matplotlib.pyplot as plt
-import matplotlib.ticker as ticker
-import seaborn as sns
 import numpy as np
 import pandas as pd
 
 import coronatracker as ct
+import fetcher
+import metrics
+import seriesstore
 
+# Daily totals for every U.S state. deaths and cases have one row per state and one column per date
+StateSeries = namedtuple('StateSeries', ['states', 'dates', 'deaths', 'cases', 'population'])
 
-def make_plots():
+
+@metrics.timed
+def make_plots(processes=None):
     """
-    Generates the plots displayed in tweets posted by this bot.
+    Generates the plots displayed in tweets posted by this bot. The data behind every plot is computed once here, then
+    each plot whose data changed since it was last drawn is rendered in its own worker process
+    :param processes: How many worker processes to render with. Default is one per CPU. Use 1 to render in this process
+    :return: The names of the plots that were rendered. Any other plot's existing file is still current
     """
+    # Plotting pulls in matplotlib and seaborn, so it is only imported by the functions that draw
+    import plotrender
+
     print('Attempting to build plots!')
     ct.logger.info('Making plots...')
 
-    make_summary_bar_plot()
+    rendered = plotrender.render_plots(get_plot_inputs(), ct.plot_path, processes=processes,
+                                       manifest_path=ct.plot_manifest_path)
 
-    ts_data = ct.get_time_series()
-    global_data = get_global_time_series()
+    ct.logger.info(f'Created plots! Rendered {len(rendered)} of {len(plotrender.renderers)}')
 
-    # Time Series Cumulative Plot
-    freqs = get_country_cumulative(ts_data)
-    make_time_series_plot(freqs)
+    return rendered
 
-    # Daily Change Plot
-    changes = get_total_daily_change(ts_data)
-    make_daily_change_plot(changes)
 
-    # Country Cumulative Case Comparison Plot
-    comp_countries = find_metric_leader(global_data, inc_US=True, size=8)
-    cumulative_cases = get_country_cumulative(global_data, countries=comp_countries)
+@metrics.timed
+def get_plot_inputs() -> dict:
+    """
+    Computes the data behind every plot posted by this bot
+    :return: A dictionary mapping the name of each plot to the inputs it is rendered from
+    """
 
-    make_comparison_plot(comp_countries, cumulative_cases)
+    global_data = get_global_time_series()
 
-    make_state_death_plot()
+    # The store keeps the U.S totals and changes up to date as new days arrive
+    freqs, changes = get_us_totals('cases')
 
-    make_per_capita_plot()
+    # Country Cumulative Case Comparison Plot
+    comp_countries = find_metric_leader(global_data, inc_US=True, size=8)
+    _, cumulative_cases = get_country_matrix(global_data, comp_countries)
 
-    make_testing_plot()
+    return {'state_sum': get_summary_bar_inputs(),
+            'rate_plot': {'freqs': freqs.tolist()},
+            'change_plot': {'changes': changes.tolist()},
+            'comp_plot': {'countries': comp_countries, 'cumulative_cases': cumulative_cases},
+            'death_comp_plot': get_state_death_inputs(),
+            'capita_plot': get_per_capita_inputs(),
+            'capita_rate': get_testing_inputs(),
+            'vent_icu_plot': get_vent_icu_inputs()}
 
-    make_vent_icu_plot()
 
-    ct.logger.info('Created plots!')
+def render_single_plot(name: str, inputs: dict):
+    """
+    Renders one plot in this process, unless its inputs are unchanged since it was last rendered
+    :param name: The name of the plot
+    :param inputs: The data the plot is drawn from
+    """
 
+    import plotrender
 
-def make_summary_bar_plot():
-    us_frame = ct.get_jhu_data()
+    plotrender.render_plots({name: inputs}, ct.plot_path, processes=1, manifest_path=ct.plot_manifest_path)
 
-    us_frame.sort_values(by='cases', axis=0, ascending=False, inplace=True)
 
-    for jhu_tick in plt.xticks()[1]:
-        jhu_tick.set_rotation(45)
+@metrics.timed
+def get_summary_bar_inputs(state_frame=None) -> dict:
+    """
+    Selects the top 25 states by caseload for the summary bar plot
+    :param state_frame: State level data as built by coronatracker.make_state_frame. Fetched from JHU if not provided
+    :return: A dictionary with the lists states, cases, deaths and recoveries
+    """
 
-    plt.suptitle('COVID-19 Details for the United States')
+    if state_frame is None:
+        state_frame = ct.make_state_frame(ct.get_jhu_data())
 
-    # Plot setup for JHU figure
-    state_frame = ct.make_state_frame(us_frame)
+    state_frame = state_frame.sort_values(by='cases', ascending=False)
     state_frame = state_frame.iloc[np.arange(0, 26), [0, 1, 2, 3]]
 
-    pos = np.arange(len(state_frame['state']))
-    width = 0.9
+    return {'states': state_frame['state'].tolist(), 'cases': state_frame['cases'].tolist(),
+            'deaths': state_frame['deaths'].tolist(), 'recoveries': state_frame['recoveries'].tolist()}
 
-    plt.gcf().set_size_inches(14, 14)
 
-    case_bar = plt.bar(pos, state_frame['cases'], width, label='Cases')
-    death_bar = plt.bar(pos, state_frame['deaths'], width, label='Deaths')
-    recov_bar = plt.bar(pos, state_frame['recoveries'], width,
-                        bottom=state_frame['deaths'], label='Recoveries')
+def make_summary_bar_plot(state_frame=None):
+    """
+    Creates a stacked bar plot of cases, deaths and recoveries for the top 25 states by caseload
+    :param state_frame: State level data as built by coronatracker.make_state_frame. Fetched from JHU if not provided
+    """
 
-    plt.xlabel('State')
-    plt.ylabel('Count')
-    plt.title(f'Confirmed COVID-19 Case Statistics for the Top 25 States by Caseload')
-    plt.xticks(pos, state_frame['state'].tolist(), fontsize=10)
-    plt.legend((case_bar[0], death_bar[0], recov_bar[0]), ('Cases', 'Deaths', 'Recoveries'), loc='upper right')
-    plt.savefig(ct.plot_path + 'state_sum.png')
-    plt.show(block=False)
-    plt.close()
+    render_single_plot('state_sum', get_summary_bar_inputs(state_frame))
 
 
 def make_time_series_plot(freqs: list):
@@ -89,26 +107,7 @@ def make_time_series_plot(freqs: list):
     :param freqs: The number of cases for each day of the outbreak
     """
 
-    days = len(freqs)
-    fig, (reg_ax, log_ax) = plt.subplots(1, 2)
-
-    fig.set_size_inches(12, 10)
-
-    fig.suptitle('Cumulative Cases per Day in the United States (Standard Scale and Natural Log)')
-
-    reg_ax.plot(np.arange(start=1, stop=days + 1), freqs, color='red')
-    reg_ax.set_xlabel('Days Since 01/21/2020')
-    reg_ax.set_ylabel('Number of cases')
-
-    log_freqs = [math.log(freq) for freq in freqs]
-
-    log_ax.plot(np.arange(start=1, stop=days + 1), log_freqs, color='red')
-    log_ax.set_xlabel('Days Since 01/21/2020')
-    log_ax.set_ylabel('Number of cases (Natural Log Scale)')
-
-    plt.savefig(ct.plot_path + 'rate_plot.png')
-    plt.show(block=False)
-    plt.close()
+    render_single_plot('rate_plot', {'freqs': freqs})
 
 
 def make_daily_change_plot(changes: []):
@@ -117,19 +116,7 @@ def make_daily_change_plot(changes: []):
     :param changes: A list of the changes that have occured each day
     """
 
-    # Plus 1 because numpy stops 1 before the max value
-    days = len(changes) + 1
-
-    plt.plot(np.arange(1, stop=days), changes, color='red')
-
-    plt.title('Daily Change in Cases Since 01/22/2020')
-    plt.gcf().set_size_inches(12, 12)
-    plt.xlabel('Days since 01/22/2020')
-    plt.ylabel('Change in Cases from Previous Day')
-
-    plt.savefig(ct.plot_path + 'change_plot.png')
-    plt.show(block=False)
-    plt.close()
+    render_single_plot('change_plot', {'changes': changes})
 
 
 def make_comparison_plot(countries: list, cumulative_cases: list):
@@ -139,232 +126,282 @@ def make_comparison_plot(countries: list, cumulative_cases: list):
     :param cumulative_cases: The cumulative number of cases for each country
     """
 
-    change_dict = {country: change for country, change in zip(countries, cumulative_cases)}
-    days = np.arange(start=0, stop=len(change_dict['US'])).tolist() * 8
-    change_frame = pd.DataFrame(change_dict).melt(var_name='country', value_name='cases')
-    change_frame['day'] = days
+    render_single_plot('comp_plot', {'countries': countries, 'cumulative_cases': cumulative_cases})
+
+
+@metrics.timed
+def get_country_matrix(data: pd.DataFrame, countries=None) -> ([str], np.ndarray):
+    """
+    Sums a global time series by country in a single pass
+    :param data: A DataFrame containing global time series data for cases or deaths
+    :param countries: A list of the countries to return, in order. Countries missing from the data get a row of zeros.
+    Default is None, which returns every country in the order it first appears
+    :return: The list of countries and a matrix with one row per country and one column per day
+    """
+
+    columns = get_date_columns(data)
+    country_totals = data.groupby('Country_Region', sort=False)[columns].sum()
+
+    if countries is not None:
+        country_totals = country_totals.reindex(countries, fill_value=0)
+
+    return country_totals.index.to_list(), country_totals.to_numpy(dtype=np.int64)
+
 
-    sns.set()
-    sns.lineplot(x='day', y='cases', hue='country', data=change_frame)
+def get_country_series(data: pd.DataFrame, countries=None) -> dict:
+    """
+    Sums a global time series by country in a single pass
+    :param data: A DataFrame containing global time series data for cases or deaths
+    :param countries: A list of the countries to return. Default is None, which returns every country
+    :return: A dictionary mapping each country to an array of its totals for each day. The arrays are views into one
+    shared matrix
+    """
 
-    plt.title('Cumulative Cases in the Top 10 Countries by Cases Globally')
-    plt.gcf().set_size_inches(12, 12)
-    plt.xlabel('Days since 01/22/2020')
-    plt.ylabel('Cumulative Cases')
+    names, matrix = get_country_matrix(data, countries)
 
-    plt.savefig(ct.plot_path + 'comp_plot.png')
-    plt.show(block=False)
-    plt.close()
+    return {name: matrix[index] for index, name in enumerate(names)}
 
 
 def get_country_cumulative(data: pd.DataFrame, countries='US') -> list:
     """
     Calculates the cumulative of new cases for the U.S or a selected group of countries each day
-    :param countries: Either a single country or a list of countries 
+    :param countries: Either a single country or a list of countries. If US, data is assumed to only hold U.S data
     :param data: A DataFrame containing time series data for cases
-    :return: A list of the number of cases for each day
+    :return: A list of the number of cases for each day, or a list of those lists if countries is a list
     """
 
     if countries == 'US':
-        rates = [data[column].tolist() for column in data.columns if '/20' in column]
-        daily_rates = [np.sum(day_rate) for day_rate in rates]
-
-        return daily_rates
+        return get_daily_totals(data).tolist()
     elif type(countries) is list:
-        cumulative_cases = []
+        _, matrix = get_country_matrix(data, countries)
 
-        for country in countries:
-            is_country = data['Country_Region'] == country
-            country_frame = data[is_country]
+        return matrix.tolist()
+    else:
+        _, matrix = get_country_matrix(data, [countries])
 
-            rates = [country_frame[column].tolist() for column in country_frame.columns if '/20' in column]
-            daily_rates = [np.sum(day_rate) for day_rate in rates]
+        return matrix[0].tolist()
 
-            cumulative_cases.append(daily_rates)
 
-        return cumulative_cases
-    else:
-        is_country = data['Country_Region'] == countries
-        country_frame = data[is_country]
+def get_date_columns(data: pd.DataFrame) -> [str]:
+    """
+    Finds the columns of a JHU time series DataFrame that hold daily counts
+    :param data: A DataFrame containing time series data
+    :return: The names of the date columns (Ex. 1/22/20), in the order they appear in the data
+    """
+
+    return seriesstore.get_date_columns(data)
+
+
+def get_daily_totals(data: pd.DataFrame) -> np.ndarray:
+    """
+    Sums every date column of a time series DataFrame once
+    :param data: A DataFrame containing time series data for either cases or deaths
+    :return: An integer array holding the total for each day in the data
+    """
+
+    columns = get_date_columns(data)
 
-        rates = [country_frame[column].tolist() for column in country_frame.columns if '/20' in column]
-        daily_rates = [np.sum(day_rate) for day_rate in rates]
+    if len(columns) == 0:
+        return np.zeros(0, dtype=np.int64)
 
-        return daily_rates
+    # Summing through pandas skips missing values the same way get_daily_change does
+    return data[columns].sum(axis=0).to_numpy().astype(np.int64)
 
 
+@metrics.timed
 def get_total_daily_change(data: pd.DataFrame, country='US') -> list:
     """
     Calculates the change in either cases or deaths for each day since the time first recorded in the data
     :param country: The country to get the changes for. Default is US
-    :param data: a DataFrame containing time series data
+    :param data: a DataFrame containing time series data. Works with both the case and the death time series
     :return: The change in cases for each day
     """
-    if country == 'US':
-        # Select columns with dates
-        columns = [column for column in data.columns.to_list() if '/20' in column]
-        changes = []
-
-        for index in range(0, len(columns)):
-            if index != len(columns):
-                index = index + 1
-                needed_columns = columns[:index]
-                changes.append(ct.get_daily_change(data[needed_columns]))
-            else:
-                changes.append(ct.get_daily_change(data))
 
-        return changes
+    if country == 'US':
+        totals = get_daily_totals(data)
+        # The first day has nothing behind it, so its change is its total
+        changes = np.diff(totals, prepend=0)
     else:
-        country_data = data[data['Country_Region'] == country]
-        columns = [column for column in country_data.columns.to_list() if '/20' in column]
-        changes = []
-        changes = []
-
-        for index in range(3, len(columns)):
-            if index != len(columns):
-                index = index + 1
-                needed_columns = columns[2:index]
-                changes.append(ct.get_daily_change(country_data[needed_columns]))
-            else:
-                changes.append(ct.get_daily_change(country_data))
-
-        return changes
-
-
-def get_global_time_series() -> pd.DataFrame:
-    """Downloads and saves the time series file without filtering for only U.S data"""
-
-    if os.path.exists(ct.jhu_path + 'jhu_global_time.csv'):
-        data = pd.read_csv(ct.jhu_path + 'jhu_global_time.csv')
-        newest_date = datetime.strptime(data.columns.to_list()[-1], '%m/%d/%y')
+        totals = get_daily_totals(data[data['Country_Region'] == country])
+        # Country changes have always started from the fourth day of the series
+        changes = np.diff(totals)[2:]
 
-        if newest_date == datetime.now().date():
-            ct.logger.info('Currently downloaded global time series is up to date. Reading file...')
+    return changes.tolist()
 
-            return data
-        else:
-            ct.logger.info('Global time series data may be out of date! Trying to download new file...')
-            file_link = 'https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_confirmed_global.csv'
-
-            newest_csv_req = urllib.request.Request(file_link)
-            csv_file = urllib.request.urlopen(newest_csv_req)
-            csv_data = csv_file.read()
 
-            with open(ct.jhu_path + 'jhu_global_time_temp.csv', 'wb') as file:
-                file.write(csv_data)
+@metrics.timed
+def get_us_totals(metric='cases') -> (np.ndarray, np.ndarray):
+    """
+    Gets the cumulative U.S total and its daily change for each day. These are kept up to date by the series store as
+    new days arrive rather than summed again from the first day
+    :param metric: Either cases or deaths. Default is cases
+    :return: An array of cumulative totals and an array of daily changes, one entry per day
+    """
 
-            global_frame = pd.read_csv(ct.jhu_path + 'jhu_global_time_temp.csv')
+    if metric == 'cases':
+        ct.get_time_series()
+        series = 'us_confirmed'
+    elif metric == 'deaths':
+        get_death_time_series('US')
+        series = 'us_deaths'
+    else:
+        raise ValueError("'metric' must be either 'cases' or 'deaths'!")
 
-            global_frame.drop(columns=['Lat', 'Long'], inplace=True)
-            global_frame.rename(columns={'Province/State': 'Province_State', 'Country/Region': 'Country_Region'},
-                                inplace=True)
-            global_frame.to_csv(ct.jhu_path + 'jhu_global_time.csv')
-            os.remove(ct.jhu_path + 'jhu_global_time_temp.csv')
+    return seriesstore.load_totals(ct.jhu_path + ct.series_files[series])
 
-            ct.logger.info('Succesfully downloaded time series data!')
 
-            return global_frame
+def get_global_time_series() -> pd.DataFrame:
+    """Returns the global time series, reading it only once per tracker cycle"""
 
-    ct.logger.info('Global time series data may be out of date! Trying to download new file...')
-    file_link = 'https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_confirmed_global.csv'
+    return ct.data_cache.get('jhu', 'global_confirmed',
+                             ct.get_fetch_loader(download_global_time_series, 'global_confirmed'))
 
-    newest_csv_req = urllib.request.Request(file_link)
-    csv_file = urllib.request.urlopen(newest_csv_req)
-    csv_data = csv_file.read()
 
-    with open(ct.jhu_path + 'jhu_global_time_temp.csv', 'wb') as file:
-        file.write(csv_data)
+@metrics.timed
+def download_global_time_series(timeout=60) -> pd.DataFrame:
+    """
+    Downloads and saves the time series file without filtering for only U.S data. The file is only downloaded again if
+    it has changed since the saved copy was made
+    :param timeout: How long to wait on the server in seconds. Default is 60
+    """
 
-    global_frame = pd.read_csv(ct.jhu_path + 'jhu_global_time_temp.csv')
+    file_path = ct.jhu_path + ct.series_files['global_confirmed']
+    file_link = ct.jhu_time_series_url + 'time_series_covid19_confirmed_global.csv'
 
-    global_frame.drop(columns=['Lat', 'Long'], inplace=True)
-    global_frame.to_csv(ct.jhu_path + 'jhu_global_time.csv')
-    os.remove(ct.jhu_path + 'jhu_global_time_temp.csv')
+    def prepare(global_frame: pd.DataFrame) -> pd.DataFrame:
+        return global_frame.rename(columns={'Province/State': 'Province_State', 'Country/Region': 'Country_Region'})
 
-    ct.logger.info('Succesfully downloaded time series data!')
+    ct.logger.info('Checking global time series data for updates')
+    global_frame = fetcher.fetch_frame(file_link, file_path, prepare=prepare, timeout=timeout,
+                                       usecols=lambda column: column not in ['Lat', 'Long'],
+                                       dtype={'Province/State': str, 'Country/Region': str},
+                                       save=seriesstore.save_series, load=seriesstore.load_series)
+    ct.logger.info('Global time series data is ready!')
 
     return global_frame
 
 
 def get_death_time_series(country='all') -> pd.DataFrame:
     """
-    Downloads the global deaths time series. Can return for a specific country or all countries
+    Returns the deaths time series, reading each file only once per tracker cycle. Can return for a specific country
+    or all countries
     :param: country: Either 'all' for all countries or a specific country's name. Default is all.
     :return: A DataFrame containing the death time series for a given country or all countries
     """
 
     if country == 'US':
-        file_path = ct.jhu_path + 'jhu_death_time_us.csv'
-        file_link = 'https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_deaths_US.csv'
-        drop_list = ['UID', 'iso2', 'iso3', 'code3', 'FIPS', 'Lat', 'Long_', 'Combined_Key']
+        return ct.data_cache.get('jhu', 'us_deaths',
+                                 ct.get_fetch_loader(partial(download_death_time_series, 'US'), 'us_deaths'))
+
+    death_frame = ct.data_cache.get('jhu', 'global_deaths', ct.get_fetch_loader(download_death_time_series,
+                                                                                 'global_deaths'))
+
+    if country == 'all':
+        return death_frame
     else:
-        file_path = ct.jhu_path + 'jhu_death_time_global.csv'
-        file_link = 'https://raw.githubusercontent.com/CSSEGISandData/COVID-19/master/csse_covid_19_data/csse_covid_19_time_series/time_series_covid19_deaths_global.csv'
-        drop_list = ['Lat', 'Long']
+        return death_frame[death_frame['Country_Region'] == country]
 
-    if os.path.exists(file_path):
-        data = pd.read_csv(file_path)
-        newest_date = datetime.strptime(data.columns.to_list()[-1], '%m/%d/%y')
 
-        if newest_date == datetime.now().date():
-            ct.logger.info('Currently downloaded global death time series is up to date. Reading file...')
+def get_us_confirmed_time_series() -> pd.DataFrame:
+    """
+    Returns the U.S county level confirmed cases time series, reading it only once per tracker cycle
+    :return: A DataFrame containing the confirmed cases time series for every U.S county
+    """
+
+    return ct.data_cache.get('jhu', 'us_county_confirmed',
+                             ct.get_fetch_loader(download_us_confirmed_time_series, 'us_county_confirmed'))
 
-            return data
-        else:
-            ct.logger.info('Global death time series data may be out of date! Trying to download new file...')
 
-            newest_csv_req = urllib.request.Request(file_link)
-            csv_file = urllib.request.urlopen(newest_csv_req)
-            csv_data = csv_file.read()
+@metrics.timed
+def download_us_confirmed_time_series(timeout=60) -> pd.DataFrame:
+    """
+    Downloads the U.S county level confirmed cases time series. The file is only downloaded again if it has changed
+    since the saved copy was made
+    :param timeout: How long to wait on the server in seconds. Default is 60
+    :return: A DataFrame containing the confirmed cases time series for every U.S county
+    """
 
-            with open(ct.jhu_path + 'jhu_time_temp.csv', 'wb') as file:
-                file.write(csv_data)
+    file_path = ct.jhu_path + ct.series_files['us_county_confirmed']
+    file_link = ct.jhu_time_series_url + 'time_series_covid19_confirmed_US.csv'
+    drop_list = ['UID', 'iso2', 'iso3', 'code3', 'FIPS', 'Lat', 'Long_', 'Combined_Key']
 
-            death_frame = pd.read_csv(ct.jhu_path + 'jhu_time_temp.csv')
+    ct.logger.info('Checking U.S confirmed time series data for updates')
+    confirmed_frame = fetcher.fetch_frame(file_link, file_path, timeout=timeout,
+                                          prepare=lambda frame: frame.rename(columns={'Admin2': 'City_County'}),
+                                          usecols=lambda column: column not in drop_list,
+                                          dtype={'Admin2': str, 'Province_State': str, 'Country_Region': str},
+                                          save=seriesstore.save_series, load=seriesstore.load_series)
+    ct.logger.info('U.S confirmed time series data is ready!')
 
-            death_frame.drop(columns=drop_list, inplace=True)
-            death_frame.to_csv(file_path)
-            os.remove(ct.jhu_path + 'jhu_time_temp.csv')
+    return confirmed_frame
 
-            ct.logger.info('Succesfully downloaded death time series data!')
 
-            # JHU has some inconsistencies in column naming, so here we patch them up
-            if country == 'all':
-                death_frame.rename(columns={'Province/State': 'Province_State', 'Country/Region':
-                    'Country_Region'}, inplace=True)
-                return death_frame
-            elif country == 'US':
-                death_frame.rename(columns={'Admin2': 'City_County'}, inplace=True)
-                return death_frame
-            else:
-                death_frame.rename(columns={'Province/State': 'Province_State', 'Country/Region':
-                    'Country_Region'}, inplace=True)
-                return death_frame[death_frame['Country_Region'] == country]
+def get_state_series() -> StateSeries:
+    """
+    Returns the daily death and case totals for every U.S state, built only once per tracker cycle
+    :return: A StateSeries
+    """
 
-    ct.logger.info('Global death time series data may be out of date! Trying to download new file...')
+    return ct.data_cache.get('jhu', 'state_series', build_state_series)
 
-    newest_csv_req = urllib.request.Request(file_link)
-    csv_file = urllib.request.urlopen(newest_csv_req)
-    csv_data = csv_file.read()
 
-    with open(ct.jhu_path + 'jhu_time_temp.csv', 'wb') as file:
-        file.write(csv_data)
+@metrics.timed
+def build_state_series() -> StateSeries:
+    """
+    Sums the U.S county level death and confirmed time series by state, one groupby each. States are kept in the order
+    they first appear in the death series
+    :return: A StateSeries. Its dates are those of the death series. Days missing from the confirmed series are zero
+    """
 
-    death_frame = pd.read_csv(ct.jhu_path + 'jhu_time_temp.csv')
+    death_data = get_death_time_series('US')
+    confirmed_data = get_us_confirmed_time_series()
+    dates = get_date_columns(death_data)
 
-    death_frame.drop(columns=drop_list, inplace=True)
-    death_frame.to_csv(file_path)
-    os.remove(ct.jhu_path + 'jhu_time_temp.csv')
+    state_deaths = death_data.groupby('Province_State', sort=False)[['Population'] + dates].sum()
+    state_cases = confirmed_data.groupby('Province_State', sort=False)[get_date_columns(confirmed_data)].sum()
+    state_cases = state_cases.reindex(index=state_deaths.index, columns=dates, fill_value=0)
 
-    ct.logger.info('Succesfully downloaded death time series data!')
+    return StateSeries(states=state_deaths.index.to_list(), dates=dates,
+                       deaths=state_deaths[dates].to_numpy(dtype=np.int64),
+                       cases=state_cases.to_numpy(dtype=np.int64),
+                       population=state_deaths['Population'].to_numpy(dtype=np.int64))
 
-    if country == 'all':
-        return death_frame
-    elif country == 'US':
-        death_frame.rename(columns={'Admin2': 'City_County'}, inplace=True)
-        return death_frame
+
+@metrics.timed
+def download_death_time_series(country='all', timeout=60) -> pd.DataFrame:
+    """
+    Downloads the deaths time series, either the U.S county level file or the global file. The file is only downloaded
+    again if it has changed since the saved copy was made
+    :param: country: Either 'all' for the global file or 'US' for the U.S file. Default is all.
+    :param timeout: How long to wait on the server in seconds. Default is 60
+    :return: A DataFrame containing the death time series
+    """
+
+    if country == 'US':
+        file_path = ct.jhu_path + ct.series_files['us_deaths']
+        file_link = ct.jhu_time_series_url + 'time_series_covid19_deaths_US.csv'
+        drop_list = ['UID', 'iso2', 'iso3', 'code3', 'FIPS', 'Lat', 'Long_', 'Combined_Key']
+        text_columns = {'Admin2': str, 'Province_State': str, 'Country_Region': str}
     else:
-        return death_frame[death_frame['Country_Region'] == country]
+        file_path = ct.jhu_path + ct.series_files['global_deaths']
+        file_link = ct.jhu_time_series_url + 'time_series_covid19_deaths_global.csv'
+        drop_list = ['Lat', 'Long']
+        text_columns = {'Province/State': str, 'Country/Region': str}
+
+    # JHU has some inconsistencies in column naming, so here we patch them up
+    def prepare(death_frame: pd.DataFrame) -> pd.DataFrame:
+        if country == 'US':
+            return death_frame.rename(columns={'Admin2': 'City_County'})
+        else:
+            return death_frame.rename(columns={'Province/State': 'Province_State', 'Country/Region': 'Country_Region'})
+
+    ct.logger.info('Checking death time series data for updates')
+    death_frame = fetcher.fetch_frame(file_link, file_path, prepare=prepare, timeout=timeout,
+                                      usecols=lambda column: column not in drop_list, dtype=text_columns,
+                                      save=seriesstore.save_series, load=seriesstore.load_series)
+    ct.logger.info('Death time series data is ready!')
+
+    return death_frame
 
 
 def find_metric_leader(global_data: pd.DataFrame, inc_US=False, size=1):
@@ -378,7 +415,8 @@ def find_metric_leader(global_data: pd.DataFrame, inc_US=False, size=1):
 
     current_leader = 'NO COUNTRY FOUND'
     newest_column = global_data.columns.to_list()[-1]
-    global_data.sort_values(by=newest_column, ascending=False, inplace=True)
+    # The time series is shared with other consumers for the cycle, so it must not be sorted in place
+    global_data = global_data.sort_values(by=newest_column, ascending=False)
     leader_list = []
 
     for country in global_data['Country_Region']:
@@ -394,59 +432,109 @@ def find_metric_leader(global_data: pd.DataFrame, inc_US=False, size=1):
                     return leader_list
 
 
+def project_days_to_target(current, slope, target, step=0.1):
+    """
+    Solves how long a count growing at a constant daily rate takes to pass a target. Matches stepping forward {step}
+    days at a time until the count is above the target, without the loop. Any argument may be an array, in which case
+    they are broadcast against each other (Ex. one current count per state and several targets)
+    :param current: The count today
+    :param slope: How much the count grows each day
+    :param target: The count to pass
+    :param step: The resolution of the answer in days. Default is 0.1
+    :return: The number of days, rounded to 2 places. 0 if the count is already above the target and -1 if it never gets
+    there because it is not growing
+    """
+
+    current, slope, target = np.broadcast_arrays(np.asarray(current, dtype=np.float64),
+                                                 np.asarray(slope, dtype=np.float64),
+                                                 np.asarray(target, dtype=np.float64))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        steps = np.floor((target - current) / (slope * step)) + 1
+
+    days = np.where(current > target, 0.0, np.round(steps * step, 2))
+    days = np.where((current <= target) & (slope <= 0), -1.0, days)
+
+    return float(days) if days.ndim == 0 else days
+
+
+@metrics.timed
 def get_time_to_target(target=-1, metric_type='cases'):
     """
     Tries to find the amount of time in days it will take for the U.S to arrive at the target number of cases based on
-    the mean change in cases over the past five days
+    the mean change in cases over the past three days. Each series is only read once per call
     :param metric_type: The target type. Either cases or deaths
-    :param target: The target number of cases if using cases.
-    :return:
+    :param target: The target number of cases if using cases. May be an array of targets, which are all solved at once
+    :return: The number of days to each target, 0 if it has been passed, or -1 if it will not be reached. For deaths,
+    the number of days until the U.S passes the country with the most deaths, or -1 if it is not catching up
     """
 
     if metric_type == 'cases':
-        if target == -1:
+        if np.any(np.asarray(target) == -1):
             raise ValueError('Must specify a target if type is set to cases!')
 
         # Since the U.S is now the leader in cases, the time to leader mode for cases has been disabled
         # Slope is calculated from the past three days to prevent skew from earlier time periods
-        us_changes = get_total_daily_change(ct.get_time_series())[-3:]
-        us_slope = np.mean(us_changes)
-        # leader = find_case_leader(global_data)
-        # leader_changes = get_total_daily_change(global_data, 'China')[-5:]
-        # leader_slope = np.mean(leader_changes)
-
-        est_us_cases = get_country_cumulative(ct.get_time_series())[-1]
-        # est_leader_cases = get_country_cumulative(get_global_time_series(), countries=leader)[-1]
-
-        add_days = 0
+        us_totals, us_changes = get_us_totals('cases')
+        us_slope = np.mean(us_changes[-3:])
 
-        while est_us_cases <= target:
-            add_days += 0.1
-            est_us_cases += us_slope * 0.1
-
-        return round(add_days, 2)
+        return project_days_to_target(us_totals[-1], us_slope, target)
     if metric_type == 'deaths':
         # Slope is calculated from the past three days to prevent skew from earlier time periods
-        us_changes = get_total_daily_change(get_death_time_series('US'))[-3:]
-        us_slope = np.mean(us_changes)
-        leader = find_metric_leader(get_death_time_series())
-        leader_changes = get_total_daily_change(get_death_time_series(country=leader), leader)[-3:]
-        leader_slope = np.mean(leader_changes)
-
-        est_us_deaths = get_country_cumulative(get_death_time_series('US'))[-1]
-        est_leader_deaths = get_country_cumulative(get_death_time_series(leader), countries=leader)[-1]
+        us_totals, us_changes = get_us_totals('deaths')
+        us_slope = np.mean(us_changes[-3:])
 
-        add_days = 0
+        global_deaths = get_death_time_series()
+        leader = find_metric_leader(global_deaths)
+        leader_deaths = global_deaths[global_deaths['Country_Region'] == leader]
+        leader_totals = get_daily_totals(leader_deaths)
+        leader_slope = np.mean(np.diff(leader_totals)[-3:])
 
         if leader_slope > us_slope:
             return -1
-        else:
-            while est_us_deaths <= est_leader_deaths:
-                add_days += 0.1
-                est_us_deaths += us_slope * 0.1
-                est_leader_deaths += leader_slope * 0.1
 
-            return round(add_days, 2)
+        # The U.S closes the gap at the difference between the two rates
+        return project_days_to_target(us_totals[-1], us_slope - leader_slope, leader_totals[-1])
+
+
+def get_next_target(current: int, start: int, step: int) -> int:
+    """
+    Finds the first milestone that a count has not passed yet
+    :param current: The count today
+    :param start: The first milestone
+    :param step: The distance between milestones
+    :return: The smallest of start, start + step, start + 2 * step... that current has not passed
+    """
+
+    return start + step * max(0, int(np.ceil((current - start) / step)))
+
+
+@metrics.timed
+def get_state_time_to_target(target, metric='deaths') -> pd.DataFrame:
+    """
+    Projects how long every state will take to reach one or more targets, based on each state's mean change over the
+    past three days. All states and targets are solved in a single call
+    :param target: A target count, or an array of them
+    :param metric: Either cases or deaths. Default is deaths
+    :return: A DataFrame with one row per state and one column per target, holding days as get_time_to_target does
+    """
+
+    if metric not in ['cases', 'deaths']:
+        raise ValueError("'metric' must be either 'cases' or 'deaths'!")
+
+    state_series = get_state_series()
+    totals = getattr(state_series, metric)
+
+    # Three days of changes are needed for the rate. Returning an empty frame here would hide a broken input instead
+    if totals.shape[0] == 0 or totals.shape[1] < 4:
+        raise ValueError(f'Need at least four days of state level {metric} to project from, but the U.S time series '
+                         f'has {totals.shape[0]} states and {totals.shape[1]} days!')
+
+    slopes = np.diff(totals, axis=1)[:, -3:].mean(axis=1)
+    targets = np.atleast_1d(np.asarray(target))
+    days = project_days_to_target(totals[:, -1:], slopes[:, np.newaxis], targets[np.newaxis, :])
+
+    return pd.DataFrame(days, index=state_series.states, columns=targets.tolist())
 
 
 def get_top_states_by_metric(metric: str, size: int) -> [str]:
@@ -457,69 +545,46 @@ def get_top_states_by_metric(metric: str, size: int) -> [str]:
     :return: A list of size 'size' containing the top states for that metric
     """
 
-    if metric == 'cases':
-        data = ct.get_time_series()
-    elif metric == 'deaths':
-        data = get_death_time_series('US')
-    else:
+    if metric not in ['cases', 'deaths']:
         raise ValueError("'metric' must be either 'cases' or 'deaths'!")
 
-    most_recent_column = data.columns.to_list()[-1]
-    states = []
+    state_series = get_state_series()
+    counts = getattr(state_series, metric)
 
-    data.sort_values(ascending=False, by=most_recent_column, inplace=True)
+    if counts.shape[1] == 0:
+        return []
 
-    for state in data['Province_State']:
-        if state not in states and len(states) <= size:
-            states.append(state)
-        if len(states) == size:
-            break
+    # A stable sort keeps ties in the order the states first appear
+    order = np.argsort(-counts[:, -1], kind='stable')[:size]
 
-    return states
+    return [state_series.states[index] for index in order]
 
 
-def make_state_death_plot():
+@metrics.timed
+def get_state_death_inputs(size=10) -> dict:
     """
-    Creates a line plot of the cumulative death total for the top five U.S states
+    Gets the cumulative death total for each day for the top U.S states
+    :param size: How many states to include. Default is 10
+    :return: A dictionary with the list states, the matrix counts holding one row of daily totals per state, and the
+    date the plot is made on
     """
 
-    death_data = get_death_time_series('US')
-    states = get_top_states_by_metric('deaths', 10)
-    state_counts = []
-    relevant_columns = [column for column in death_data.columns.to_list() if '/20' in column]
-    new_states = []
-
-    for state in states:
-        state_data = death_data[death_data['Province_State'] == state]
-        state_data = state_data[relevant_columns]
-
-        temp_state = [state] * len(relevant_columns)
-        new_states += temp_state
-
-        for column in state_data.columns:
-            day_sum = int(state_data[column].sum())
-
-            state_counts.append(day_sum)
+    state_series = get_state_series()
+    states = get_top_states_by_metric('deaths', size)
+    rows = [state_series.states.index(state) for state in states]
 
-    # Have to rearange the data to make it suitable for the plot
-    dates = relevant_columns * len(states)
-    day_num = [num for num in range(len(relevant_columns))] * 10
-    plot_frame = pd.DataFrame({'date': dates, 'state': new_states, 'counts': state_counts, 'day_num': day_num})
+    return {'states': states, 'counts': state_series.deaths[rows], 'date': ct.now.strftime("%m/%d/%y")}
 
-    # Finally start setting up the plot
-    sns.set()
-    sns.lineplot(x='day_num', y='counts', hue='state', data=plot_frame)
 
-    plt.title(f'Daily Death Totals for the Top 10 U.S States by Death Total On {ct.now.strftime("%m/%d/%y")}')
-    plt.xlabel('Days Since 01/22/2020')
-    plt.ylabel('Deaths')
-    plt.gcf().set_size_inches(12, 12)
+def make_state_death_plot():
+    """
+    Creates a line plot of the cumulative death total for the top five U.S states
+    """
 
-    plt.savefig(ct.plot_path + 'death_comp_plot.png')
-    plt.show(block=False)
-    plt.close()
+    render_single_plot('death_comp_plot', get_state_death_inputs())
 
 
+@metrics.timed
 def get_deaths_per_capita(multiplier=100000, size=5) -> list:
     """
     Gets the top n U.S states per multiplier
@@ -528,31 +593,17 @@ def get_deaths_per_capita(multiplier=100000, size=5) -> list:
     :return: A list of the top {n} states per {multiplier}
     """
 
-    death_data = get_death_time_series('US')
-    most_recent_column = death_data.columns.to_list()[-1]
-    states = []
-    combinations = []
-
-    for state in death_data['Province_State']:
-        if state not in states:
-            states.append(state)
-
-    for state in states:
-        state_frame = death_data[death_data['Province_State'] == state]
-        total_pop = int(state_frame['Population'].sum())
-        total_deaths = int(state_frame[most_recent_column].sum())
-
-        if total_pop == 0:
-            pass
-        else:
-            # Per Multiplier
-            death_rate = round((total_deaths / total_pop) * multiplier, 2)
+    state_series = get_state_series()
 
-            combinations.append((state, death_rate))
+    if state_series.deaths.shape[1] == 0:
+        return []
 
-    top_list = sorted(combinations, key=lambda state_pair: state_pair[1], reverse=True)
+    # States without a population, like the cruise ships, have no rate
+    has_population = np.flatnonzero(state_series.population != 0)
+    rates = np.round(state_series.deaths[has_population, -1] / state_series.population[has_population] * multiplier, 2)
+    order = np.argsort(-rates, kind='stable')[:size]
 
-    return top_list[:size]
+    return [(state_series.states[has_population[index]], float(rates[index])) for index in order]
 
 
 def get_top_increasing_by_metric(metric='deaths', size=5) -> list:
@@ -573,102 +624,93 @@ def get_top_increasing_by_metric(metric='deaths', size=5) -> list:
         print(states)
 
 
-def make_per_capita_plot():
+@metrics.timed
+def get_per_capita_inputs() -> dict:
     """
-    Makes a plot of the top five states per capita by deaths
+    Finds the top five states per capita by deaths for the per capita plot
+    :return: A dictionary with the lists states and rates, and the date the plot is made on
     """
 
     top_5 = get_deaths_per_capita()
 
-    # Now for the plotting
-    plot_states = [entry[0] for entry in top_5]
-    plot_rates = [entry[1] for entry in top_5]
+    return {'states': [entry[0] for entry in top_5], 'rates': [entry[1] for entry in top_5],
+            'date': ct.now.strftime("%m/%d/%y")}
+
 
-    plt.gcf().set_size_inches(10, 10)
-    plt.title(f'Top 5 States by Deaths per 100,000 Population on {ct.now.strftime("%m/%d/%y")}')
-    plt.xlabel('State')
-    plt.ylabel('Deaths per 100,000 Population')
-    plt.bar(x=plot_states, height=plot_rates)
+def make_per_capita_plot():
+    """
+    Makes a plot of the top five states per capita by deaths
+    """
 
-    plt.savefig(ct.plot_path + 'capita_plot.png')
-    plt.show(block=False)
-    plt.close()
+    render_single_plot('capita_plot', get_per_capita_inputs())
 
 
-def make_testing_plot():
+@metrics.timed
+def get_testing_inputs() -> dict:
     """
-    Makes a bar plot fo the top five states by tests per 100,000 population
+    Finds the top five states by tests per 100,000 population for the testing plot
+    :return: A dictionary with the lists states, tests and incidence, and the date the plot is made on
     """
 
     test_data = ct.get_jhu_data().sort_values(by='test_rate', ascending=False)
-    plot_states = test_data['state'][:5]
-    plot_tests = test_data['test_rate'][:5]
-    plot_incidence = test_data['incidence'][:5]
 
-    plt.title(f'Top 5 States by Testing Rate and Their Incidence On {ct.now.strftime("%m/%d/%y")}')
-    plt.xlabel('State')
-    plt.ylabel('Measure Per 100,000 Population')
+    return {'states': test_data['state'][:5].tolist(), 'tests': test_data['test_rate'][:5].tolist(),
+            'incidence': test_data['incidence'][:5].tolist(), 'date': ct.now.strftime("%m/%d/%y")}
 
-    test_bar = plt.bar(x=plot_states, height=plot_tests, color='#ffcc00')
-    inc_bar = plt.bar(x=plot_states, height=plot_incidence, color='red')
 
-    plt.gcf().set_size_inches(10, 10)
-    plt.legend((test_bar[0], inc_bar[0]), ('Tests', 'Incidence'), loc='best')
+def make_testing_plot():
+    """
+    Makes a bar plot fo the top five states by tests per 100,000 population
+    """
 
-    plt.savefig(ct.plot_path + 'capita_rate.png')
-    plt.show(block=False)
-    plt.close()
+    render_single_plot('capita_rate', get_testing_inputs())
 
 
 def get_tracking_project_data() -> pd.DataFrame:
+    """
+    Returns historical data from the COVID-19 Tracking Project, downloading it only once per tracker cycle
+    :return: A DataFrame containing the historical data from the COVID-19 Tracking Project
+    """
+
+    return ct.data_cache.get('ctp', 'us_daily', ct.get_fetch_loader(download_tracking_project_data, 'us_daily'))
+
+
+@metrics.timed
+def download_tracking_project_data(timeout=60) -> pd.DataFrame:
     """
     Fetches historical data from the COVID-19 Tracking Project
     https://covidtracking.com/
 
+    :param timeout: How long to wait on the server in seconds. Default is 60
     :return: A DataFrame containing the historical data from the COVID-19 Tracking Project
     """
 
     if os.path.exists(ct.tracking_proj_path) is not True:
         os.mkdir(ct.tracking_proj_path)
 
-    newest_csv_req = urllib.request.Request("https://covidtracking.com/api/v1/us/daily.csv")
-    csv_file = urllib.request.urlopen(newest_csv_req)
-    csv_data = csv_file.read()
-
-    with open(ct.tracking_proj_path + 'historical_data.csv', 'wb') as file:
-        file.write(csv_data)
-
-    tracking_frame = pd.read_csv(ct.tracking_proj_path + 'historical_data.csv')
+    tracking_frame = fetcher.fetch_frame(ct.tracking_project_url, ct.tracking_proj_path + 'historical_data.csv',
+                                         timeout=timeout)
 
     return tracking_frame
 
 
-def make_vent_icu_plot():
+@metrics.timed
+def get_vent_icu_inputs() -> dict:
     """
-    Generates a line plot showing the test positivity rate over time for the US
+    Selects ICU and ventilator usage for the U.S from the COVID-19 Tracking Project data
+    :return: A dictionary with the lists icu and ventilator, one entry per day
     """
 
     data = get_tracking_project_data()
     # Filters for data on or after 03/26/2020 as this is the first date ICU and ventilator data are both available
     data = data[data['date'] >= 20200326]
-    counts = data['inIcuCurrently'].tolist() + data['onVentilatorCurrently'].tolist()
-    count_type = (['ICU'] * len(data['inIcuCurrently'])) + (['Ventilator'] * len(data['onVentilatorCurrently']))
-    # If the array is not converted to a list, the all the elements in the array just get multiplied by 2
-    days = np.arange(0, len(data['date'])).tolist() * 2
-    plot_frame = pd.DataFrame({'day': days,
-                               'counts': counts,
-                               'count_type': count_type})
 
-    sns.set()
-    sns.lineplot(x='day', y='counts', hue='count_type', data=plot_frame)
+    return {'icu': data['inIcuCurrently'].tolist(), 'ventilator': data['onVentilatorCurrently'].tolist()}
 
-    plt.title('Ventilator and ICU Usage for the U.S Since 03/26/2020')
-    plt.xlabel('Days Since 03/26/2020')
-    plt.ylabel('Count')
-
-    plt.gcf().set_size_inches(10, 10)
-    plt.savefig(ct.plot_path + 'vent_icu_plot.png')
-    plt.show(block=False)
-    plt.close()
 
+def make_vent_icu_plot():
+    """
+    Generates a line plot showing the test positivity rate over time for the US
+    """
 
+    render_single_plot('vent_icu_plot', get_vent_icu_inputs())
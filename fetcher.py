@@ -0,0 +1,242 @@
+import io
+import os
+import json
+import time
+import logging
+import urllib.request
+import urllib.error
+from collections import namedtuple
+from datetime import datetime
+
+import pandas as pd
+
+import metrics
+
+logger = logging.getLogger()
+
+# The validators of a completed download, saved so the next request for the same URL can be made conditional
+FetchResult = namedtuple('FetchResult', ['url', 'etag', 'last_modified'])
+
+
+class CountingStream(io.RawIOBase):
+    """
+    Wraps a response so the bytes read from it are counted while it is parsed
+    """
+
+    def __init__(self, stream):
+        super().__init__()
+        self.stream = stream
+        self.bytes_read = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        count = self.stream.readinto(buffer)
+        self.bytes_read += count
+
+        return count
+
+
+def get_meta_path(file_path: str) -> str:
+    """
+    Gets the path of the file holding the HTTP validators for a downloaded file
+    :param file_path: The path of the downloaded file
+    :return: The path of its metadata file, which sits right next to it
+    """
+
+    return file_path + '.meta.json'
+
+
+def load_validators(file_path: str) -> dict:
+    """
+    Loads the ETag and Last-Modified values saved for a downloaded file
+    :param file_path: The path of the downloaded file
+    :return: A dictionary with keys url, etag, last_modified and fetched_at. Empty if nothing was saved
+    """
+
+    meta_path = get_meta_path(file_path)
+
+    if os.path.exists(meta_path) is not True:
+        return {}
+
+    try:
+        with open(meta_path, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError) as error:
+        logger.warning(f'Could not read download metadata {meta_path} because {error}! Ignoring it')
+
+        return {}
+
+
+def save_validators(file_path: str, result: FetchResult):
+    """
+    Saves the ETag and Last-Modified values of a response next to the file its body was saved to. Should only be called
+    once that file has been written successfully
+    :param file_path: The path the downloaded data was saved to
+    :param result: The result of the download
+    """
+
+    data = {'url': result.url, 'etag': result.etag, 'last_modified': result.last_modified,
+            'fetched_at': datetime.now().isoformat()}
+
+    with open(get_meta_path(file_path), 'w') as file:
+        json.dump(data, file)
+
+
+def make_conditional_request(url: str, file_path: str) -> (urllib.request.Request, dict):
+    """
+    Builds a request that asks the server to skip the body if the copy saved at file_path is still current
+    :param url: The URL to download from
+    :param file_path: Where the local copy of this URL is saved. Validators are only sent if this file exists
+    :return: The request and the validators that were attached to it. The validators are empty if none were sent
+    """
+
+    headers = {}
+    validators = load_validators(file_path) if file_path is not None and os.path.exists(file_path) else {}
+
+    # Validators saved for a different URL say nothing about this one
+    if validators.get('url') != url:
+        validators = {}
+
+    if validators.get('etag') is not None:
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified') is not None:
+        headers['If-Modified-Since'] = validators['last_modified']
+
+    return urllib.request.Request(url, headers=headers), validators
+
+
+def probe_url(url: str, timeout=60) -> bool:
+    """
+    Checks whether a file exists on the server with a HEAD request, without downloading it
+    :param url: The URL of the file
+    :param timeout: How long to wait on the server in seconds. Default is 60
+    :return: True if the file exists, False if the server says it does not. Any other error is raised
+    """
+
+    request = urllib.request.Request(url, method='HEAD')
+
+    try:
+        with urllib.request.urlopen(request, timeout=timeout):
+            return True
+    except urllib.error.HTTPError as error:
+        if error.code == 404:
+            return False
+
+        raise
+    except urllib.error.URLError as error:
+        # A file:// URL to a missing file
+        if isinstance(error.reason, FileNotFoundError):
+            return False
+
+        raise
+
+
+def read_saved_frame(file_path: str) -> pd.DataFrame:
+    """
+    Reads a frame saved by fetch_frame
+    :param file_path: The path of the saved frame
+    :return: The saved DataFrame
+    """
+
+    frame = pd.read_csv(file_path)
+
+    # Copies saved by older versions of this program carry the DataFrame index as their first column
+    if len(frame.columns) > 0 and str(frame.columns[0]).startswith('Unnamed: '):
+        frame = frame.drop(columns=frame.columns[0])
+
+    return frame
+
+
+def write_frame(frame: pd.DataFrame, file_path: str):
+    """
+    Saves a frame as a CSV without ever leaving a partially written file at file_path
+    :param frame: The DataFrame to save
+    :param file_path: Where to save it
+    """
+
+    temp_path = file_path + '.tmp'
+    frame.to_csv(temp_path, index=False)
+    os.replace(temp_path, file_path)
+
+
+def fetch_frame(url: str, file_path=None, prepare=None, usecols=None, dtype=None, timeout=60, save=write_frame,
+                load=read_saved_frame) -> pd.DataFrame:
+    """
+    Downloads a CSV and parses it straight from the response without holding the body in memory or writing a temp file
+    :param url: The URL of the CSV
+    :param file_path: Where the prepared frame is saved. If the server reports the saved copy is still current, it is
+    read instead of downloading again. Default is None, which neither reads nor saves a copy
+    :param prepare: A function applied to the parsed frame before it is saved and returned. Default is None
+    :param usecols: The columns to keep while parsing. Same as for pandas.read_csv
+    :param dtype: The types to give columns while parsing. Same as for pandas.read_csv
+    :param timeout: How long to wait on the server in seconds. Default is 60
+    :param save: The function used to save the prepared frame to file_path. Default saves a CSV
+    :param load: The function used to read the frame saved at file_path. Default reads a CSV
+    :return: The parsed and prepared DataFrame
+    """
+
+    request, validators = make_conditional_request(url, file_path)
+
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            stream = CountingStream(response)
+            frame = pd.read_csv(io.BufferedReader(stream), usecols=usecols, dtype=dtype)
+            metrics.add(bytes_read=stream.bytes_read, rows=len(frame))
+            result = FetchResult(url=url, etag=response.headers.get('ETag'),
+                                 last_modified=response.headers.get('Last-Modified'))
+    except urllib.error.HTTPError as error:
+        if error.code == 304 and len(validators) > 0:
+            logger.info(f'{url} has not changed since it was last downloaded. Reading {file_path}...')
+
+            return load(file_path)
+
+        raise
+
+    if prepare is not None:
+        frame = prepare(frame)
+
+    if file_path is None:
+        return frame
+
+    save(frame, file_path)
+    save_validators(file_path, result)
+
+    # Reading back what was saved keeps the data identical whether or not it was downloaded this time
+    return load(file_path)
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Decides whether a failed download is worth trying again
+    :param error: The error the download failed with
+    :return: False for client errors like a missing file, True for network errors, timeouts and server errors
+    """
+
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code >= 500 or error.code == 429
+
+    return isinstance(error, OSError)
+
+
+def retry(function, attempts=3, backoff=2.0, retryable=is_retryable):
+    """
+    Calls a function until it succeeds, waiting longer after each failed attempt
+    :param function: A function taking no arguments
+    :param attempts: How many times to try in total. Default is 3
+    :param backoff: The number of seconds to wait after the first failure. Doubles after every failure. Default is 2
+    :param retryable: A function deciding from an error whether to try again. Default is is_retryable
+    :return: Whatever the function returned
+    """
+
+    for attempt in range(1, attempts + 1):
+        try:
+            return function()
+        except Exception as error:
+            if attempt == attempts or retryable(error) is not True:
+                raise
+
+            wait = backoff * 2 ** (attempt - 1)
+            logger.warning(f'Attempt {attempt} of {attempts} failed because {error}! Trying again in {wait} seconds')
+            time.sleep(wait)
@@ -1,3 +1,5 @@
+import numpy as np
+
 # NOTICE: This class is now deprecated as JHU no longer reports city level data
 
 
@@ -36,6 +38,8 @@ class State:
     A State object to contain cities and state level data
     """
 
+    __slots__ = ('name', 'cases', 'deaths', 'recoveries')
+
     def __init__(self, state_name: str, state_cases: int, state_deaths: int, state_recoveries: int):
         self.name = state_name
         self.cases = int(state_cases)
@@ -61,3 +65,82 @@ class State:
         """Gets the total number of recoveries from each city in the state"""
 
         return self.recoveries
+
+
+class StateTable:
+    """
+    Holds state level data for many states in parallel arrays, with a lookup from state name to position. Iterating
+    over it yields State objects, so it can stand in for a list of them
+    """
+
+    __slots__ = ('names', 'cases', 'deaths', 'recoveries', 'positions')
+
+    def __init__(self, names: list, cases, deaths, recoveries):
+        self.names = list(names)
+        self.cases = np.asarray(cases, dtype=np.int64)
+        self.deaths = np.asarray(deaths, dtype=np.int64)
+        self.recoveries = np.asarray(recoveries, dtype=np.int64)
+        self.positions = {name: position for position, name in enumerate(self.names)}
+
+    @classmethod
+    def from_frame(cls, state_frame):
+        """
+        Builds a table from state level data in a single pass
+        :param state_frame: A DataFrame with the columns state, cases, deaths and recoveries and one row per state
+        :return: A StateTable
+        """
+
+        return cls(state_frame['state'].tolist(), state_frame['cases'].to_numpy(),
+                   state_frame['deaths'].to_numpy(), state_frame['recoveries'].to_numpy())
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.positions
+
+    def __iter__(self):
+        for position in range(len(self.names)):
+            yield self.get_state_at(position)
+
+    def __getitem__(self, key):
+        """Gets a State by its position in the table or by its name, or a list of States for a slice, as a list would"""
+
+        if isinstance(key, str):
+            return self.get_state(key)
+
+        if isinstance(key, slice):
+            return [self.get_state_at(position) for position in range(len(self.names))[key]]
+
+        return self.get_state_at(range(len(self.names))[key])
+
+    def get_state_at(self, position: int) -> State:
+        """Builds the State object for the state at a position in the table"""
+
+        return State(state_name=self.names[position], state_cases=self.cases[position],
+                     state_deaths=self.deaths[position], state_recoveries=self.recoveries[position])
+
+    def get_state(self, name: str) -> State:
+        """Builds the State object for a state. Raises a KeyError if the state is not in the table"""
+
+        return self.get_state_at(self.positions[name])
+
+    def get_names(self) -> list:
+        """Returns the name of every state in the table"""
+
+        return self.names
+
+    def get_cases(self, name: str) -> int:
+        """Gets the number of cases for a state"""
+
+        return int(self.cases[self.positions[name]])
+
+    def get_deaths(self, name: str) -> int:
+        """Gets the number of deaths for a state"""
+
+        return int(self.deaths[self.positions[name]])
+
+    def get_recoveries(self, name: str) -> int:
+        """Gets the number of recoveries for a state"""
+
+        return int(self.recoveries[self.positions[name]])
@@ -0,0 +1,199 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from types import SimpleNamespace
+
+import fetcher
+import metrics
+
+logger = logging.getLogger()
+
+# Twitter only accepts a media ID in a tweet for a day after the media was uploaded. Cached IDs are dropped earlier
+# than that so one is never used just as it expires
+media_validity = 60 * 60 * 20
+
+# media_id is None if the upload failed. latency is in seconds and is 0 for an ID taken from the cache
+UploadResult = namedtuple('UploadResult', ['file_path', 'media_id', 'latency', 'cached', 'error'])
+
+
+class StubAPI:
+    """
+    Stands in for the tweepy API object when testing or when nothing should be posted. Records every call instead of
+    making it, and can be made to wait or fail like the real API
+    """
+
+    def __init__(self, latency=0.0, failures=0):
+        """
+        :param latency: How many seconds every call takes. Default is 0
+        :param failures: How many media uploads fail with a server error before they start succeeding. Default is 0
+        """
+
+        self.latency = latency
+        self.failures = failures
+        self.uploads = []
+        self.statuses = []
+        self.lock = threading.Lock()
+
+    def media_upload(self, filename: str):
+        time.sleep(self.latency)
+
+        with self.lock:
+            if self.failures > 0:
+                self.failures -= 1
+
+                raise ConnectionError(f'Stub upload of {filename} failed')
+
+            self.uploads.append(filename)
+
+            return SimpleNamespace(media_id=len(self.uploads))
+
+    def update_status(self, status: str, media_ids=None, in_reply_to_status_id=None):
+        time.sleep(self.latency)
+
+        with self.lock:
+            self.statuses.append({'status': status, 'media_ids': list(media_ids or []),
+                                  'in_reply_to_status_id': in_reply_to_status_id})
+
+            return SimpleNamespace(id=len(self.statuses))
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Decides whether a failed upload is worth trying again
+    :param error: The error the upload failed with
+    :return: True for rate limits, server errors and network errors
+    """
+
+    status_code = getattr(getattr(error, 'response', None), 'status_code', None)
+
+    if status_code is not None:
+        return status_code >= 500 or status_code == 429
+
+    return isinstance(error, OSError)
+
+
+def get_file_hash(file_path: str) -> str:
+    """Fingerprints the content of a file"""
+
+    digest = hashlib.sha256()
+
+    with open(file_path, 'rb') as file:
+        for block in iter(partial(file.read, 1 << 16), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def load_media_cache(cache_path: str) -> dict:
+    """
+    Loads the media IDs of files that were uploaded before
+    :param cache_path: The path of the cache
+    :return: A dictionary mapping the hash of each uploaded file to its media ID and the time it was uploaded at
+    """
+
+    if cache_path is None or os.path.exists(cache_path) is not True:
+        return {}
+
+    try:
+        with open(cache_path, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError) as error:
+        logger.warning(f'Could not read media cache {cache_path} because {error}! Uploading every file')
+
+        return {}
+
+
+def save_media_cache(cache_path: str, cache: dict):
+    """Replaces the media cache in one step"""
+
+    with open(cache_path + '.tmp', 'w') as file:
+        json.dump(cache, file, indent=2, sort_keys=True)
+
+    os.replace(cache_path + '.tmp', cache_path)
+
+
+def upload_file(api, file_path: str, attempts=3, backoff=2.0) -> UploadResult:
+    """
+    Uploads one file, trying again on rate limits, server errors and network errors
+    :param api: A tweepy API object or a StubAPI
+    :param file_path: The file to upload
+    :param attempts: How many times to try in total. Default is 3
+    :param backoff: The number of seconds to wait after the first failure. Doubles after every failure. Default is 2
+    :return: An UploadResult. If every attempt failed, media_id is None and error holds the last error
+    """
+
+    start = time.perf_counter()
+
+    try:
+        response = fetcher.retry(partial(api.media_upload, file_path), attempts=attempts, backoff=backoff,
+                                 retryable=is_retryable)
+    except Exception as error:
+        logger.error(f'Could not upload {file_path} because {error}!')
+
+        return UploadResult(file_path=file_path, media_id=None, latency=time.perf_counter() - start, cached=False,
+                            error=error)
+
+    return UploadResult(file_path=file_path, media_id=response.media_id, latency=time.perf_counter() - start,
+                        cached=False, error=None)
+
+
+def upload_media(api, file_paths: [str], workers=4, attempts=3, backoff=2.0, cache_path=None,
+                 validity=media_validity) -> [UploadResult]:
+    """
+    Uploads several files at once. A file whose exact content was uploaded less than validity seconds ago reuses its
+    media ID instead of being uploaded again
+    :param api: A tweepy API object or a StubAPI
+    :param file_paths: The files to upload
+    :param workers: The most uploads to run at the same time. Keeps bursts within the API's rate limits. Default is 4
+    :param attempts: How many times to try each upload in total. Default is 3
+    :param backoff: The number of seconds to wait after the first failure of an upload. Doubles after every failure.
+    Default is 2
+    :param cache_path: Where media IDs are kept between runs. Default is None, which uploads every file
+    :param validity: How many seconds a cached media ID can be used for. Default is 20 hours
+    :return: An UploadResult for each file, in the same order as file_paths
+    """
+
+    cache = load_media_cache(cache_path)
+    current_time = time.time()
+    hashes = {file_path: get_file_hash(file_path) for file_path in file_paths}
+    results = {}
+
+    for file_path, file_hash in hashes.items():
+        entry = cache.get(file_hash)
+
+        if entry is not None and current_time - entry['uploaded_at'] < validity:
+            results[file_path] = UploadResult(file_path=file_path, media_id=entry['media_id'], latency=0.0, cached=True,
+                                              error=None)
+
+    pending = [file_path for file_path in hashes if file_path not in results]
+
+    with ThreadPoolExecutor(max_workers=max(min(workers, len(pending)), 1)) as executor:
+        uploads = executor.map(partial(upload_file, api, attempts=attempts, backoff=backoff), pending)
+
+        for result in uploads:
+            results[result.file_path] = result
+
+            if result.media_id is not None:
+                cache[hashes[result.file_path]] = {'media_id': result.media_id, 'uploaded_at': current_time}
+
+    for result in results.values():
+        if result.cached:
+            logger.info(f'Reused the media ID of {result.file_path}')
+        elif result.media_id is not None:
+            logger.info(f'Uploaded {result.file_path} in {result.latency:.2f} seconds')
+
+        if result.cached is not True:
+            metrics.record_stage('media_upload', result.latency)
+
+    if cache_path is not None:
+        # Expired entries are dropped so the cache only ever holds about one set of plots
+        save_media_cache(cache_path, {file_hash: entry for file_hash, entry in cache.items()
+                                      if current_time - entry['uploaded_at'] < validity})
+
+    return [results[file_path] for file_path in file_paths]
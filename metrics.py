@@ -0,0 +1,184 @@
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, where peak memory is left out
+    resource = None
+
+logger = logging.getLogger()
+
+# Totals for every stage run since the last reset, by stage name
+stages = {}
+lock = threading.Lock()
+
+# The stages currently running in each thread, innermost last, so bytes and rows are counted against the right one
+active = threading.local()
+
+metric_prefix = 'coronatracker'
+
+# The name, type and help text of each metric in the Prometheus export, by the stage field it is read from
+prometheus_metrics = {'calls': ('stage_calls', 'gauge', 'Times each stage ran during the last cycle'),
+                      'seconds': ('stage_seconds', 'gauge', 'Wall time spent in each stage during the last cycle'),
+                      'bytes': ('stage_bytes', 'gauge', 'Bytes downloaded by each stage during the last cycle'),
+                      'rows': ('stage_rows', 'gauge', 'Rows parsed or returned by each stage during the last cycle'),
+                      'peak_rss_bytes': ('stage_peak_rss_bytes', 'gauge',
+                                         'Peak resident memory of the process by the end of each stage')}
+
+
+def get_peak_rss() -> int:
+    """
+    Gets the most memory the process has held at once so far
+    :return: The peak resident set size in bytes, or 0 if it cannot be read on this platform
+    """
+
+    if resource is None:
+        return 0
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports kilobytes and macOS reports bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def reset():
+    """Clears every stage. Called at the start of each cycle"""
+
+    with lock:
+        stages.clear()
+
+
+def record_stage(name: str, seconds: float, bytes_read=0, rows=0):
+    """
+    Adds one run of a stage to its totals
+    :param name: The name of the stage. Ex. download_jhu_data
+    :param seconds: How long the run took
+    :param bytes_read: How many bytes the run downloaded. Default is 0
+    :param rows: How many rows the run parsed or returned. Default is 0
+    """
+
+    peak_rss = get_peak_rss()
+
+    with lock:
+        totals = stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'bytes': 0, 'rows': 0, 'peak_rss_bytes': 0})
+        totals['calls'] += 1
+        totals['seconds'] += seconds
+        totals['bytes'] += bytes_read
+        totals['rows'] += rows
+        totals['peak_rss_bytes'] = max(totals['peak_rss_bytes'], peak_rss)
+
+
+def add(bytes_read=0, rows=0):
+    """
+    Counts bytes or rows against the innermost stage running in this thread. Does nothing outside of a stage
+    :param bytes_read: How many bytes were downloaded. Default is 0
+    :param rows: How many rows were parsed. Default is 0
+    """
+
+    running = getattr(active, 'stages', [])
+
+    if len(running) > 0:
+        running[-1]['bytes'] += bytes_read
+        running[-1]['rows'] += rows
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Times the code inside a with block as a stage
+    :param name: The name of the stage
+    :return: A dictionary of the bytes and rows counted so far. Adding to it counts against this stage
+    """
+
+    if hasattr(active, 'stages') is not True:
+        active.stages = []
+
+    counts = {'bytes': 0, 'rows': 0}
+    active.stages.append(counts)
+    start = time.perf_counter()
+
+    try:
+        yield counts
+    finally:
+        active.stages.pop()
+        record_stage(name, time.perf_counter() - start, bytes_read=counts['bytes'], rows=counts['rows'])
+
+
+def timed(function):
+    """
+    Decorates a function so every call to it is timed as a stage named after it. If it returns a DataFrame or an
+    array, its number of rows is counted too
+    """
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        with stage(function.__name__) as counts:
+            result = function(*args, **kwargs)
+            shape = getattr(result, 'shape', None)
+
+            if shape is not None and len(shape) > 0 and counts['rows'] == 0:
+                counts['rows'] = shape[0]
+
+            return result
+
+    return wrapper
+
+
+def get_stats() -> dict:
+    """
+    Gets the totals of every stage run since the last reset
+    :return: A dictionary mapping each stage name to its calls, seconds, bytes, rows and peak_rss_bytes
+    """
+
+    with lock:
+        return {name: dict(totals) for name, totals in stages.items()}
+
+
+def export(jsonl_path: str, prometheus_path: str, cycle_started_at, cycle_seconds: float):
+    """
+    Writes the stages of a finished cycle out. One JSON line per stage is appended to jsonl_path, and
+    prometheus_path is replaced with the same numbers in the Prometheus text format
+    :param jsonl_path: The JSON lines file to append to
+    :param prometheus_path: The Prometheus text file to replace
+    :param cycle_started_at: A datetime of when the cycle started
+    :param cycle_seconds: How long the whole cycle took
+    """
+
+    stats = get_stats()
+    cycle = cycle_started_at.isoformat()
+
+    with open(jsonl_path, 'a') as file:
+        for name, totals in sorted(stats.items()):
+            file.write(json.dumps({'cycle': cycle, 'stage': name, **totals}) + '\n')
+
+        file.write(json.dumps({'cycle': cycle, 'stage': 'cycle', 'calls': 1, 'seconds': cycle_seconds,
+                               'peak_rss_bytes': get_peak_rss()}) + '\n')
+
+    lines = [f'# HELP {metric_prefix}_cycle_seconds Wall time of the last cycle',
+             f'# TYPE {metric_prefix}_cycle_seconds gauge',
+             f'{metric_prefix}_cycle_seconds {cycle_seconds:.6f}',
+             f'# HELP {metric_prefix}_cycle_timestamp_seconds When the last cycle started, in seconds since the epoch',
+             f'# TYPE {metric_prefix}_cycle_timestamp_seconds gauge',
+             f'{metric_prefix}_cycle_timestamp_seconds {cycle_started_at.timestamp():.0f}']
+
+    for field, (metric, metric_type, description) in prometheus_metrics.items():
+        lines.append(f'# HELP {metric_prefix}_{metric} {description}')
+        lines.append(f'# TYPE {metric_prefix}_{metric} {metric_type}')
+
+        for name, totals in sorted(stats.items()):
+            lines.append(f'{metric_prefix}_{metric}{{stage="{name}"}} {totals[field]}')
+
+    with open(prometheus_path + '.tmp', 'w') as file:
+        file.write('\n'.join(lines) + '\n')
+
+    os.replace(prometheus_path + '.tmp', prometheus_path)
+
+    logger.info('Cycle stages: ' + ', '.join(f'{name} {totals["seconds"]:.2f}s'
+                                            for name, totals in sorted(stats.items())))
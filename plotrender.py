@@ -0,0 +1,363 @@
+import os
+import json
+import time
+import hashlib
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+from matplotlib.figure import Figure
+import seaborn as sns
+import numpy as np
+import pandas as pd
+
+import metrics
+
+logger = logging.getLogger()
+
+# These plots are drawn with seaborn's default theme, the rest with matplotlib's defaults
+seaborn_plots = ['comp_plot', 'death_comp_plot', 'capita_plot', 'capita_rate', 'vent_icu_plot']
+
+
+def render_summary_bar(inputs: dict, file_path: str):
+    """
+    Draws the stacked bar plot of cases, deaths and recoveries for the top states by caseload
+    :param inputs: A dictionary with the lists states, cases, deaths and recoveries
+    :param file_path: Where to save the plot
+    """
+
+    fig = Figure(figsize=(14, 14))
+    ax = fig.subplots()
+    pos = np.arange(len(inputs['states']))
+    width = 0.9
+
+    fig.suptitle('COVID-19 Details for the United States')
+
+    case_bar = ax.bar(pos, inputs['cases'], width, label='Cases')
+    death_bar = ax.bar(pos, inputs['deaths'], width, label='Deaths')
+    recov_bar = ax.bar(pos, inputs['recoveries'], width, bottom=inputs['deaths'], label='Recoveries')
+
+    ax.set_xlabel('State')
+    ax.set_ylabel('Count')
+    ax.set_title(f'Confirmed COVID-19 Case Statistics for the Top 25 States by Caseload')
+    ax.set_xticks(pos)
+    ax.set_xticklabels(inputs['states'], fontsize=10, rotation=45)
+    ax.legend((case_bar[0], death_bar[0], recov_bar[0]), ('Cases', 'Deaths', 'Recoveries'), loc='upper right')
+
+    fig.savefig(file_path)
+
+
+def render_time_series(inputs: dict, file_path: str):
+    """
+    Draws the cumulative cases for each day on a standard and a natural log scale
+    :param inputs: A dictionary with the list freqs, the number of cases for each day of the outbreak
+    :param file_path: Where to save the plot
+    """
+
+    freqs = np.asarray(inputs['freqs'], dtype=np.float64)
+    days = np.arange(start=1, stop=len(freqs) + 1)
+    fig = Figure(figsize=(12, 10))
+    reg_ax, log_ax = fig.subplots(1, 2)
+
+    fig.suptitle('Cumulative Cases per Day in the United States (Standard Scale and Natural Log)')
+
+    reg_ax.plot(days, freqs, color='red')
+    reg_ax.set_xlabel('Days Since 01/21/2020')
+    reg_ax.set_ylabel('Number of cases')
+
+    log_ax.plot(days, np.log(freqs), color='red')
+    log_ax.set_xlabel('Days Since 01/21/2020')
+    log_ax.set_ylabel('Number of cases (Natural Log Scale)')
+
+    fig.savefig(file_path)
+
+
+def render_daily_change(inputs: dict, file_path: str):
+    """
+    Draws the daily change in cases
+    :param inputs: A dictionary with the list changes, the change in cases for each day
+    :param file_path: Where to save the plot
+    """
+
+    fig = Figure(figsize=(12, 12))
+    ax = fig.subplots()
+
+    ax.plot(np.arange(1, stop=len(inputs['changes']) + 1), inputs['changes'], color='red')
+
+    ax.set_title('Daily Change in Cases Since 01/22/2020')
+    ax.set_xlabel('Days since 01/22/2020')
+    ax.set_ylabel('Change in Cases from Previous Day')
+
+    fig.savefig(file_path)
+
+
+def render_comparison(inputs: dict, file_path: str):
+    """
+    Draws the cumulative cases of the U.S next to other countries
+    :param inputs: A dictionary with the list countries and the list cumulative_cases holding the cumulative number of
+    cases for each day for each of those countries
+    :param file_path: Where to save the plot
+    """
+
+    change_dict = {country: list(change) for country, change in zip(inputs['countries'], inputs['cumulative_cases'])}
+    change_frame = pd.DataFrame(change_dict).melt(var_name='country', value_name='cases')
+    change_frame['day'] = np.arange(start=0, stop=len(change_dict['US'])).tolist() * len(change_dict)
+
+    fig = Figure(figsize=(12, 12))
+    ax = fig.subplots()
+
+    sns.lineplot(x='day', y='cases', hue='country', data=change_frame, ax=ax)
+
+    ax.set_title('Cumulative Cases in the Top 10 Countries by Cases Globally')
+    ax.set_xlabel('Days since 01/22/2020')
+    ax.set_ylabel('Cumulative Cases')
+
+    fig.savefig(file_path)
+
+
+def render_state_deaths(inputs: dict, file_path: str):
+    """
+    Draws the cumulative death total for each day for the top states
+    :param inputs: A dictionary with the list states, the matrix counts holding one row of daily totals per state, and
+    the date the plot is made on
+    :param file_path: Where to save the plot
+    """
+
+    counts = np.asarray(inputs['counts'])
+    days = counts.shape[1] if counts.ndim == 2 else 0
+    plot_frame = pd.DataFrame({'state': np.repeat(inputs['states'], days), 'counts': counts.ravel(),
+                               'day_num': np.tile(np.arange(days), len(inputs['states']))})
+
+    fig = Figure(figsize=(12, 12))
+    ax = fig.subplots()
+
+    sns.lineplot(x='day_num', y='counts', hue='state', data=plot_frame, ax=ax)
+
+    ax.set_title(f'Daily Death Totals for the Top 10 U.S States by Death Total On {inputs["date"]}')
+    ax.set_xlabel('Days Since 01/22/2020')
+    ax.set_ylabel('Deaths')
+
+    fig.savefig(file_path)
+
+
+def render_per_capita(inputs: dict, file_path: str):
+    """
+    Draws the top states by deaths per 100,000 population
+    :param inputs: A dictionary with the lists states and rates, and the date the plot is made on
+    :param file_path: Where to save the plot
+    """
+
+    fig = Figure(figsize=(10, 10))
+    ax = fig.subplots()
+
+    ax.set_title(f'Top 5 States by Deaths per 100,000 Population on {inputs["date"]}')
+    ax.set_xlabel('State')
+    ax.set_ylabel('Deaths per 100,000 Population')
+    ax.bar(x=inputs['states'], height=inputs['rates'])
+
+    fig.savefig(file_path)
+
+
+def render_testing(inputs: dict, file_path: str):
+    """
+    Draws the top states by tests per 100,000 population next to their incidence
+    :param inputs: A dictionary with the lists states, tests and incidence, and the date the plot is made on
+    :param file_path: Where to save the plot
+    """
+
+    fig = Figure(figsize=(10, 10))
+    ax = fig.subplots()
+
+    ax.set_title(f'Top 5 States by Testing Rate and Their Incidence On {inputs["date"]}')
+    ax.set_xlabel('State')
+    ax.set_ylabel('Measure Per 100,000 Population')
+
+    test_bar = ax.bar(x=inputs['states'], height=inputs['tests'], color='#ffcc00')
+    inc_bar = ax.bar(x=inputs['states'], height=inputs['incidence'], color='red')
+
+    ax.legend((test_bar[0], inc_bar[0]), ('Tests', 'Incidence'), loc='best')
+
+    fig.savefig(file_path)
+
+
+def render_vent_icu(inputs: dict, file_path: str):
+    """
+    Draws ventilator and ICU usage over time
+    :param inputs: A dictionary with the lists icu and ventilator, one entry per day
+    :param file_path: Where to save the plot
+    """
+
+    icu = list(inputs['icu'])
+    ventilator = list(inputs['ventilator'])
+    plot_frame = pd.DataFrame({'day': list(range(len(icu))) + list(range(len(ventilator))),
+                               'counts': icu + ventilator,
+                               'count_type': ['ICU'] * len(icu) + ['Ventilator'] * len(ventilator)})
+
+    fig = Figure(figsize=(10, 10))
+    ax = fig.subplots()
+
+    sns.lineplot(x='day', y='counts', hue='count_type', data=plot_frame, ax=ax)
+
+    ax.set_title('Ventilator and ICU Usage for the U.S Since 03/26/2020')
+    ax.set_xlabel('Days Since 03/26/2020')
+    ax.set_ylabel('Count')
+
+    fig.savefig(file_path)
+
+
+renderers = {'state_sum': render_summary_bar, 'rate_plot': render_time_series, 'change_plot': render_daily_change,
+             'comp_plot': render_comparison, 'death_comp_plot': render_state_deaths,
+             'capita_plot': render_per_capita, 'capita_rate': render_testing, 'vent_icu_plot': render_vent_icu}
+
+
+def render_plot(name: str, inputs: dict, file_path: str) -> str:
+    """
+    Renders a single plot. Each plot starts from the same style no matter what was drawn before it, so a plot comes out
+    the same whether it is rendered here or in a worker process
+    :param name: The name of the plot. Must be a key of renderers
+    :param inputs: The data the plot is drawn from
+    :param file_path: Where to save the plot
+    :return: The name of the plot
+    """
+
+    with matplotlib.rc_context():
+        matplotlib.rcdefaults()
+
+        if name in seaborn_plots:
+            sns.set_theme()
+
+        renderers[name](inputs, file_path)
+
+    return name
+
+
+def render_timed_plot(name: str, inputs: dict, file_path: str) -> (str, float):
+    """
+    Renders a single plot and times it. Worker processes cannot record metrics for this process, so the time is
+    handed back instead
+    :return: The name of the plot and how many seconds it took to render
+    """
+
+    start = time.perf_counter()
+    render_plot(name, inputs, file_path)
+
+    return name, time.perf_counter() - start
+
+
+def update_fingerprint(digest, value):
+    """
+    Feeds a plot input into a hash. Arrays are hashed by their raw bytes so large inputs stay cheap to fingerprint
+    :param digest: A hashlib object
+    :param value: The input to add. May be a dictionary, list, tuple, array or a plain value
+    """
+
+    if isinstance(value, dict):
+        for key in sorted(value.keys()):
+            digest.update(repr(key).encode())
+            update_fingerprint(digest, value[key])
+    elif isinstance(value, (list, tuple, np.ndarray)):
+        array = np.asarray(value) if isinstance(value, np.ndarray) or len(value) > 0 else np.zeros(0)
+
+        # Ragged or mixed inputs become object arrays and are hashed one entry at a time instead
+        if array.dtype.kind in 'biufU':
+            digest.update(f'{array.dtype.str}{array.shape}'.encode())
+            digest.update(np.ascontiguousarray(array).tobytes())
+        else:
+            digest.update(f'list{len(value)}'.encode())
+
+            for entry in value:
+                update_fingerprint(digest, entry)
+    else:
+        digest.update(repr(value).encode())
+
+
+def get_fingerprint(name: str, inputs: dict) -> str:
+    """
+    Fingerprints the data a plot is drawn from
+    :param name: The name of the plot
+    :param inputs: The data the plot is drawn from
+    :return: A hex digest that changes whenever the inputs or the plotting libraries change
+    """
+
+    digest = hashlib.sha256()
+    digest.update(f'{name}|{matplotlib.__version__}|{sns.__version__}'.encode())
+    update_fingerprint(digest, inputs)
+
+    return digest.hexdigest()
+
+
+def load_manifest(manifest_path: str) -> dict:
+    """
+    Loads the fingerprints of the plots that were last rendered
+    :param manifest_path: The path of the manifest
+    :return: A dictionary mapping the name of each plot to the fingerprint of its inputs. Empty if there is no manifest
+    """
+
+    if manifest_path is None or os.path.exists(manifest_path) is not True:
+        return {}
+
+    try:
+        with open(manifest_path, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError) as error:
+        logger.warning(f'Could not read plot manifest {manifest_path} because {error}! Rendering every plot')
+
+        return {}
+
+
+def save_manifest(manifest_path: str, manifest: dict):
+    """Replaces the plot manifest in one step"""
+
+    with open(manifest_path + '.tmp', 'w') as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+
+def render_plots(jobs: dict, plot_path: str, processes=None, manifest_path=None) -> [str]:
+    """
+    Renders several plots, each in its own worker process. If a manifest is given, plots whose inputs have the same
+    fingerprint as when they were last rendered are skipped and their existing files are kept
+    :param jobs: A dictionary mapping the name of each plot to its inputs
+    :param plot_path: The directory to save the plots in. Each is saved as its name with a .png extension
+    :param processes: How many worker processes to use. Default is one per CPU. If 1, plots are rendered one after
+    another in this process
+    :param manifest_path: Where the fingerprints of rendered plots are kept. Default is None, which renders every plot
+    :return: The names of the plots that were rendered
+    """
+
+    manifest = load_manifest(manifest_path)
+    fingerprints = {name: get_fingerprint(name, inputs) for name, inputs in jobs.items()}
+    pending = {name: inputs for name, inputs in jobs.items()
+               if manifest.get(name) != fingerprints[name] or os.path.exists(plot_path + name + '.png') is not True}
+
+    for name in jobs.keys():
+        if name not in pending:
+            logger.info(f'Inputs for {name} have not changed. Keeping the existing plot')
+
+    rendered = []
+
+    try:
+        if processes == 1 or len(pending) <= 1:
+            for name, inputs in pending.items():
+                _, seconds = render_timed_plot(name, inputs, plot_path + name + '.png')
+                metrics.record_stage('plot_' + name, seconds)
+                rendered.append(name)
+                manifest[name] = fingerprints[name]
+        else:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                futures = [executor.submit(render_timed_plot, name, inputs, plot_path + name + '.png')
+                           for name, inputs in pending.items()]
+
+                for future in futures:
+                    name, seconds = future.result()
+                    metrics.record_stage('plot_' + name, seconds)
+                    rendered.append(name)
+                    manifest[name] = fingerprints[name]
+                    logger.info(f'Rendered {name}')
+    finally:
+        # Plots that did render are recorded even if another one failed
+        if manifest_path is not None and len(rendered) > 0:
+            save_manifest(manifest_path, manifest)
+
+    return rendered
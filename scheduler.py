@@ -0,0 +1,120 @@
+import time
+import random
+import logging
+from collections import namedtuple, deque
+from datetime import datetime
+
+logger = logging.getLogger()
+
+# One run of a job. did_work is whatever the job returned, or False if it failed
+CycleRecord = namedtuple('CycleRecord', ['started_at', 'duration', 'succeeded', 'did_work'])
+
+
+class Scheduler:
+    """
+    Runs a job over and over in a loop, one cycle at a time. Cycles start interval seconds apart plus a random jitter,
+    and after a failed cycle the next one waits longer each time until one succeeds. Only the most recent cycles are
+    remembered, so a scheduler can run forever in constant memory
+    """
+
+    def __init__(self, interval: float, jitter=0.0, failure_delay=60.0, max_failure_delay=None, history_size=48,
+                 sleep=time.sleep):
+        """
+        :param interval: The number of seconds from the start of one successful cycle to the start of the next
+        :param jitter: The most seconds to randomly add to each wait, so cycles do not always hit the sources at the
+        same time. Default is 0
+        :param failure_delay: The number of seconds to wait after the first failed cycle in a row. Doubles with each
+        failure after it. Default is 60
+        :param max_failure_delay: The longest wait after a failed cycle. Default is interval
+        :param history_size: How many cycles to remember. Default is 48
+        :param sleep: The function used to wait. Default is time.sleep
+        """
+
+        self.interval = interval
+        self.jitter = jitter
+        self.failure_delay = failure_delay
+        self.max_failure_delay = max_failure_delay if max_failure_delay is not None else interval
+        self.history = deque(maxlen=history_size)
+        self.failures = 0
+        self.sleep = sleep
+
+    def get_delay(self, duration: float) -> float:
+        """
+        Works out how long to wait before the next cycle
+        :param duration: How long the last cycle took in seconds
+        :return: The number of seconds to wait
+        """
+
+        if self.failures > 0:
+            delay = min(self.failure_delay * 2 ** (self.failures - 1), self.max_failure_delay)
+        else:
+            delay = max(self.interval - duration, 0.0)
+
+        return delay + random.uniform(0, self.jitter)
+
+    def run_once(self, job) -> CycleRecord:
+        """
+        Runs a single cycle of a job. An error in the job is logged and counted as a failed cycle instead of raised
+        :param job: A function taking no arguments. Should return True if it did any work
+        :return: A record of the cycle
+        """
+
+        started_at = datetime.now()
+        start = time.monotonic()
+
+        try:
+            did_work = bool(job())
+            self.failures = 0
+            succeeded = True
+        except Exception as error:
+            logger.exception(f'Cycle failed because {error}!')
+            self.failures += 1
+            did_work = False
+            succeeded = False
+
+        record = CycleRecord(started_at=started_at, duration=time.monotonic() - start, succeeded=succeeded,
+                             did_work=did_work)
+        self.history.append(record)
+
+        logger.info(f'Cycle finished in {record.duration:.2f} seconds. Succeeded: {succeeded}, did work: {did_work}')
+
+        return record
+
+    def run(self, job, cycles=None):
+        """
+        Runs a job in a loop until it has run the given number of cycles
+        :param job: A function taking no arguments. Should return True if it did any work
+        :param cycles: How many cycles to run. Default is None, which runs until interrupted
+        """
+
+        count = 0
+
+        while cycles is None or count < cycles:
+            record = self.run_once(job)
+            count += 1
+
+            if cycles is not None and count >= cycles:
+                break
+
+            delay = self.get_delay(record.duration)
+
+            print(f'Sleeping now for {delay / 60:.1f} minutes! Will check for new data afterwards...')
+            logger.info(f'Waiting {delay:.0f} seconds before the next cycle')
+            self.sleep(delay)
+
+    def get_stats(self) -> dict:
+        """
+        Summarizes the cycles the scheduler remembers
+        :return: A dictionary with the number of cycles, how many failed or did work, and their mean, longest and most
+        recent duration in seconds
+        """
+
+        durations = [record.duration for record in self.history]
+
+        if len(durations) == 0:
+            return {'cycles': 0}
+
+        return {'cycles': len(durations), 'failed': sum(record.succeeded is not True for record in self.history),
+                'did_work': sum(record.did_work for record in self.history),
+                'mean_duration': sum(durations) / len(durations), 'max_duration': max(durations),
+                'last_duration': durations[-1]}
@@ -0,0 +1,369 @@
+import os
+import re
+import json
+import zlib
+import shutil
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger()
+
+# Time series columns are named by date in month/day/year form (Ex. 1/22/20)
+date_column_pattern = re.compile(r'^\d{1,2}/\d{1,2}/\d{2}$')
+
+count_dtype = np.int32
+
+# How many times a reader looks at the header again when a writer replaced the data files while it was reading them
+load_attempts = 3
+
+
+def get_date_columns(data: pd.DataFrame) -> [str]:
+    """
+    Finds the columns of a JHU time series DataFrame that hold daily counts
+    :param data: A DataFrame containing time series data
+    :return: The names of the date columns (Ex. 1/22/20), in the order they appear in the data
+    """
+
+    return [column for column in data.columns.to_list() if date_column_pattern.match(str(column))]
+
+
+def get_base_path(store_path: str) -> str:
+    """Gets the path the data files of a store are named after. Ex. jhu_data/jhu_time"""
+
+    return store_path[:-len('.json')] if store_path.endswith('.json') else store_path
+
+
+def get_store_paths(store_path: str, header=None) -> (str, str):
+    """
+    Gets the paths of the files that make up a store besides its header
+    :param store_path: The path of the store's header file. Ex. jhu_data/jhu_time.json
+    :param header: The header of the store, which names the data files it describes. Default is None, which gives the
+    unversioned names used by stores written before the data files were versioned
+    :return: The paths of the region table and of the count matrix
+    """
+
+    if header is not None and 'counts_file' in header:
+        directory = os.path.dirname(store_path)
+
+        return os.path.join(directory, header['regions_file']), os.path.join(directory, header['counts_file'])
+
+    base_path = get_base_path(store_path)
+
+    return base_path + '.regions.csv', base_path + '.counts.bin'
+
+
+def get_version_paths(store_path: str, version: int) -> (str, str):
+    """
+    Gets the paths of one version of the data files of a store
+    :param store_path: The path of the store's header file
+    :param version: The version of the data files
+    :return: The paths of the region table and of the count matrix
+    """
+
+    base_path = get_base_path(store_path)
+
+    return f'{base_path}.regions.{version}.csv', f'{base_path}.counts.{version}.bin'
+
+
+def set_version(header: dict, store_path: str, version: int) -> (str, str):
+    """
+    Points a header at a version of the store's data files
+    :param header: The header to change
+    :param store_path: The path of the store's header file
+    :param version: The version of the data files
+    :return: The paths of the region table and of the count matrix of that version
+    """
+
+    regions_path, counts_path = get_version_paths(store_path, version)
+    header.update({'version': version, 'regions_file': os.path.basename(regions_path),
+                   'counts_file': os.path.basename(counts_path)})
+
+    return regions_path, counts_path
+
+
+def remove_old_versions(store_path: str, header: dict):
+    """
+    Deletes the data files of a store that its header no longer points to. A reader that already has one of them open
+    keeps working, and one that has only read the old header reads the new one and tries again
+    :param store_path: The path of the store's header file
+    :param header: The store's current header
+    """
+
+    directory = os.path.dirname(store_path) or '.'
+    prefix = os.path.basename(get_base_path(store_path))
+    pattern = re.compile(re.escape(prefix) + r'\.(regions(\.\d+)?\.csv|counts(\.\d+)?\.bin)$')
+    current = [os.path.basename(path) for path in get_store_paths(store_path, header)]
+
+    for file in os.listdir(directory):
+        if pattern.match(file) and file not in current:
+            try:
+                os.remove(os.path.join(directory, file))
+            except OSError as error:
+                # Windows will not delete a file another process has mapped. It is tried again after the next write
+                logger.warning(f'Could not remove old store file {file} because {error}!')
+
+
+def load_header(store_path: str) -> dict:
+    """
+    Reads the header of a store
+    :param store_path: The path of the store's header file
+    :return: A dictionary with the dates held in the store and the number of regions. Empty if there is no store
+    """
+
+    if os.path.exists(store_path) is not True:
+        return {}
+
+    with open(store_path, 'r') as file:
+        return json.load(file)
+
+
+def get_regions_checksum(regions: pd.DataFrame) -> str:
+    """
+    Fingerprints the region table of a series so a later download can tell if its rows are still the same
+    :param regions: The non-date columns of a time series DataFrame
+    :return: A hex digest of the region table
+    """
+
+    row_hashes = pd.util.hash_pandas_object(regions, index=False).to_numpy()
+
+    return format(zlib.crc32(row_hashes.tobytes()) ^ zlib.crc32(','.join(map(str, regions.columns)).encode()), '08x')
+
+
+def get_row_checksums(counts: np.ndarray) -> [int]:
+    """
+    Fingerprints each date of a count matrix
+    :param counts: A date by region matrix of counts
+    :return: A checksum for each date
+    """
+
+    return [zlib.crc32(row.tobytes()) for row in counts]
+
+
+def get_daily_changes(totals: np.ndarray, dates: [int]) -> dict:
+    """
+    Calculates the daily change for some dates from the daily totals
+    :param totals: The total count across all regions for each date
+    :param dates: The indexes of the dates to calculate the change for
+    :return: A dictionary mapping each date index to its change. The first date has nothing behind it, so its change is
+    its total
+    """
+
+    return {index: int(totals[index]) - (int(totals[index - 1]) if index > 0 else 0) for index in dates}
+
+
+def get_region_dtypes(regions: pd.DataFrame) -> dict:
+    """
+    Gets the types the region columns of a series are read back with
+    :param regions: The non-date columns of a time series DataFrame
+    :return: A dictionary mapping each column to str for text, or to the name of its numeric type
+    """
+
+    return {column: 'str' if dtype.kind in 'OSU' else dtype.name for column, dtype in regions.dtypes.items()}
+
+
+def write_header(store_path: str, header: dict):
+    """Replaces a store's header in one step"""
+
+    with open(store_path + '.tmp', 'w') as file:
+        json.dump(header, file)
+
+    os.replace(store_path + '.tmp', store_path)
+
+
+def can_append(header: dict, regions_checksum: str, dates: [str]) -> bool:
+    """
+    Checks whether a downloaded series only adds or revises dates of the series already in a store
+    :param header: The header of the existing store
+    :param regions_checksum: The checksum of the downloaded series' region table
+    :param dates: The dates of the downloaded series
+    :return: True if the store can be updated in place
+    """
+
+    if header.get('regions_checksum') != regions_checksum or 'checksums' not in header:
+        return False
+
+    return dates[:len(header['dates'])] == header['dates']
+
+
+def save_series(frame: pd.DataFrame, store_path: str):
+    """
+    Saves a time series DataFrame as a table of its region columns plus a dense date by region matrix of counts. If the
+    store already holds the same regions, only new dates are appended and only dates whose checksums changed are
+    rewritten. The total and daily change for each date are kept up to date in the header the same way
+    :param frame: A DataFrame containing time series data
+    :param store_path: The path of the store's header file. Ex. jhu_data/jhu_time.json
+    """
+
+    dates = get_date_columns(frame)
+    region_columns = [column for column in frame.columns.to_list() if column not in dates]
+    regions = frame[region_columns]
+    regions_checksum = get_regions_checksum(regions)
+
+    # Stored date by region so that a new day is a new block at the end of the file
+    counts = np.ascontiguousarray(frame[dates].fillna(0).to_numpy(dtype=count_dtype).T)
+    checksums = get_row_checksums(counts)
+    header = load_header(store_path)
+
+    region_dtypes = get_region_dtypes(regions)
+
+    if len(header) > 0 and os.path.exists(get_store_paths(store_path, header)[1]) and \
+            can_append(header, regions_checksum, dates):
+        if 'region_dtypes' not in header:
+            # Stores written before region types were kept learn them from the next download of the same regions
+            header['region_dtypes'] = region_dtypes
+            write_header(store_path, header)
+
+        append_series(store_path, header, dates, counts, checksums)
+
+        return
+
+    totals = counts.sum(axis=1, dtype=np.int64)
+    changes = get_daily_changes(totals, range(len(dates)))
+    new_header = {'dates': dates, 'regions': len(frame), 'region_columns': region_columns,
+                  'region_dtypes': region_dtypes, 'dtype': np.dtype(count_dtype).name,
+                  'regions_checksum': regions_checksum, 'checksums': checksums, 'totals': totals.tolist(),
+                  'changes': [changes[index] for index in range(len(dates))]}
+
+    # The data goes to files no header points to yet, so replacing the header is the only step readers can see
+    regions_path, counts_path = set_version(new_header, store_path, header.get('version', 0) + 1)
+    regions.to_csv(regions_path, index=False)
+    counts.tofile(counts_path)
+
+    write_header(store_path, new_header)
+    remove_old_versions(store_path, new_header)
+
+    logger.info(f'Saved {len(dates)} dates for {len(frame)} regions to {store_path}')
+
+
+def append_series(store_path: str, header: dict, dates: [str], counts: np.ndarray, checksums: [int]):
+    """
+    Updates a store with a newer download of the same series. New dates are appended to the count matrix in place, past
+    the end of what the current header describes, so readers are not affected. Revising a date writes a new version of
+    the data files instead, since a reader may have the current one mapped
+    :param store_path: The path of the store's header file
+    :param header: The header of the existing store
+    :param dates: The dates of the downloaded series. The store's dates must be a prefix of these
+    :param counts: The date by region matrix of the downloaded series
+    :param checksums: The checksum of each date of the downloaded series
+    """
+
+    regions_path, counts_path = get_store_paths(store_path, header)
+    old_count = len(header['dates'])
+    row_bytes = header['regions'] * np.dtype(header['dtype']).itemsize
+    revised = [index for index in range(old_count) if header['checksums'][index] != checksums[index]]
+    added = list(range(old_count, len(dates)))
+
+    if len(revised) == 0 and len(added) == 0:
+        logger.info(f'{store_path} already holds every date in this download')
+
+        return
+
+    if len(revised) > 0:
+        new_regions_path, new_counts_path = set_version(header, store_path, header.get('version', 0) + 1)
+        shutil.copyfile(regions_path, new_regions_path)
+        shutil.copyfile(counts_path, new_counts_path)
+        counts_path = new_counts_path
+
+    with open(counts_path, 'r+b') as file:
+        for index in revised:
+            file.seek(index * row_bytes)
+            file.write(counts[index].tobytes())
+
+        # Drops anything an interrupted append may have left past the dates the header knows about
+        file.truncate(old_count * row_bytes)
+        file.seek(old_count * row_bytes)
+        file.write(counts[old_count:].tobytes())
+
+    totals = np.asarray(header['totals'] + [0] * len(added), dtype=np.int64)
+
+    for index in revised + added:
+        totals[index] = counts[index].sum(dtype=np.int64)
+
+    # A revised date also moves the change of the date after it
+    touched = sorted(set(revised + added + [index + 1 for index in revised if index + 1 < len(dates)]))
+    changes = header['changes'] + [0] * len(added)
+
+    for index, change in get_daily_changes(totals, touched).items():
+        changes[index] = change
+
+    header.update({'dates': dates, 'checksums': checksums, 'totals': totals.tolist(), 'changes': changes})
+    write_header(store_path, header)
+
+    if len(revised) > 0:
+        remove_old_versions(store_path, header)
+
+    logger.info(f'Appended {len(added)} new dates and rewrote {len(revised)} revised dates in {store_path}')
+
+
+def load_matrix(store_path: str, mode='r') -> (pd.DataFrame, [str], np.ndarray):
+    """
+    Loads a store without copying its counts into memory
+    :param store_path: The path of the store's header file
+    :param mode: How the counts are mapped. Either r for read only, or c for copy on write, where changes stay in this
+    process and are never written back to the file. Default is r
+    :return: The region table, the list of dates, and a memory mapped matrix of counts with one row per date and one
+    column per region
+    """
+
+    for attempt in range(load_attempts):
+        header = load_header(store_path)
+        regions_path, counts_path = get_store_paths(store_path, header)
+        shape = (len(header['dates']), header['regions'])
+
+        try:
+            # Text columns are read as text, so region names and codes that look like numbers keep their spelling.
+            # Stores written before region types were kept fall back to letting pandas guess
+            regions = pd.read_csv(regions_path, dtype=header.get('region_dtypes'))
+
+            if shape[0] * shape[1] == 0:
+                counts = np.zeros(shape, dtype=header['dtype'])
+            else:
+                counts = np.memmap(counts_path, dtype=header['dtype'], mode=mode, shape=shape)
+
+            return regions, header['dates'], counts
+        except FileNotFoundError:
+            # A writer swapped in a new version after the header was read. The new header points at files that exist
+            if attempt == load_attempts - 1:
+                raise
+
+            logger.info(f'{store_path} was replaced while it was being read. Reading it again...')
+
+
+def load_series(store_path: str) -> pd.DataFrame:
+    """
+    Loads a store as a time series DataFrame laid out like the JHU sheets, with region columns followed by one column
+    per date. The date columns are backed by the store's memory map, copy on write, so the counts are only read from
+    disk as they are used and are not copied unless the DataFrame is changed or consolidated
+    :param store_path: The path of the store's header file
+    :return: A DataFrame containing the time series data
+    """
+
+    regions, dates, counts = load_matrix(store_path, mode='c')
+    frame = pd.DataFrame(counts.T, columns=dates, index=regions.index, copy=False)
+
+    # Inserting the region columns one at a time keeps the counts in their own block. pd.concat would copy them
+    for position, column in enumerate(regions.columns):
+        frame.insert(position, column, regions[column])
+
+    return frame
+
+
+def load_totals(store_path: str) -> (np.ndarray, np.ndarray):
+    """
+    Loads the total count across all regions and its daily change for each date in a store, without reading its counts
+    :param store_path: The path of the store's header file
+    :return: An array of totals and an array of daily changes, one entry per date
+    """
+
+    header = load_header(store_path)
+
+    if 'totals' not in header:
+        # Stores written before totals were tracked have to be summed once
+        _, dates, counts = load_matrix(store_path)
+        totals = np.asarray(counts).sum(axis=1, dtype=np.int64)
+
+        return totals, np.diff(totals, prepend=0)
+
+    return np.asarray(header['totals'], dtype=np.int64), np.asarray(header['changes'], dtype=np.int64)
@@ -0,0 +1,499 @@
+import os
+import re
+import gzip
+import json
+import sqlite3
+import hashlib
+import logging
+from collections import namedtuple
+from contextlib import closing
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger()
+
+# How each source's snapshots are keyed and which columns hold their counts
+snapshot_keys = {'jhu': 'state', 'cdc': 'measure'}
+snapshot_metrics = {'jhu': ['cases', 'deaths', 'recoveries'], 'cdc': ['counts']}
+
+# added and removed are lists of keys. deltas has one row per key in either snapshot and one column per metric
+SnapshotDiff = namedtuple('SnapshotDiff', ['added', 'removed', 'deltas'])
+
+# One saved snapshot as recorded in the index. taken_at is a datetime, content_hash may be None for back-filled entries
+SnapshotEntry = namedtuple('SnapshotEntry', ['source', 'taken_at', 'path', 'content_hash'])
+
+# Snapshots are saved as <source>_<year>_<month>_<day>_<hour>_<minute>_<second>.csv. Older copies have no year
+snapshot_name_pattern = re.compile(r'^(?P<source>[a-z]+)_(?:(?P<year>\d{4})_)?(?P<month>\d{1,2})_(?P<day>\d{1,2})_'
+                                   r'(?P<hour>\d{1,2})_(?P<minute>\d{1,2})_(?P<second>\d{1,2})\.csv$')
+snapshot_time_format = '%Y_%m_%d_%H_%M_%S'
+
+# Snapshots are kept as deltas in gzipped JSON lines chunks. Each chunk starts with a full copy of its first snapshot,
+# so rebuilding any snapshot only ever reads one chunk. Indexed paths point into a chunk as <chunk path>#<position>
+history_chunk_name = '{source}_history_{taken_at}.jsonl.gz'
+
+
+def normalize_snapshot(data: pd.DataFrame, source: str) -> pd.DataFrame:
+    """
+    Reduces a snapshot to its counts, one row per key. Works the same on freshly downloaded data and data read back
+    from a CSV with its index column
+    :param data: A snapshot of JHU or CDC data
+    :param source: The source of the data. Valid inputs are cdc or jhu
+    :return: A DataFrame indexed by state (jhu) or measure (cdc), sorted by that index, with integer count columns
+    """
+
+    key = snapshot_keys[source]
+    metrics = snapshot_metrics[source]
+
+    if data.empty:
+        return pd.DataFrame(columns=metrics, dtype=np.int64, index=pd.Index([], name=key))
+
+    counts = data[[key] + metrics].copy()
+    counts[metrics] = counts[metrics].apply(pd.to_numeric, errors='coerce').fillna(0)
+
+    return counts.groupby(key, sort=True)[metrics].sum().astype(np.int64)
+
+
+def get_snapshot_hash(data: pd.DataFrame, source: str) -> str:
+    """
+    Fingerprints the content of a snapshot. Two snapshots with the same counts for the same keys get the same hash, no
+    matter their row order or whether they were read from a CSV
+    :param data: A snapshot of JHU or CDC data
+    :param source: The source of the data. Valid inputs are cdc or jhu
+    :return: A hex digest of the snapshot's content
+    """
+
+    counts = normalize_snapshot(data, source)
+    digest = hashlib.sha256()
+
+    digest.update(','.join(counts.index.astype(str)).encode())
+    digest.update(np.ascontiguousarray(counts.to_numpy(dtype=np.int64)).tobytes())
+
+    return digest.hexdigest()
+
+
+def has_changed(recent_data: pd.DataFrame, prev_data: pd.DataFrame, source: str) -> bool:
+    """
+    Checks whether two snapshots differ in any key or count
+    :param recent_data: The most recently fetched data
+    :param prev_data: The data to compare to
+    :param source: The source of the data. Valid inputs are cdc or jhu
+    :return: True if anything changed
+    """
+
+    return get_snapshot_hash(recent_data, source) != get_snapshot_hash(prev_data, source)
+
+
+def diff_snapshots(recent_data: pd.DataFrame, prev_data: pd.DataFrame, source='jhu') -> SnapshotDiff:
+    """
+    Compares two snapshots key by key
+    :param recent_data: The most recently fetched data
+    :param prev_data: The data to compare to
+    :param source: The source of the data. Valid inputs are cdc or jhu. Default is jhu
+    :return: A SnapshotDiff. Keys missing from one of the snapshots count as zero in its deltas
+    """
+
+    recent = normalize_snapshot(recent_data, source)
+    prev = normalize_snapshot(prev_data, source)
+    keys = recent.index.union(prev.index)
+
+    deltas = recent.reindex(keys, fill_value=0) - prev.reindex(keys, fill_value=0)
+
+    return SnapshotDiff(added=recent.index.difference(prev.index).to_list(),
+                        removed=prev.index.difference(recent.index).to_list(), deltas=deltas)
+
+
+def get_snapshot_name(source: str, taken_at: datetime) -> str:
+    """
+    Names the file a snapshot is saved to
+    :param source: The source of the data. Ex. jhu
+    :param taken_at: When the snapshot was taken
+    :return: The file name. Ex. jhu_2020_05_01_13_30_00.csv
+    """
+
+    return f'{source}_{taken_at.strftime(snapshot_time_format)}.csv'
+
+
+def parse_snapshot_name(file_path: str):
+    """
+    Reads when a snapshot was taken from its file name. Names saved before the year was included get the year of the
+    file's modification time, or the year before if that would put the snapshot in the future
+    :param file_path: The path of a snapshot file
+    :return: The source and the datetime it was taken at, or None if the file is not a snapshot
+    """
+
+    match = snapshot_name_pattern.match(os.path.basename(file_path))
+
+    if match is None:
+        return None
+
+    parts = {key: int(value) for key, value in match.groupdict().items() if key not in ('source', 'year')}
+
+    if match.group('year') is not None:
+        return match.group('source'), datetime(int(match.group('year')), **parts)
+
+    modified = datetime.fromtimestamp(os.path.getmtime(file_path))
+    taken_at = datetime(modified.year, **parts)
+
+    if taken_at > modified + timedelta(days=1):
+        taken_at = taken_at.replace(year=modified.year - 1)
+
+    return match.group('source'), taken_at
+
+
+def open_index(index_path: str) -> sqlite3.Connection:
+    """
+    Opens the snapshot index, creating it if it does not exist yet
+    :param index_path: The path of the SQLite file holding the index
+    :return: An open connection. The caller is responsible for closing it
+    """
+
+    connection = sqlite3.connect(index_path)
+    connection.execute('CREATE TABLE IF NOT EXISTS snapshots (source TEXT NOT NULL, taken_at TEXT NOT NULL, '
+                       'path TEXT NOT NULL UNIQUE, content_hash TEXT)')
+    connection.execute('CREATE INDEX IF NOT EXISTS snapshots_by_time ON snapshots (source, taken_at)')
+
+    return connection
+
+
+def make_entry(row: tuple) -> SnapshotEntry:
+    """Turns a row of the index into a SnapshotEntry"""
+
+    return SnapshotEntry(source=row[0], taken_at=datetime.fromisoformat(row[1]), path=row[2], content_hash=row[3])
+
+
+def record_snapshot(index_path: str, source: str, taken_at: datetime, path: str, content_hash=None):
+    """
+    Adds a saved snapshot to the index, replacing any entry for the same path
+    :param index_path: The path of the SQLite file holding the index
+    :param source: The source of the data. Ex. jhu
+    :param taken_at: When the snapshot was taken
+    :param path: Where the snapshot was saved
+    :param content_hash: The snapshot's hash from get_snapshot_hash. Default is None, which means not known yet
+    """
+
+    with closing(open_index(index_path)) as connection, connection:
+        connection.execute('INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?)',
+                           (source, taken_at.isoformat(), path, content_hash))
+
+
+def forget_snapshot(index_path: str, path: str):
+    """Removes a snapshot from the index, for example because its file is gone"""
+
+    with closing(open_index(index_path)) as connection, connection:
+        connection.execute('DELETE FROM snapshots WHERE path = ?', (path,))
+
+
+def split_snapshot_path(path: str) -> (str, int):
+    """
+    Splits the path of an indexed snapshot into the file holding it and its position in that file
+    :param path: A path from the snapshot index
+    :return: The file path and the position inside the history chunk, or None as the position for a CSV snapshot
+    """
+
+    file_path, separator, position = path.rpartition('#')
+
+    if separator == '' or position.isdigit() is not True:
+        return path, None
+
+    return file_path, int(position)
+
+
+def snapshot_exists(path: str) -> bool:
+    """Checks whether the file holding an indexed snapshot is still there"""
+
+    return os.path.exists(split_snapshot_path(path)[0])
+
+
+def read_chunk(chunk_path: str) -> [dict]:
+    """
+    Reads every record of a history chunk
+    :param chunk_path: The path of the chunk
+    :return: The records, oldest first. Empty if the chunk does not exist
+    """
+
+    if os.path.exists(chunk_path) is not True:
+        return []
+
+    with gzip.open(chunk_path, 'rt') as file:
+        return [json.loads(line) for line in file if line.strip() != '']
+
+
+def write_chunk(chunk_path: str, records: [dict]):
+    """Replaces a history chunk in one step, so a reader never sees it half written"""
+
+    temp_path = chunk_path + '.tmp'
+
+    with gzip.open(temp_path, 'wt') as file:
+        for record in records:
+            file.write(json.dumps(record) + '\n')
+
+    os.replace(temp_path, chunk_path)
+
+
+def replay_chunk(records: [dict], position: int) -> dict:
+    """
+    Rebuilds a snapshot from the records of its chunk
+    :param records: The records of a history chunk
+    :param position: The position of the snapshot to rebuild
+    :return: A dictionary mapping each key to its list of counts
+    """
+
+    counts = {}
+
+    for record in records[:position + 1]:
+        if record['keyframe']:
+            counts = {}
+
+        for key in record['removed']:
+            counts.pop(key, None)
+
+        for key, changes in record['counts'].items():
+            previous = counts.get(key, [0] * len(changes))
+            counts[key] = [count + change for count, change in zip(previous, changes)]
+
+    return counts
+
+
+def make_record(counts: pd.DataFrame, previous, taken_at: datetime) -> dict:
+    """
+    Describes a snapshot relative to the one before it
+    :param counts: The snapshot, as returned by normalize_snapshot
+    :param previous: The snapshot before it, as returned by replay_chunk. None to store a full copy instead
+    :param taken_at: When the snapshot was taken
+    :return: A record holding the change in counts of every key that changed or was added, and the keys that were removed
+    """
+
+    current = {str(key): [int(count) for count in row] for key, row in zip(counts.index, counts.to_numpy())}
+
+    if previous is None:
+        return {'taken_at': taken_at.isoformat(), 'keyframe': True, 'counts': current, 'removed': []}
+
+    changes = {}
+
+    for key, row in current.items():
+        delta = [count - old for count, old in zip(row, previous.get(key, [0] * len(row)))]
+
+        if key not in previous or any(delta):
+            changes[key] = delta
+
+    return {'taken_at': taken_at.isoformat(), 'keyframe': False, 'counts': changes,
+            'removed': [key for key in previous if key not in current]}
+
+
+def get_latest_history_entry(index_path: str, source: str):
+    """Finds the most recent snapshot of a source that is kept in a history chunk, or None if there is none"""
+
+    with closing(open_index(index_path)) as connection:
+        row = connection.execute("SELECT source, taken_at, path, content_hash FROM snapshots WHERE source = ? AND "
+                                 "path LIKE '%#%' ORDER BY taken_at DESC LIMIT 1", (source,)).fetchone()
+
+    return make_entry(row) if row is not None else None
+
+
+def save_snapshot(data: pd.DataFrame, source: str, directory: str, index_path: str, taken_at: datetime,
+                  chunk_size=48) -> str:
+    """
+    Adds a snapshot to the newest history chunk of its source as a delta from the snapshot before it, and records it
+    in the index. A new chunk is started once the newest one holds chunk_size snapshots
+    :param data: A snapshot of JHU or CDC data
+    :param source: The source of the data. Valid inputs are cdc or jhu
+    :param directory: The directory the history chunks are kept in
+    :param index_path: The path of the SQLite file holding the index
+    :param taken_at: When the snapshot was taken. Must not be older than the newest snapshot already in a chunk
+    :param chunk_size: The most snapshots to keep in one chunk. Default is 48
+    :return: The indexed path of the snapshot
+    """
+
+    counts = normalize_snapshot(data, source)
+    latest = get_latest_history_entry(index_path, source)
+    chunk_path, position = split_snapshot_path(latest.path) if latest is not None else (None, None)
+    records = read_chunk(chunk_path)[:position + 1] if position is not None else []
+
+    if len(records) == 0 or len(records) >= chunk_size:
+        chunk_path = os.path.join(directory, history_chunk_name.format(source=source,
+                                                                       taken_at=taken_at.strftime(snapshot_time_format)))
+        records = [make_record(counts, None, taken_at)]
+    else:
+        records.append(make_record(counts, replay_chunk(records, position), taken_at))
+
+    write_chunk(chunk_path, records)
+
+    path = f'{chunk_path}#{len(records) - 1}'
+    record_snapshot(index_path, source, taken_at, path, get_snapshot_hash(data, source))
+
+    return path
+
+
+def load_snapshot(path: str, source: str) -> pd.DataFrame:
+    """
+    Loads an indexed snapshot
+    :param path: The path of the snapshot from the index
+    :param source: The source of the data. Valid inputs are cdc or jhu
+    :return: The snapshot. Snapshots rebuilt from a history chunk hold one row per key and only the count columns
+    """
+
+    chunk_path, position = split_snapshot_path(path)
+
+    if position is None:
+        return pd.read_csv(path)
+
+    key = snapshot_keys[source]
+    metrics = snapshot_metrics[source]
+    counts = replay_chunk(read_chunk(chunk_path), position)
+    frame = pd.DataFrame([[name] + row for name, row in counts.items()], columns=[key] + metrics)
+
+    return frame.astype({metric: np.int64 for metric in metrics}).sort_values(key, ignore_index=True)
+
+
+def compact_snapshots(index_path: str, source: str, directory: str, chunk_size=48) -> int:
+    """
+    Moves snapshots saved as separate CSVs into history chunks and deletes the CSVs
+    :param index_path: The path of the SQLite file holding the index
+    :param source: The source of the data. Valid inputs are cdc or jhu
+    :param directory: The directory the history chunks are kept in
+    :param chunk_size: The most snapshots to keep in one chunk. Default is 48
+    :return: The number of snapshots that were moved
+    """
+
+    latest = get_latest_history_entry(index_path, source)
+    moved = 0
+
+    for entry in list_snapshots(index_path, source):
+        if split_snapshot_path(entry.path)[1] is not None:
+            continue
+
+        # Chunks only grow forward in time, so a CSV older than what they already hold has to stay as it is
+        if latest is not None and entry.taken_at < latest.taken_at:
+            logger.warning(f'Snapshot {entry.path} is older than the snapshot history! Leaving it in place')
+
+            continue
+
+        save_snapshot(pd.read_csv(entry.path), source, directory, index_path, entry.taken_at, chunk_size)
+        forget_snapshot(index_path, entry.path)
+        os.remove(entry.path)
+        moved += 1
+
+    if moved > 0:
+        logger.info(f'Moved {moved} {source} snapshots into the snapshot history')
+
+    return moved
+
+
+def prune_snapshots(index_path: str, source: str, cutoff: datetime) -> int:
+    """
+    Deletes the snapshot files of a source whose newest snapshot is older than cutoff. The file holding the latest
+    snapshot is always kept
+    :param index_path: The path of the SQLite file holding the index
+    :param source: The source of the data. Valid inputs are cdc or jhu
+    :param cutoff: Snapshots taken before this time may be deleted
+    :return: The number of snapshots removed from the index
+    """
+
+    entries = list_snapshots(index_path, source)
+
+    if len(entries) == 0:
+        return 0
+
+    newest = {}
+
+    for entry in entries:
+        newest[split_snapshot_path(entry.path)[0]] = entry.taken_at
+
+    latest_file = split_snapshot_path(entries[-1].path)[0]
+    expired = [file for file, taken_at in newest.items() if taken_at < cutoff and file != latest_file]
+    removed = 0
+
+    with closing(open_index(index_path)) as connection, connection:
+        for file in expired:
+            removed += connection.execute("DELETE FROM snapshots WHERE path = ? OR path LIKE ? || '#%'",
+                                          (file, file)).rowcount
+
+            if os.path.exists(file):
+                os.remove(file)
+
+    if removed > 0:
+        logger.info(f'Removed {removed} {source} snapshots taken before {cutoff} from the snapshot history')
+
+    return removed
+
+
+def index_directory(index_path: str, source: str, directory: str) -> int:
+    """
+    Records every snapshot in a directory that is not in the index yet. Only needed once for snapshots saved before
+    the index existed
+    :param index_path: The path of the SQLite file holding the index
+    :param source: The source of the data. Only snapshots of this source are recorded
+    :param directory: The directory to look for snapshots in
+    :return: The number of snapshots added to the index
+    """
+
+    if os.path.isdir(directory) is not True:
+        return 0
+
+    with closing(open_index(index_path)) as connection, connection:
+        known = {row[0] for row in connection.execute('SELECT path FROM snapshots WHERE source = ?', (source,))}
+        rows = []
+
+        for file in os.listdir(directory):
+            path = os.path.join(directory, file)
+            parsed = parse_snapshot_name(path) if path not in known else None
+
+            if parsed is not None and parsed[0] == source:
+                rows.append((source, parsed[1].isoformat(), path, None))
+
+        connection.executemany('INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?)', rows)
+
+    if len(rows) > 0:
+        logger.info(f'Added {len(rows)} existing {source} snapshots in {directory} to the snapshot index')
+
+    return len(rows)
+
+
+def get_latest_snapshot(index_path: str, source: str):
+    """
+    Finds the most recent snapshot of a source
+    :param index_path: The path of the SQLite file holding the index
+    :param source: The source of the data. Ex. jhu
+    :return: A SnapshotEntry, or None if no snapshot of this source has been recorded
+    """
+
+    return get_snapshot_as_of(index_path, source, None)
+
+
+def get_snapshot_as_of(index_path: str, source: str, when):
+    """
+    Finds the snapshot of a source that was current at a point in time
+    :param index_path: The path of the SQLite file holding the index
+    :param source: The source of the data. Ex. jhu
+    :param when: A datetime. The latest snapshot taken at or before it is returned. None means the latest overall
+    :return: A SnapshotEntry, or None if there is no snapshot that old
+    """
+
+    query = 'SELECT source, taken_at, path, content_hash FROM snapshots WHERE source = ?'
+    parameters = (source,)
+
+    if when is not None:
+        query += ' AND taken_at <= ?'
+        parameters += (when.isoformat(),)
+
+    with closing(open_index(index_path)) as connection:
+        row = connection.execute(query + ' ORDER BY taken_at DESC LIMIT 1', parameters).fetchone()
+
+    return make_entry(row) if row is not None else None
+
+
+def list_snapshots(index_path: str, source: str) -> [SnapshotEntry]:
+    """
+    Lists every recorded snapshot of a source
+    :param index_path: The path of the SQLite file holding the index
+    :param source: The source of the data. Ex. jhu
+    :return: The snapshots, oldest first
+    """
+
+    with closing(open_index(index_path)) as connection:
+        rows = connection.execute('SELECT source, taken_at, path, content_hash FROM snapshots WHERE source = ? '
+                                  'ORDER BY taken_at', (source,)).fetchall()
+
+    return [make_entry(row) for row in rows]
@@ -0,0 +1,340 @@
+import os
+import re
+import sys
+import time
+import random
+import logging
+import argparse
+import threading
+from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+logger = logging.getLogger()
+
+# Only single byte ranges are supported, which is all a resumed download asks for
+range_pattern = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# How many times a second a slow body is written to, so throttled downloads still trickle in steadily
+slow_body_writes_per_second = 10
+
+
+class StandInServer(ThreadingHTTPServer):
+    """
+    Serves a fixture directory over HTTP in place of JHU's GitHub repository and the COVID Tracking Project's API.
+    Supports ETag and Last-Modified validators, HEAD and byte range requests, and can add latency, errors and slow
+    bodies to its responses so the tracker can be run against a bad network
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address: (str, int), root: str, latency=0.0, jitter=0.0, error_rate=0.0, error_status=503,
+                 bytes_per_second=None, seed=None):
+        """
+        :param address: The host and port to listen on
+        :param root: The fixture directory. Laid out the same as for coronatracker.use_fixtures
+        :param latency: Seconds to wait before answering each request. Default is 0
+        :param jitter: The most seconds to randomly add to the latency. Default is 0
+        :param error_rate: The chance from 0 to 1 of answering a request with error_status instead. Default is 0
+        :param error_status: The HTTP status of injected errors. Default is 503
+        :param bytes_per_second: Throttles response bodies to this speed. Default is None, which does not throttle
+        :param seed: Seeds the random latency and errors. Default is None
+        """
+
+        super().__init__(address, StandInHandler)
+        self.root = os.path.realpath(root)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.bytes_per_second = bytes_per_second
+        self.random = random.Random(seed)
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def get_delay(self) -> float:
+        """
+        Works out how long to hold the next response
+        :return: The number of seconds to wait
+        """
+
+        with self.lock:
+            return self.latency + self.random.uniform(0, self.jitter)
+
+    def should_fail(self) -> bool:
+        """
+        Decides whether the next response is an injected error
+        :return: True if it should be
+        """
+
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+    def count(self, status: int):
+        """
+        Counts a response by its status, for the summary printed on shutdown
+        :param status: The HTTP status sent
+        """
+
+        with self.lock:
+            self.counts[int(status)] = self.counts.get(int(status), 0) + 1
+
+    def get_path(self, url_path: str):
+        """
+        Maps the path of a request to a file in the fixture directory
+        :param url_path: The path part of the requested URL
+        :return: The file's path, or None if it does not exist or is outside the fixture directory
+        """
+
+        path = os.path.realpath(os.path.join(self.root, unquote(url_path).lstrip('/')))
+
+        if os.path.commonpath([self.root, path]) != self.root or os.path.isfile(path) is not True:
+            return None
+
+        return path
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Answers a single request for a StandInServer"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_HEAD(self):
+        self.respond(send_body=False)
+
+    def do_GET(self):
+        self.respond(send_body=True)
+
+    def log_message(self, message_format, *args):
+        logger.info(f'{self.address_string()} - ' + message_format % args)
+
+    def send_status(self, status: int, headers=None, body=b'', send_body=True):
+        """
+        Sends a whole response
+        :param status: The HTTP status
+        :param headers: Extra headers to send. Default is None
+        :param body: The body. Default is empty
+        :param send_body: Whether to send the body or only its length, as for a HEAD request. Default is True
+        """
+
+        # Counted first, so a client that has its response can already see it in the counts
+        self.server.count(status)
+        self.send_response(status)
+
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        if send_body and len(body) > 0:
+            self.write_body(body)
+
+    def write_body(self, body: bytes):
+        """
+        Writes a response body, as slowly as the server is throttled to
+        :param body: The body
+        """
+
+        if self.server.bytes_per_second is None:
+            self.wfile.write(body)
+            return
+
+        chunk_size = max(self.server.bytes_per_second // slow_body_writes_per_second, 1)
+
+        for start in range(0, len(body), chunk_size):
+            self.wfile.write(body[start:start + chunk_size])
+            self.wfile.flush()
+            time.sleep(chunk_size / self.server.bytes_per_second)
+
+    def respond(self, send_body: bool):
+        """
+        Answers a GET or HEAD request
+        :param send_body: Whether to send the body, which is False for HEAD requests
+        """
+
+        time.sleep(self.server.get_delay())
+
+        if self.server.should_fail():
+            self.send_status(self.server.error_status, body=b'Injected error\n', send_body=send_body)
+            return
+
+        path = self.server.get_path(urlsplit(self.path).path)
+
+        if path is None:
+            self.send_status(HTTPStatus.NOT_FOUND, body=b'Not found\n', send_body=send_body)
+            return
+
+        stats = os.stat(path)
+        etag = f'"{stats.st_mtime_ns:x}-{stats.st_size:x}"'
+        last_modified = formatdate(stats.st_mtime, usegmt=True)
+        headers = {'ETag': etag, 'Last-Modified': last_modified, 'Accept-Ranges': 'bytes',
+                   'Content-Type': 'text/csv; charset=utf-8' if path.endswith('.csv') else 'application/octet-stream'}
+
+        if self.is_not_modified(etag, stats.st_mtime):
+            self.send_status(HTTPStatus.NOT_MODIFIED, headers={'ETag': etag, 'Last-Modified': last_modified},
+                             send_body=False)
+            return
+
+        with open(path, 'rb') as file:
+            body = file.read()
+
+        byte_range = self.get_range(len(body))
+
+        if byte_range is False:
+            self.send_status(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE,
+                             headers={'Content-Range': f'bytes */{len(body)}'}, send_body=send_body)
+            return
+
+        if byte_range is not None:
+            start, end = byte_range
+            headers['Content-Range'] = f'bytes {start}-{end}/{len(body)}'
+            self.send_status(HTTPStatus.PARTIAL_CONTENT, headers=headers, body=body[start:end + 1],
+                             send_body=send_body)
+            return
+
+        self.send_status(HTTPStatus.OK, headers=headers, body=body, send_body=send_body)
+
+    def is_not_modified(self, etag: str, modified_at: float) -> bool:
+        """
+        Checks the request's validators against the file. If-None-Match wins over If-Modified-Since when both are sent
+        :param etag: The file's current ETag
+        :param modified_at: When the file was last modified, in seconds since the epoch
+        :return: True if the client's copy is still current
+        """
+
+        if_none_match = self.headers.get('If-None-Match')
+
+        if if_none_match is not None:
+            return if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]
+
+        if_modified_since = self.headers.get('If-Modified-Since')
+
+        if if_modified_since is None:
+            return False
+
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+
+        return int(modified_at) <= since.timestamp()
+
+    def get_range(self, size: int):
+        """
+        Reads the byte range asked for in the request's Range header
+        :param size: The length of the whole file
+        :return: The first and last byte to send, None if the whole file should be sent, or False if the range does
+        not overlap the file
+        """
+
+        header = self.headers.get('Range')
+
+        if header is None:
+            return None
+
+        match = range_pattern.match(header.strip())
+
+        # Ranges the server does not understand are ignored, as the HTTP spec allows
+        if match is None or match.group(1) == match.group(2) == '':
+            return None
+
+        if match.group(1) == '':
+            # A suffix range, such as the last 500 bytes
+            start = max(size - int(match.group(2)), 0)
+            end = size - 1
+        else:
+            start = int(match.group(1))
+            end = min(int(match.group(2)), size - 1) if match.group(2) != '' else size - 1
+
+        if start >= size or start > end:
+            return False
+
+        return start, end
+
+
+def get_newest_report(root: str):
+    """
+    Finds the newest JHU daily report in a fixture directory
+    :param root: The fixture directory
+    :return: The report's file name, or None if there are none
+    """
+
+    report_path = os.path.join(root, 'csse_covid_19_daily_reports_us')
+    report_dates = []
+
+    if os.path.isdir(report_path) is not True:
+        return None
+
+    for file in os.listdir(report_path):
+        try:
+            report_dates.append(datetime.strptime(file, '%m-%d-%Y.csv'))
+        except ValueError:
+            continue
+
+    return max(report_dates).strftime('%m-%d-%Y.csv') if len(report_dates) > 0 else None
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Serves fixture copies of the JHU and COVID Tracking Project data over '
+                                                 'HTTP, so the tracker can run end to end without the internet')
+    parser.add_argument('directory', help='Fixture directory laid out the same as for coronatracker.py --fixtures')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on. Default is 127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000, help='Port to listen on. Default is 8000')
+    parser.add_argument('--generate', action='store_true',
+                        help='Write synthetic fixtures into the directory first if it has no daily report')
+    parser.add_argument('--days', type=int, default=400, help='Days covered by generated fixtures. Default is 400')
+    parser.add_argument('--counties', type=int, default=3300, help='County rows in generated fixtures. Default is 3300')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds to wait before each response. Default is 0')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='Most seconds to randomly add to the latency. Default is 0')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Chance from 0 to 1 of answering with an error instead. Default is 0')
+    parser.add_argument('--error-status', type=int, default=503, help='HTTP status of injected errors. Default is 503')
+    parser.add_argument('--bytes-per-second', type=int, default=None,
+                        help='Throttle response bodies to this speed. Default is unthrottled')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for the random latency, errors and fixtures')
+    options = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if options.generate and get_newest_report(options.directory) is None:
+        # Only needed when generating, since it pulls in numpy and pandas
+        import benchmark
+
+        logger.info(f'Writing synthetic fixtures to {options.directory}')
+        benchmark.write_fixtures(options.directory, days=options.days, counties=options.counties,
+                                 seed=options.seed if options.seed is not None else 0)
+
+    report_name = get_newest_report(options.directory)
+
+    if report_name is None:
+        print(f'{options.directory} has no daily report in csse_covid_19_daily_reports_us. Use --generate to write '
+              f'synthetic fixtures', file=sys.stderr)
+        return 1
+
+    server = StandInServer((options.host, options.port), options.directory, latency=options.latency,
+                           jitter=options.jitter, error_rate=options.error_rate, error_status=options.error_status,
+                           bytes_per_second=options.bytes_per_second, seed=options.seed)
+    base_url = f'http://{options.host}:{server.server_address[1]}/'
+
+    print(f'Serving {options.directory} at {base_url}. Point the tracker at it with:')
+    print(f'  python coronatracker.py --dry-run --jhu-url {base_url} --ctp-url {base_url}covidtracking/daily.csv '
+          f'--jhu-report {report_name}', flush=True)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+    print('Responses by status: ' + ', '.join(f'{status} x{count}' for status, count in sorted(server.counts.items())))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
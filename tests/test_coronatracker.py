@@ -0,0 +1,60 @@
+import os
+import tempfile
+import threading
+import unittest
+import urllib.error
+from unittest import mock
+
+import pandas as pd
+
+import coronatracker as ct
+import dataproccessor as dp
+from standinserver import StandInServer
+
+
+class CacheRetryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        root = os.path.join(self.directory.name, 'fixtures')
+        os.makedirs(os.path.join(root, 'covidtracking'))
+        pd.DataFrame({'date': [20200101, 20200102], 'positive': [1, 3]}).to_csv(
+            os.path.join(root, 'covidtracking', 'daily.csv'), index=False)
+
+        self.server = StandInServer(('127.0.0.1', 0), root, error_rate=1.0)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+        self.saved = (ct.tracking_project_url, ct.tracking_proj_path)
+        ct.tracking_project_url = f'http://127.0.0.1:{self.server.server_address[1]}/covidtracking/daily.csv'
+        ct.tracking_proj_path = os.path.join(self.directory.name, 'ctp_data') + '/'
+        ct.data_cache.invalidate()
+
+    def tearDown(self):
+        ct.tracking_project_url, ct.tracking_proj_path = self.saved
+        ct.data_cache.invalidate()
+        self.server.shutdown()
+        self.server.server_close()
+        self.directory.cleanup()
+
+    @mock.patch('fetcher.time.sleep')
+    def test_getter_retries_a_source_the_fetch_stage_missed(self, sleep):
+        with self.assertRaises(urllib.error.HTTPError):
+            dp.get_tracking_project_data()
+
+        # The stand-in sleeps through the same time module for its latency, which is 0 here
+        waits = [call.args[0] for call in sleep.call_args_list if call.args[0] > 0]
+
+        self.assertEqual(self.server.counts, {503: ct.fetch_attempts})
+        self.assertEqual(waits, [2.0, 4.0])
+
+        # Recovers on a later attempt without the error reaching the caller
+        self.server.counts.clear()
+        sleep.side_effect = lambda seconds: setattr(self.server, 'error_rate', 0.0) if seconds > 0 else None
+
+        self.assertEqual(dp.get_tracking_project_data()['positive'].to_list(), [1, 3])
+        self.assertEqual(self.server.counts, {503: 1, 200: 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import tempfile
+import threading
+import unittest
+
+import pandas as pd
+
+import fetcher
+from standinserver import StandInServer
+
+
+class ConditionalFetchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.directory.name, 'fixtures')
+        self.source_path = os.path.join(self.root, 'covidtracking', 'daily.csv')
+        self.file_path = os.path.join(self.directory.name, 'historical_data.csv')
+        os.makedirs(os.path.dirname(self.source_path))
+        self.write_source(pd.DataFrame({'date': [20200101, 20200102], 'positive': [1, 3]}), modified_at=1600000000)
+
+        self.server = StandInServer(('127.0.0.1', 0), self.root)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/covidtracking/daily.csv'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.directory.cleanup()
+
+    def write_source(self, frame: pd.DataFrame, modified_at: int):
+        frame.to_csv(self.source_path, index=False)
+        # The stand-in's validators come from the modification time, so each version gets its own
+        os.utime(self.source_path, (modified_at, modified_at))
+
+    def fetch(self) -> pd.DataFrame:
+        return fetcher.fetch_frame(self.url, self.file_path)
+
+    def test_downloads_then_reuses_then_downloads_changes(self):
+        first = self.fetch()
+        validators = fetcher.load_validators(self.file_path)
+
+        self.assertEqual(first['positive'].to_list(), [1, 3])
+        self.assertEqual(self.server.counts, {200: 1})
+        self.assertEqual(validators['url'], self.url)
+        self.assertIsNotNone(validators['etag'])
+        self.assertIsNotNone(validators['last_modified'])
+
+        second = self.fetch()
+
+        self.assertEqual(self.server.counts, {200: 1, 304: 1})
+        pd.testing.assert_frame_equal(second, first)
+
+        self.write_source(pd.DataFrame({'date': [20200101, 20200102, 20200103], 'positive': [1, 3, 7]}),
+                          modified_at=1600086400)
+        third = self.fetch()
+
+        self.assertEqual(self.server.counts, {200: 2, 304: 1})
+        self.assertEqual(third['positive'].to_list(), [1, 3, 7])
+        self.assertNotEqual(fetcher.load_validators(self.file_path)['etag'], validators['etag'])
+
+    def test_downloads_again_without_saved_validators(self):
+        self.fetch()
+        os.remove(fetcher.get_meta_path(self.file_path))
+
+        self.assertEqual(fetcher.load_validators(self.file_path), {})
+        self.assertEqual(self.fetch()['positive'].to_list(), [1, 3])
+        self.assertEqual(self.server.counts, {200: 2})
+        self.assertIn('etag', fetcher.load_validators(self.file_path))
+
+    def test_downloads_again_with_unreadable_validators(self):
+        self.fetch()
+
+        with open(fetcher.get_meta_path(self.file_path), 'w') as file:
+            file.write('{not json')
+
+        self.assertEqual(fetcher.load_validators(self.file_path), {})
+        self.fetch()
+        self.assertEqual(self.server.counts, {200: 2})
+
+    def test_downloads_again_without_saved_copy(self):
+        self.fetch()
+        os.remove(self.file_path)
+
+        # The validators are still there, but sending them would get a 304 with nothing to read
+        self.assertEqual(self.fetch()['positive'].to_list(), [1, 3])
+        self.assertEqual(self.server.counts, {200: 2})
+
+    def test_ignores_validators_saved_for_another_url(self):
+        self.fetch()
+        result = fetcher.FetchResult(url=self.url + '?other', etag='"other"', last_modified=None)
+        fetcher.save_validators(self.file_path, result)
+
+        self.fetch()
+        self.assertEqual(self.server.counts, {200: 2})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import os
+import json
+import time
+import tempfile
+import unittest
+
+import coronatracker as ct
+import mediauploader
+import metrics
+from mediauploader import StubAPI
+
+
+class UploadMediaTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.directory.name, 'media_cache.json')
+        self.files = []
+
+        # Every file needs different content, since the cache is keyed by what is in the file
+        for index in range(3):
+            file_path = os.path.join(self.directory.name, f'plot_{index}.png')
+
+            with open(file_path, 'wb') as file:
+                file.write(f'plot {index}'.encode())
+
+            self.files.append(file_path)
+
+        metrics.reset()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_retries_failed_uploads(self):
+        api = StubAPI(failures=2)
+        results = mediauploader.upload_media(api, self.files[:1], attempts=3, backoff=0)
+
+        self.assertIsNotNone(results[0].media_id)
+        self.assertIsNone(results[0].error)
+        self.assertEqual(api.uploads, self.files[:1])
+
+    def test_drops_uploads_that_keep_failing(self):
+        api = StubAPI(failures=10)
+        results = mediauploader.upload_media(api, self.files[:1], attempts=2, backoff=0, cache_path=self.cache_path)
+
+        self.assertIsNone(results[0].media_id)
+        self.assertIsInstance(results[0].error, ConnectionError)
+        self.assertEqual(api.failures, 8)
+
+        with open(self.cache_path, 'r') as file:
+            self.assertEqual(json.load(file), {})
+
+    def test_post_tweet_leaves_out_failed_uploads(self):
+        api = StubAPI(failures=1)
+        thread = [{'status': 'first', 'media': self.files[:2]}, {'status': 'second', 'media': self.files[2:]}]
+        settings = (ct.upload_workers, ct.upload_attempts, ct.media_cache_path)
+        ct.upload_workers, ct.upload_attempts, ct.media_cache_path = 1, 1, self.cache_path
+
+        try:
+            ct.post_tweet(thread, api)
+        finally:
+            ct.upload_workers, ct.upload_attempts, ct.media_cache_path = settings
+
+        # With one worker the first file takes the only failure and is left out of its tweet
+        self.assertEqual(api.statuses, [{'status': 'first', 'media_ids': [1], 'in_reply_to_status_id': None},
+                                        {'status': 'second', 'media_ids': [2], 'in_reply_to_status_id': 1}])
+
+    def test_reuses_cached_media_ids_until_they_expire(self):
+        api = StubAPI()
+        first = mediauploader.upload_media(api, self.files, backoff=0, cache_path=self.cache_path)
+        second = mediauploader.upload_media(api, self.files, backoff=0, cache_path=self.cache_path)
+
+        self.assertEqual([result.media_id for result in second], [result.media_id for result in first])
+        self.assertTrue(all(result.cached for result in second))
+        self.assertEqual(len(api.uploads), 3)
+
+        with open(self.cache_path, 'r') as file:
+            cache = json.load(file)
+
+        # Ages the cache to just past 20 hours
+        for entry in cache.values():
+            entry['uploaded_at'] = time.time() - mediauploader.media_validity - 1
+
+        mediauploader.save_media_cache(self.cache_path, cache)
+        third = mediauploader.upload_media(api, self.files, backoff=0, cache_path=self.cache_path)
+
+        self.assertFalse(any(result.cached for result in third))
+        self.assertEqual(len(api.uploads), 6)
+
+    def test_records_latency_of_each_upload(self):
+        api = StubAPI(latency=0.05)
+        results = mediauploader.upload_media(api, self.files, workers=3, backoff=0, cache_path=self.cache_path)
+
+        for result in results:
+            self.assertGreaterEqual(result.latency, 0.05)
+
+        self.assertEqual(metrics.get_stats()['media_upload']['calls'], 3)
+
+        cached = mediauploader.upload_media(api, self.files, workers=3, backoff=0, cache_path=self.cache_path)
+
+        self.assertEqual([result.latency for result in cached], [0.0, 0.0, 0.0])
+        # Cached files are not uploads, so they are not timed as one
+        self.assertEqual(metrics.get_stats()['media_upload']['calls'], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,225 @@
+import os
+import tempfile
+import unittest
+
+import matplotlib
+
+matplotlib.use('Agg')
+
+import matplotlib.image as mpimg
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import seaborn as sns
+
+import plotrender
+
+
+# The drawing code of each plot as it was before plotrender, with pyplot's global figure, fed the same inputs
+
+
+def draw_summary_bar(inputs: dict, file_path: str):
+    for jhu_tick in plt.xticks()[1]:
+        jhu_tick.set_rotation(45)
+
+    plt.suptitle('COVID-19 Details for the United States')
+
+    pos = np.arange(len(inputs['states']))
+    width = 0.9
+
+    plt.gcf().set_size_inches(14, 14)
+
+    case_bar = plt.bar(pos, inputs['cases'], width, label='Cases')
+    death_bar = plt.bar(pos, inputs['deaths'], width, label='Deaths')
+    recov_bar = plt.bar(pos, inputs['recoveries'], width, bottom=inputs['deaths'], label='Recoveries')
+
+    plt.xlabel('State')
+    plt.ylabel('Count')
+    plt.title(f'Confirmed COVID-19 Case Statistics for the Top 25 States by Caseload')
+    plt.xticks(pos, inputs['states'], fontsize=10)
+    plt.legend((case_bar[0], death_bar[0], recov_bar[0]), ('Cases', 'Deaths', 'Recoveries'), loc='upper right')
+    plt.savefig(file_path)
+
+
+def draw_time_series(inputs: dict, file_path: str):
+    freqs = inputs['freqs']
+    days = len(freqs)
+    fig, (reg_ax, log_ax) = plt.subplots(1, 2)
+
+    fig.set_size_inches(12, 10)
+    fig.suptitle('Cumulative Cases per Day in the United States (Standard Scale and Natural Log)')
+
+    reg_ax.plot(np.arange(start=1, stop=days + 1), freqs, color='red')
+    reg_ax.set_xlabel('Days Since 01/21/2020')
+    reg_ax.set_ylabel('Number of cases')
+
+    log_ax.plot(np.arange(start=1, stop=days + 1), [np.log(freq) for freq in freqs], color='red')
+    log_ax.set_xlabel('Days Since 01/21/2020')
+    log_ax.set_ylabel('Number of cases (Natural Log Scale)')
+
+    plt.savefig(file_path)
+
+
+def draw_daily_change(inputs: dict, file_path: str):
+    changes = inputs['changes']
+
+    plt.plot(np.arange(1, stop=len(changes) + 1), changes, color='red')
+
+    plt.title('Daily Change in Cases Since 01/22/2020')
+    plt.gcf().set_size_inches(12, 12)
+    plt.xlabel('Days since 01/22/2020')
+    plt.ylabel('Change in Cases from Previous Day')
+
+    plt.savefig(file_path)
+
+
+def draw_comparison(inputs: dict, file_path: str):
+    change_dict = {country: change for country, change in zip(inputs['countries'], inputs['cumulative_cases'])}
+    days = np.arange(start=0, stop=len(change_dict['US'])).tolist() * 8
+    change_frame = pd.DataFrame(change_dict).melt(var_name='country', value_name='cases')
+    change_frame['day'] = days
+
+    sns.lineplot(x='day', y='cases', hue='country', data=change_frame)
+
+    plt.title('Cumulative Cases in the Top 10 Countries by Cases Globally')
+    plt.gcf().set_size_inches(12, 12)
+    plt.xlabel('Days since 01/22/2020')
+    plt.ylabel('Cumulative Cases')
+
+    plt.savefig(file_path)
+
+
+def draw_state_deaths(inputs: dict, file_path: str):
+    states = inputs['states']
+    days = len(inputs['counts'][0])
+    new_states = []
+    state_counts = []
+
+    for state, counts in zip(states, inputs['counts']):
+        new_states += [state] * days
+        state_counts += [int(count) for count in counts]
+
+    day_num = [num for num in range(days)] * 10
+    plot_frame = pd.DataFrame({'state': new_states, 'counts': state_counts, 'day_num': day_num})
+
+    sns.lineplot(x='day_num', y='counts', hue='state', data=plot_frame)
+
+    plt.title(f'Daily Death Totals for the Top 10 U.S States by Death Total On {inputs["date"]}')
+    plt.xlabel('Days Since 01/22/2020')
+    plt.ylabel('Deaths')
+    plt.gcf().set_size_inches(12, 12)
+
+    plt.savefig(file_path)
+
+
+def draw_per_capita(inputs: dict, file_path: str):
+    plt.gcf().set_size_inches(10, 10)
+    plt.title(f'Top 5 States by Deaths per 100,000 Population on {inputs["date"]}')
+    plt.xlabel('State')
+    plt.ylabel('Deaths per 100,000 Population')
+    plt.bar(x=inputs['states'], height=inputs['rates'])
+
+    plt.savefig(file_path)
+
+
+def draw_testing(inputs: dict, file_path: str):
+    plt.title(f'Top 5 States by Testing Rate and Their Incidence On {inputs["date"]}')
+    plt.xlabel('State')
+    plt.ylabel('Measure Per 100,000 Population')
+
+    test_bar = plt.bar(x=inputs['states'], height=inputs['tests'], color='#ffcc00')
+    inc_bar = plt.bar(x=inputs['states'], height=inputs['incidence'], color='red')
+
+    plt.gcf().set_size_inches(10, 10)
+    plt.legend((test_bar[0], inc_bar[0]), ('Tests', 'Incidence'), loc='best')
+
+    plt.savefig(file_path)
+
+
+def draw_vent_icu(inputs: dict, file_path: str):
+    counts = list(inputs['icu']) + list(inputs['ventilator'])
+    count_type = ['ICU'] * len(inputs['icu']) + ['Ventilator'] * len(inputs['ventilator'])
+    days = np.arange(0, len(inputs['icu'])).tolist() * 2
+    plot_frame = pd.DataFrame({'day': days, 'counts': counts, 'count_type': count_type})
+
+    sns.lineplot(x='day', y='counts', hue='count_type', data=plot_frame)
+
+    plt.title('Ventilator and ICU Usage for the U.S Since 03/26/2020')
+    plt.xlabel('Days Since 03/26/2020')
+    plt.ylabel('Count')
+
+    plt.gcf().set_size_inches(10, 10)
+    plt.savefig(file_path)
+
+
+reference_drawers = {'state_sum': draw_summary_bar, 'rate_plot': draw_time_series, 'change_plot': draw_daily_change,
+                     'comp_plot': draw_comparison, 'death_comp_plot': draw_state_deaths,
+                     'capita_plot': draw_per_capita, 'capita_rate': draw_testing, 'vent_icu_plot': draw_vent_icu}
+
+
+def make_inputs() -> dict:
+    """Builds inputs for every plot, shaped like the ones dataproccessor.get_plot_inputs makes"""
+
+    rng = np.random.default_rng(0)
+    days = 90
+    growth = np.cumsum(rng.integers(1, 500, size=(8, days)), axis=1)
+    states = [f'State {index:02d}' for index in range(26)]
+    cases = sorted(rng.integers(10000, 400000, size=26).tolist(), reverse=True)
+
+    return {'state_sum': {'states': states, 'cases': cases, 'deaths': [case // 20 for case in cases],
+                          'recoveries': [case // 4 for case in cases]},
+            'rate_plot': {'freqs': growth[0].tolist()},
+            'change_plot': {'changes': np.diff(growth[0]).tolist()},
+            'comp_plot': {'countries': ['US'] + [f'Country {index}' for index in range(7)],
+                          'cumulative_cases': growth.tolist()},
+            'death_comp_plot': {'states': states[:10], 'counts': np.cumsum(rng.integers(0, 50, size=(10, days)),
+                                                                            axis=1).tolist(), 'date': '05/20/20'},
+            'capita_plot': {'states': states[:5], 'rates': [80.5, 61.2, 44.0, 30.1, 12.9], 'date': '05/20/20'},
+            'capita_rate': {'states': states[:5], 'tests': [9000.0, 7000.5, 5100.0, 4000.0, 3500.0],
+                            'incidence': [1200.0, 900.0, 640.5, 300.0, 250.0], 'date': '05/20/20'},
+            'vent_icu_plot': {'icu': rng.integers(1000, 15000, size=days).tolist(),
+                              'ventilator': rng.integers(500, 7000, size=days).tolist()}}
+
+
+class RenderPlotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        plt.close('all')
+        self.directory.cleanup()
+
+    def render_reference(self, name: str, inputs: dict, file_path: str):
+        # Drawn from the same starting style render_plot uses, since the old code let styles leak between plots
+        with matplotlib.rc_context():
+            matplotlib.rcdefaults()
+
+            if name in plotrender.seaborn_plots:
+                sns.set_theme()
+
+            reference_drawers[name](inputs, file_path)
+            plt.close('all')
+
+    def test_every_plot_matches_the_pyplot_rendering(self):
+        jobs = make_inputs()
+
+        self.assertEqual(set(jobs), set(plotrender.renderers))
+
+        for name, inputs in jobs.items():
+            with self.subTest(plot=name):
+                reference_path = os.path.join(self.directory.name, name + '_reference.png')
+                rendered_path = os.path.join(self.directory.name, name + '.png')
+
+                self.render_reference(name, inputs, reference_path)
+                plotrender.render_plot(name, inputs, rendered_path)
+
+                reference = mpimg.imread(reference_path)
+                rendered = mpimg.imread(rendered_path)
+
+                self.assertEqual(rendered.shape, reference.shape)
+                self.assertTrue(np.array_equal(rendered, reference), f'{name} differs from the pyplot rendering')
+
+
+if __name__ == '__main__':
+    unittest.main()
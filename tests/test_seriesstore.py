@@ -0,0 +1,193 @@
+import os
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import seriesstore
+
+
+def make_frame(days: int, regions=('Alpha', 'Beta', 'Gamma'), seed=0) -> pd.DataFrame:
+    """Builds a small time series shaped like JHU's U.S sheets, with text codes that look like numbers"""
+
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame({'FIPS': [f'{index + 1:05d}' for index in range(len(regions))],
+                          'Province_State': list(regions), 'Population': rng.integers(1000, 100000, len(regions))})
+    counts = np.cumsum(rng.integers(0, 100, size=(len(regions), days)), axis=1)
+
+    for day in range(days):
+        frame[f'{1 + day // 28}/{1 + day % 28}/20'] = counts[:, day]
+
+    return frame
+
+
+def recompute(frame: pd.DataFrame) -> (list, list):
+    """Works out the totals and daily changes of a series from scratch"""
+
+    totals = frame[seriesstore.get_date_columns(frame)].sum(axis=0).to_numpy(dtype=np.int64)
+
+    return totals.tolist(), np.diff(totals, prepend=0).tolist()
+
+
+class SeriesStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store_path = os.path.join(self.directory.name, 'jhu_time.json')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def assert_store_holds(self, frame: pd.DataFrame):
+        header = seriesstore.load_header(self.store_path)
+        totals, changes = recompute(frame)
+
+        self.assertEqual(header['totals'], totals)
+        self.assertEqual(header['changes'], changes)
+        self.assertEqual([total.tolist() for total in seriesstore.load_totals(self.store_path)], [totals, changes])
+        pd.testing.assert_frame_equal(seriesstore.load_series(self.store_path), frame, check_dtype=False)
+
+    def test_appends_a_new_day(self):
+        frame = make_frame(40)
+        seriesstore.save_series(frame.iloc[:, :-1], self.store_path)
+        version = seriesstore.load_header(self.store_path)['version']
+
+        seriesstore.save_series(frame, self.store_path)
+
+        self.assert_store_holds(frame)
+        # Only appended, so the same data files are still in use
+        self.assertEqual(seriesstore.load_header(self.store_path)['version'], version)
+
+    def test_rewrites_a_revised_last_day(self):
+        frame = make_frame(40)
+        seriesstore.save_series(frame, self.store_path)
+        checksums = seriesstore.load_header(self.store_path)['checksums']
+
+        revised = frame.copy()
+        revised[revised.columns[-1]] += [5, 0, 12]
+        seriesstore.save_series(revised, self.store_path)
+        header = seriesstore.load_header(self.store_path)
+
+        self.assert_store_holds(revised)
+        self.assertEqual(header['checksums'][:-1], checksums[:-1])
+        self.assertNotEqual(header['checksums'][-1], checksums[-1])
+
+    def test_revises_a_day_and_appends_the_next(self):
+        frame = make_frame(41)
+        seriesstore.save_series(frame.iloc[:, :-1], self.store_path)
+
+        revised = frame.copy()
+        revised[revised.columns[-2]] += [1, 2, 3]
+        seriesstore.save_series(revised, self.store_path)
+
+        self.assert_store_holds(revised)
+
+    def test_rewrites_the_store_when_the_regions_change(self):
+        seriesstore.save_series(make_frame(40), self.store_path)
+
+        frame = make_frame(41, regions=('Alpha', 'Beta', 'Gamma', 'Delta'), seed=1)
+        seriesstore.save_series(frame, self.store_path)
+
+        self.assertEqual(seriesstore.load_header(self.store_path)['regions'], 4)
+        self.assert_store_holds(frame)
+
+    def test_region_columns_keep_their_types(self):
+        frame = make_frame(5)
+        frame.loc[1, 'Province_State'] = np.nan
+        seriesstore.save_series(frame, self.store_path)
+        loaded = seriesstore.load_series(self.store_path)
+
+        self.assertEqual(loaded['FIPS'].to_list(), ['00001', '00002', '00003'])
+        self.assertTrue(pd.isna(loaded.loc[1, 'Province_State']))
+        self.assertEqual(loaded['Population'].dtype, np.int64)
+
+
+def make_generation(generation: int) -> pd.DataFrame:
+    """
+    Builds the version of a series a writer saves as its generation'th write. Every count is the generation, and the
+    number of regions follows from it, so a reader can tell whether the data it got is consistent with itself. Each
+    pair of generations has the same regions, so the second revises every day of the first
+    """
+
+    regions = 2 + (generation // 2) % 3
+    frame = pd.DataFrame({'Province_State': [f'Region {index}' for index in range(regions)]})
+
+    for day in range(5):
+        frame[f'1/{day + 1}/20'] = generation
+
+    return frame
+
+
+class StoreSwapTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store_path = os.path.join(self.directory.name, 'jhu_time.json')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_readers_always_see_matching_data(self):
+        seriesstore.save_series(make_generation(0), self.store_path)
+        done = threading.Event()
+        problems = []
+        reads = []
+
+        def read():
+            while done.is_set() is not True:
+                try:
+                    frame = seriesstore.load_series(self.store_path)
+                except Exception as error:
+                    problems.append(repr(error))
+
+                    continue
+
+                values = np.unique(frame[seriesstore.get_date_columns(frame)].to_numpy())
+
+                if len(values) != 1 or len(frame) != len(make_generation(int(values[0]))):
+                    problems.append(f'Read {len(frame)} regions holding {values.tolist()}')
+
+                reads.append(int(values[0]))
+
+        readers = [threading.Thread(target=read) for _ in range(3)]
+
+        for reader in readers:
+            reader.start()
+
+        try:
+            for generation in range(1, 300):
+                seriesstore.save_series(make_generation(generation), self.store_path)
+        finally:
+            done.set()
+
+            for reader in readers:
+                reader.join()
+
+        self.assertEqual(problems, [])
+        # The readers should have seen the store change under them, or the test proves nothing
+        self.assertGreater(len(set(reads)), 10)
+
+    def test_open_readers_keep_their_version(self):
+        seriesstore.save_series(make_generation(0), self.store_path)
+        _, _, counts = seriesstore.load_matrix(self.store_path)
+
+        for generation in range(1, 6):
+            seriesstore.save_series(make_generation(generation), self.store_path)
+
+        self.assertTrue(np.all(np.asarray(counts) == 0))
+        self.assertTrue(np.all(seriesstore.load_matrix(self.store_path)[2] == 5))
+
+    def test_removes_old_versions(self):
+        for generation in range(6):
+            seriesstore.save_series(make_generation(generation), self.store_path)
+
+        header = seriesstore.load_header(self.store_path)
+        expected = sorted([os.path.basename(self.store_path), header['regions_file'], header['counts_file']])
+
+        self.assertEqual(sorted(os.listdir(self.directory.name)), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
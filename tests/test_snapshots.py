@@ -0,0 +1,133 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import snapshots
+
+
+def make_reports(count: int, seed=0) -> [pd.DataFrame]:
+    """
+    Builds a run of JHU snapshots the way they change between fetches. Counts grow, some states stay the same, one is
+    revised down, and states come and go, so every kind of delta record is written
+    """
+
+    rng = np.random.default_rng(seed)
+    states = [f'State {index}' for index in range(8)]
+    counts = {state: rng.integers(0, 1000, size=3) for state in states}
+    reports = []
+
+    for number in range(count):
+        for state in states:
+            if rng.random() < 0.7:
+                counts[state] = counts[state] + rng.integers(0, 50, size=3)
+
+        counts[states[number % len(states)]] = np.maximum(counts[states[number % len(states)]] - 7, 0)
+        shown = [state for index, state in enumerate(states) if (index + number) % 5 != 0]
+        rows = [[state, *counts[state].tolist(), 'US'] for state in shown]
+        reports.append(pd.DataFrame(rows, columns=['state', 'cases', 'deaths', 'recoveries', 'country'])
+                       .sample(frac=1, random_state=number))
+
+    return reports
+
+
+class SnapshotHistoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.index_path = os.path.join(self.directory.name, 'snapshots.sqlite')
+        self.start = datetime(2020, 5, 1, 12)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def save_reports(self, reports: [pd.DataFrame], chunk_size: int) -> [str]:
+        return [snapshots.save_snapshot(report, 'jhu', self.directory.name, self.index_path,
+                                        self.start + timedelta(hours=number), chunk_size=chunk_size)
+                for number, report in enumerate(reports)]
+
+    def assert_loads_as(self, path: str, report: pd.DataFrame):
+        expected = snapshots.normalize_snapshot(report, 'jhu').reset_index()
+
+        pd.testing.assert_frame_equal(snapshots.load_snapshot(path, 'jhu'), expected)
+
+    def test_replaying_deltas_rebuilds_every_snapshot(self):
+        reports = make_reports(11)
+        paths = self.save_reports(reports, chunk_size=4)
+        chunks = sorted({snapshots.split_snapshot_path(path)[0] for path in paths})
+
+        self.assertEqual(len(chunks), 3)
+
+        for path, report in zip(paths, reports):
+            with self.subTest(path=os.path.basename(path)):
+                self.assert_loads_as(path, report)
+
+        for entry, report in zip(snapshots.list_snapshots(self.index_path, 'jhu'), reports):
+            self.assertEqual(entry.content_hash, snapshots.get_snapshot_hash(report, 'jhu'))
+            self.assertEqual(snapshots.get_snapshot_hash(snapshots.load_snapshot(entry.path, 'jhu'), 'jhu'),
+                             entry.content_hash)
+
+    def test_each_chunk_starts_with_a_keyframe(self):
+        self.save_reports(make_reports(11), chunk_size=4)
+
+        for chunk in os.listdir(self.directory.name):
+            if chunk.endswith('.jsonl.gz') is not True:
+                continue
+
+            records = snapshots.read_chunk(os.path.join(self.directory.name, chunk))
+
+            self.assertTrue(records[0]['keyframe'])
+            self.assertEqual([record['keyframe'] for record in records[1:]], [False] * (len(records) - 1))
+
+    def test_deltas_only_hold_what_changed(self):
+        report = make_reports(1)[0]
+        first, second = self.save_reports([report, report.copy()], chunk_size=4)
+        chunk_path, _ = snapshots.split_snapshot_path(second)
+
+        self.assertEqual(snapshots.read_chunk(chunk_path)[1]['counts'], {})
+        self.assertEqual(snapshots.read_chunk(chunk_path)[1]['removed'], [])
+        self.assert_loads_as(second, report)
+
+    def test_pruning_keeps_the_keyframes_of_retained_deltas(self):
+        reports = make_reports(11)
+        paths = self.save_reports(reports, chunk_size=4)
+
+        # Falls in the middle of the second chunk, so its keyframe is older than the cutoff but a delta after it is not
+        removed = snapshots.prune_snapshots(self.index_path, 'jhu', self.start + timedelta(hours=5, minutes=30))
+        remaining = snapshots.list_snapshots(self.index_path, 'jhu')
+
+        self.assertEqual(removed, 4)
+        self.assertEqual([entry.path for entry in remaining], paths[4:])
+
+        for entry, report in zip(remaining, reports[4:]):
+            with self.subTest(path=os.path.basename(entry.path)):
+                chunk_path, position = snapshots.split_snapshot_path(entry.path)
+                records = snapshots.read_chunk(chunk_path)
+
+                self.assertTrue(records[0]['keyframe'])
+                self.assertGreater(len(records), position)
+                self.assert_loads_as(entry.path, report)
+
+    def test_pruning_keeps_the_latest_chunk(self):
+        reports = make_reports(6)
+        paths = self.save_reports(reports, chunk_size=4)
+
+        snapshots.prune_snapshots(self.index_path, 'jhu', self.start + timedelta(days=30))
+
+        self.assertEqual([entry.path for entry in snapshots.list_snapshots(self.index_path, 'jhu')], paths[4:])
+        self.assert_loads_as(paths[-1], reports[-1])
+
+        # The next snapshot still goes on as a delta of the chunk that was kept
+        later = make_reports(7)[-1]
+        path = snapshots.save_snapshot(later, 'jhu', self.directory.name, self.index_path,
+                                       self.start + timedelta(hours=6), chunk_size=4)
+
+        self.assertEqual(path, snapshots.split_snapshot_path(paths[-1])[0] + '#2')
+        self.assert_loads_as(path, later)
+
+
+if __name__ == '__main__':
+    unittest.main()